@@ -1,8 +1,9 @@
 from fastapi import FastAPI, HTTPException, Response
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel, Field
-from transformers import pipeline
+import asyncio
 import logging
+import os
 from typing import Optional
 
 # Configure logging
@@ -25,13 +26,31 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Initialize the summarization pipeline
-try:
-    summarizer = pipeline("summarization", model="sshleifer/distilbart-cnn-12-6")
-    logger.info("Summarization model loaded successfully")
-except Exception as e:
-    logger.error(f"Failed to load model: {e}")
-    summarizer = None
+# The summarization pipeline is built at startup rather than at import
+summarizer = None
+summarizer_loading = None
+
+def load_summarizer():
+    """Build the summarization pipeline; transformers (and torch) are only imported here"""
+    global summarizer
+    try:
+        from transformers import pipeline
+
+        summarizer = pipeline("summarization", model="sshleifer/distilbart-cnn-12-6")
+        logger.info("Summarization model loaded successfully")
+    except Exception as e:
+        logger.error(f"Failed to load model: {e}")
+        summarizer = None
+
+@app.on_event("startup")
+async def startup():
+    """Load the model, or start loading it in the background with MODEL_LOAD=background"""
+    global summarizer_loading
+    if os.getenv("MODEL_LOAD", "startup") == "background":
+        # /health answers "loading" until the pipeline is ready
+        summarizer_loading = asyncio.get_running_loop().run_in_executor(None, load_summarizer)
+    else:
+        load_summarizer()
 
 # Pydantic models
 class TextInput(BaseModel):
@@ -69,9 +88,14 @@ async def root():
 @app.get("/health")
 async def health_check():
     """Health check endpoint"""
-    model_status = "healthy" if summarizer is not None else "unhealthy"
+    if summarizer is not None:
+        model_status = "healthy"
+    elif summarizer_loading is not None and not summarizer_loading.done():
+        model_status = "loading"
+    else:
+        model_status = "unhealthy"
     return {
-        "status": "healthy" if summarizer is not None else "unhealthy",
+        "status": model_status,
         "model_status": model_status
     }
 
@@ -0,0 +1,167 @@
+"""
+Cold-start benchmark for the ML and summarizer services.
+
+For each service this measures, over several fresh processes:
+
+- import time of the service module, from `python -X importtime`, with the
+  slowest top-level imports listed
+- time from launching uvicorn until /health first answers, and until it
+  reports the model loaded
+
+Run it with the interpreter of the service's environment:
+
+    python benchmarks/cold_start.py --service ml --runs 5
+    python benchmarks/cold_start.py --service ml --env MODEL_LOAD=background --json cold_start.json
+"""
+
+import argparse
+import json
+import os
+import re
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+from typing import Dict, List, Optional
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SERVICES = {
+    'ml': {'cwd': os.path.join(ROOT, 'ml'), 'module': 'app'},
+    'summarizer': {'cwd': os.path.join(ROOT, 'Summerizer-model'), 'module': 'main'},
+}
+
+_IMPORT_LINE = re.compile(r'import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)')
+
+def import_times(python: str, service: Dict, env: Dict[str, str], top: int = 10) -> Dict:
+    """Total import time of the service module and its slowest direct imports (cumulative, ms)."""
+    result = subprocess.run(
+        [python, '-X', 'importtime', '-c', f"import {service['module']}"],
+        cwd=service['cwd'], env=env, capture_output=True, text=True, timeout=300,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"Importing {service['module']} failed:\n{result.stderr[-2000:]}")
+
+    entries = []
+    for line in result.stderr.splitlines():
+        match = _IMPORT_LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            entries.append((len(indent), name, int(self_us), int(cumulative_us)))
+    total = next((cumulative for _, name, _, cumulative in entries if name == service['module']), None)
+    # Direct imports of the service module, plus everything imported before it (interpreter start-up)
+    direct = [(name, cumulative) for depth, name, _, cumulative in entries if depth <= 3 and name != service['module']]
+    direct.sort(key=lambda item: item[1], reverse=True)
+    return {
+        'total_ms': None if total is None else total / 1000,
+        'top': [{'module': name, 'cumulative_ms': cumulative / 1000} for name, cumulative in direct[:top]],
+    }
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def _get_json(url: str) -> Optional[Dict]:
+    try:
+        with urllib.request.urlopen(url, timeout=1) as response:
+            return json.loads(response.read())
+    except urllib.error.HTTPError as e:
+        return {'status': f"http {e.code}"}
+    except (urllib.error.URLError, ConnectionError, socket.timeout):
+        return None
+
+def time_to_response(python: str, service: Dict, env: Dict[str, str], timeout: float) -> Dict:
+    """Seconds from launching uvicorn until /health first answers and until it reports healthy."""
+    port = _free_port()
+    url = f"http://127.0.0.1:{port}/health"
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        [python, '-m', 'uvicorn', f"{service['module']}:app", '--port', str(port), '--log-level', 'warning'],
+        cwd=service['cwd'], env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    first_response = healthy = None
+    try:
+        while time.perf_counter() - started < timeout and process.poll() is None:
+            body = _get_json(url)
+            if body is not None:
+                now = time.perf_counter() - started
+                if first_response is None:
+                    first_response = now
+                if body.get('status') == 'healthy':
+                    healthy = now
+                    break
+                if body.get('status') == 'unhealthy':
+                    break
+            time.sleep(0.01)
+    finally:
+        process.terminate()
+        try:
+            process.wait(10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+    return {'first_response_s': first_response, 'healthy_s': healthy}
+
+def _median(values: List[Optional[float]]) -> Optional[float]:
+    values = [v for v in values if v is not None]
+    return statistics.median(values) if values else None
+
+def benchmark(name: str, python: str, env: Dict[str, str], runs: int, timeout: float) -> Dict:
+    service = SERVICES[name]
+    imports = [import_times(python, service, env) for _ in range(runs)]
+    responses = [time_to_response(python, service, env, timeout) for _ in range(runs)]
+    return {
+        'service': name,
+        'runs': runs,
+        'import_ms': _median([run['total_ms'] for run in imports]),
+        'top_imports': imports[-1]['top'],
+        'first_response_s': _median([run['first_response_s'] for run in responses]),
+        'healthy_s': _median([run['healthy_s'] for run in responses]),
+        'env': {key: value for key, value in env.items() if key not in os.environ or os.environ[key] != value},
+    }
+
+def _format(value: Optional[float], unit: str) -> str:
+    return 'n/a' if value is None else f"{value:.{0 if unit == 'ms' else 2}f}{unit}"
+
+def print_report(result: Dict):
+    print(f"\n{result['service']} ({result['runs']} runs, median)")
+    print(f"  import:             {_format(result['import_ms'], 'ms')}")
+    print(f"  /health answers:    {_format(result['first_response_s'], 's')}")
+    print(f"  /health healthy:    {_format(result['healthy_s'], 's')}")
+    print("  slowest imports:")
+    for entry in result['top_imports']:
+        print(f"    {entry['cumulative_ms']:>9.1f}ms  {entry['module']}")
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure import time and time to first response of the services.')
+    parser.add_argument('--service', choices=sorted(SERVICES) + ['all'], default='ml')
+    parser.add_argument('--python', default=sys.executable, help="Interpreter of the service's environment")
+    parser.add_argument('--runs', type=int, default=3)
+    parser.add_argument('--timeout', type=float, default=300, help='Seconds to wait for a service to become healthy')
+    parser.add_argument('--env', action='append', default=[], metavar='KEY=VALUE',
+                        help='Extra environment for the service, e.g. MODEL_LOAD=background')
+    parser.add_argument('--json', metavar='PATH', help='Also write the results to this file')
+    args = parser.parse_args()
+
+    env = dict(os.environ)
+    for item in args.env:
+        key, _, value = item.partition('=')
+        env[key] = value
+
+    names = sorted(SERVICES) if args.service == 'all' else [args.service]
+    results = []
+    for name in names:
+        result = benchmark(name, args.python, env, args.runs, args.timeout)
+        print_report(result)
+        results.append(result)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"\n✅ Results written to {args.json}")
+
+if __name__ == "__main__":
+    main()
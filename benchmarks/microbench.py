@@ -0,0 +1,366 @@
+"""
+Microbenchmarks of the hot functions, with JSON baselines and a regression gate.
+
+Inputs are synthetic with fixed seeds. Serial ports, Firebase and the
+summarization model are replaced by in-process stand-ins, so results only
+reflect the code under test. Each service's benchmarks run in their own
+subprocess, with that service's directory on the path (the services have
+modules with the same names, e.g. metrics.py).
+
+    python benchmarks/microbench.py run                      # print timings
+    python benchmarks/microbench.py save                     # write benchmarks/baseline.json
+    python benchmarks/microbench.py compare --tolerance 0.1  # exit 1 if anything got >10% slower
+
+Baselines are only comparable on the same machine and Python version; the
+compare command warns when they differ.
+"""
+
+import argparse
+import contextlib
+import io
+import itertools
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_BASELINE = os.path.join(ROOT, 'benchmarks', 'baseline.json')
+
+GROUPS = {
+    'ml': os.path.join(ROOT, 'ml'),
+    'sensors': os.path.join(ROOT, 'sensors'),
+    'summarizer': os.path.join(ROOT, 'Summerizer-model'),
+}
+
+# name -> (group, setup); setup returns the function to time, and optionally a cleanup function
+BENCHMARKS: Dict[str, tuple] = {}
+
+def benchmark(name: str, group: str):
+    def register(setup):
+        BENCHMARKS[name] = (group, setup)
+        return setup
+    return register
+
+# --- ML service ---
+
+def _stand_in_model(app):
+    """The real model if present, else a small fixed-seed classifier on the real scaler and features."""
+    import joblib
+
+    app.scaler = joblib.load('scaler_final.joblib')
+    app.feature_cols = joblib.load('feature_cols_final.joblib')
+    if os.path.exists('water_quality_model_final.joblib'):
+        app.model = joblib.load('water_quality_model_final.joblib')
+        return
+    import numpy as np
+    from sklearn.ensemble import RandomForestClassifier
+
+    rng = np.random.default_rng(0)
+    samples = app.scaler.mean_ + rng.standard_normal((2000, len(app.feature_cols))) * app.scaler.scale_
+    labels = rng.integers(0, 256, 2000)
+    app.model = RandomForestClassifier(n_estimators=50, max_depth=12, random_state=0).fit(
+        app.scaler.transform(samples), labels
+    )
+
+def _water_samples(count: int) -> List[Dict[str, float]]:
+    from mock_data_generator import MockDataGenerator
+
+    random.seed(0)
+    generator = MockDataGenerator()
+    return [vars(generator.generate_water_quality_data(random.uniform(30, 95), random.uniform(15, 45)))
+            for _ in range(count)]
+
+@benchmark('ml.predict_water_quality', 'ml')
+def _predict_water_quality():
+    import app
+
+    _stand_in_model(app)
+    samples = itertools.cycle(_water_samples(64))
+    return lambda: app.predict_water_quality(next(samples))
+
+@benchmark('ml.predict_batch_256', 'ml')
+def _predict_batch():
+    import numpy as np
+    import app
+
+    _stand_in_model(app)
+    samples = np.array([[s[name] for name in app.feature_cols] for s in _water_samples(256)])
+    return lambda: app.predict_batch(samples)
+
+@benchmark('ml.generate_water_quality_data', 'ml')
+def _generate_water_quality_data():
+    from mock_data_generator import MockDataGenerator
+
+    random.seed(0)
+    generator = MockDataGenerator()
+    return lambda: generator.generate_water_quality_data(72.5, 31.0)
+
+# --- Sensors ---
+
+class _FakeSerial:
+    """Serial port stand-in cycling through recorded Arduino lines"""
+
+    def __init__(self, lines: List[bytes]):
+        self.lines = itertools.cycle(lines)
+
+    def flushInput(self):
+        pass
+
+    def readline(self) -> bytes:
+        return next(self.lines)
+
+def _sensor_lines(count: int) -> List[str]:
+    rng = random.Random(0)
+    return [f"{rng.uniform(30, 95):.2f},{rng.uniform(15, 45):.2f}" for _ in range(count)]
+
+@benchmark('sensors.parse_sensor_line', 'sensors')
+def _parse_sensor_line():
+    from firebase_utils import parse_sensor_line
+
+    lines = itertools.cycle(_sensor_lines(64))
+    return lambda: parse_sensor_line(next(lines))
+
+@benchmark('sensors.read_sensor_data_from_arduino', 'sensors')
+def _read_sensor_data_from_arduino():
+    import types
+    import firebase_utils
+
+    # The settle sleeps are waits for the Arduino, not work; skip them
+    original = firebase_utils.time
+    firebase_utils.time = types.SimpleNamespace(sleep=lambda seconds: None, perf_counter=time.perf_counter,
+                                                time=time.time)
+    port = _FakeSerial([f"{line}\r\n".encode() for line in _sensor_lines(64)])
+
+    def cleanup():
+        firebase_utils.time = original
+    return (lambda: firebase_utils.read_sensor_data_from_arduino(port, 'bench')), cleanup
+
+@benchmark('sensors.create_data_packet', 'sensors')
+def _create_data_packet():
+    from firebase_utils import create_data_packet
+
+    os.environ['TRACE_READINGS'] = '0'
+    return lambda: create_data_packet(55.25, 28.5, 'bench', 1735700000.123)
+
+@benchmark('sensors.create_readable_key', 'sensors')
+def _create_readable_key():
+    from firebase_utils import create_readable_key
+
+    return lambda: create_readable_key('bench', 1735700000.123, sub_second=True)
+
+@benchmark('sensors.send_to_firebase', 'sensors')
+def _send_to_firebase():
+    import firebase_utils
+    from loadgen import FakeFirebase
+
+    os.environ['TRACE_READINGS'] = '0'
+    FakeFirebase().install()
+    sink = io.StringIO()
+
+    def send():
+        with contextlib.redirect_stdout(sink):
+            firebase_utils.send_to_firebase('continuous', 55.25, 28.5, 'bench')
+        sink.seek(0)
+        sink.truncate()
+    return send
+
+# --- Summarizer ---
+
+@benchmark('summarizer.summarize_text', 'summarizer')
+def _summarize_text():
+    import asyncio
+    import main
+
+    # Stand-in for the transformers pipeline: times request validation and response handling only
+    main.summarizer = lambda text, **kwargs: [{'summary_text': text[:kwargs['max_length']]}]
+    text = " ".join(random.Random(0).choice(["water", "quality", "sensor", "alert", "district", "report"])
+                    for _ in range(200))
+    loop = asyncio.new_event_loop()
+
+    def summarize():
+        request = main.TextInput(text=text, max_length=100, min_length=50)
+        return loop.run_until_complete(main.summarize_text(request))
+    return summarize, loop.close
+
+# --- Runner ---
+
+def time_function(func: Callable, repeats: int, min_time: float) -> Dict[str, float]:
+    """Per-call time in ns over `repeats` rounds, each long enough to be measured reliably."""
+    func()  # Warm up caches and lazy imports
+    loops = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(loops):
+            func()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time:
+            break
+        loops = max(loops * 2, int(loops * min_time / max(elapsed, 1e-9) * 1.2))
+
+    rounds = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        for _ in range(loops):
+            func()
+        rounds.append((time.perf_counter() - start) / loops * 1e9)
+    return {
+        'min_ns': min(rounds),
+        'median_ns': statistics.median(rounds),
+        'stdev_ns': statistics.stdev(rounds) if len(rounds) > 1 else 0.0,
+        'loops': loops,
+        'repeats': repeats,
+    }
+
+def run_group(group: str, names: List[str], repeats: int, min_time: float) -> Dict[str, Dict]:
+    """Run benchmarks of one group in this process (called in the group's subprocess)."""
+    os.chdir(GROUPS[group])
+    sys.path.insert(0, GROUPS[group])
+    results = {}
+    for name in names:
+        setup = BENCHMARKS[name][1]
+        random.seed(0)
+        prepared = setup()
+        func, cleanup = prepared if isinstance(prepared, tuple) else (prepared, None)
+        try:
+            results[name] = time_function(func, repeats, min_time)
+        finally:
+            if cleanup is not None:
+                cleanup()
+    return results
+
+def run(selected: List[str], repeats: int, min_time: float) -> Dict[str, Dict]:
+    """Run the selected benchmarks, one subprocess per group."""
+    results = {}
+    for group in GROUPS:
+        names = [name for name in selected if BENCHMARKS[name][0] == group]
+        if not names:
+            continue
+        process = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), '_group', group, '--repeats', str(repeats),
+             '--min-time', str(min_time)] + [arg for name in names for arg in ('--only', name)],
+            capture_output=True, text=True,
+        )
+        if process.returncode != 0:
+            print(f"❌ Benchmarks of {group} failed:\n{process.stderr[-3000:]}")
+            continue
+        results.update(json.loads(process.stdout.strip().splitlines()[-1]))
+    return results
+
+def environment() -> Dict[str, str]:
+    return {
+        'python': platform.python_version(),
+        'implementation': platform.python_implementation(),
+        'machine': platform.machine(),
+        'processor': platform.processor() or platform.machine(),
+        'node': platform.node(),
+        'cpus': str(os.cpu_count()),
+    }
+
+def _format_ns(value: Optional[float]) -> str:
+    if value is None:
+        return '-'
+    for unit, scale in (('s', 1e9), ('ms', 1e6), ('µs', 1e3)):
+        if value >= scale:
+            return f"{value / scale:.2f}{unit}"
+    return f"{value:.0f}ns"
+
+def print_results(results: Dict[str, Dict]):
+    print(f"{'benchmark':<42} {'min':>10} {'median':>10} {'stdev':>10}")
+    for name, result in results.items():
+        print(f"{name:<42} {_format_ns(result['min_ns']):>10} {_format_ns(result['median_ns']):>10} "
+              f"{_format_ns(result['stdev_ns']):>10}")
+
+def compare(baseline: Dict, results: Dict[str, Dict], selected: List[str], tolerance: float, stat: str) -> List[str]:
+    """Print current vs baseline and return the names of benchmarks slower than the tolerance allows."""
+    key = f"{stat}_ns"
+    regressions = []
+    print(f"{'benchmark':<42} {'baseline':>10} {'current':>10} {'change':>8}")
+    for name, result in results.items():
+        before = baseline['results'].get(name, {}).get(key)
+        if before is None:
+            print(f"{name:<42} {'-':>10} {_format_ns(result[key]):>10} {'new':>8}")
+            continue
+        change = result[key] / before - 1
+        flag = ''
+        if change > tolerance:
+            regressions.append(name)
+            flag = '  ❌ regression'
+        elif change < -tolerance:
+            flag = '  ✅ faster'
+        print(f"{name:<42} {_format_ns(before):>10} {_format_ns(result[key]):>10} {change:>+7.1%}{flag}")
+    for name in selected:
+        if name in baseline['results'] and name not in results:
+            print(f"{name:<42} {'':>10} {'missing':>10}")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description='Microbenchmarks of hot functions with a regression gate.')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    for command, help_text in (('run', 'Run and print timings'), ('save', 'Run and write a baseline'),
+                               ('compare', 'Run and compare with a baseline; exit 1 on regressions')):
+        sub = subparsers.add_parser(command, help=help_text)
+        sub.add_argument('--filter', default='', help='Only benchmarks whose name contains this')
+        sub.add_argument('--repeats', type=int, default=7)
+        sub.add_argument('--min-time', type=float, default=0.05, help='Minimum seconds per timing round')
+        sub.add_argument('--baseline', default=DEFAULT_BASELINE)
+        sub.add_argument('--json', metavar='PATH', help='Also write the results to this file')
+        if command == 'compare':
+            sub.add_argument('--tolerance', type=float, default=0.10, help='Allowed slowdown (0.10 = 10%%)')
+            sub.add_argument('--stat', choices=('min', 'median'), default='min')
+    group = subparsers.add_parser('_group')  # Internal: run one group's benchmarks in this process
+    group.add_argument('group', choices=sorted(GROUPS))
+    group.add_argument('--only', action='append', default=[])
+    group.add_argument('--repeats', type=int, default=7)
+    group.add_argument('--min-time', type=float, default=0.05)
+    args = parser.parse_args()
+
+    if args.command == '_group':
+        results = run_group(args.group, args.only, args.repeats, args.min_time)
+        print(json.dumps(results))
+        return
+
+    selected = [name for name in BENCHMARKS if args.filter in name]
+    if not selected:
+        parser.error(f"No benchmarks match '{args.filter}'")
+    results = run(selected, args.repeats, args.min_time)
+    report = {
+        'created': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'environment': environment(),
+        'results': results,
+    }
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    if args.command == 'run':
+        print_results(results)
+    elif args.command == 'save':
+        print_results(results)
+        with open(args.baseline, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"\n✅ Baseline of {len(results)} benchmarks written to {args.baseline}")
+    else:
+        if not os.path.exists(args.baseline):
+            sys.exit(f"❌ No baseline at {args.baseline}; create one with: python benchmarks/microbench.py save")
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        for key, value in environment().items():
+            if key != 'node' and baseline.get('environment', {}).get(key) != value:
+                print(f"⚠️ Baseline was recorded with {key}={baseline['environment'].get(key)}, now {value}")
+        regressions = compare(baseline, results, selected, args.tolerance, args.stat)
+        if len(results) < len(selected):
+            sys.exit("❌ Some benchmarks failed to run")
+        if regressions:
+            sys.exit(f"\n❌ {len(regressions)} benchmark(s) regressed by more than {args.tolerance:.0%}: "
+                     f"{', '.join(regressions)}")
+        print(f"\n✅ No regressions beyond {args.tolerance:.0%}")
+
+if __name__ == "__main__":
+    main()
@@ -21,31 +21,52 @@ const CONFIG = {
   humidityHighPct: Number(process.env.HUMIDITY_HIGH_PCT || 80),
 };
 
+// End-to-end latency trace written by the sensors: hop name -> wall-clock epoch ms
+type ReadingTrace = {
+  id: string;
+  hops: Record<string, number>;
+};
+
 type SensorReading = {
   humidity: number;
   temperature_celsius: number;
   timestamp_ist?: string;
   timestamp_unix?: number;
+  timestamp_ms?: number;
+  device_id?: string;
+  trace?: ReadingTrace;
 };
 
 type MlAlertDecision = {
   isHigh: boolean;
   reason: string;
+  trace?: ReadingTrace;
 };
 
+function markHop(trace: ReadingTrace | undefined, hop: string, time: number = Date.now()) {
+  if (trace) trace.hops[hop] = time;
+}
+
 async function decideWithMl(reading: SensorReading): Promise<MlAlertDecision | null> {
   if (!CONFIG.mlUrl) return null;
   try {
     const response = await fetch(CONFIG.mlUrl, {
       method: 'POST',
       headers: { 'Content-Type': 'application/json' },
-      body: JSON.stringify({ humidity: reading.humidity, temperature_celsius: reading.temperature_celsius }),
+      body: JSON.stringify({
+        humidity: reading.humidity,
+        temperature_celsius: reading.temperature_celsius,
+        // The ML service keeps per-sensor statistics, ordered by capture time
+        device_id: reading.device_id,
+        timestamp: reading.timestamp_ms !== undefined ? reading.timestamp_ms / 1000 : reading.timestamp_unix,
+        trace: reading.trace,
+      }),
     });
     if (!response.ok) {
       throw new Error(`ML responded ${response.status}`);
     }
-    const payload = (await response.json()) as { isHigh: boolean; reason?: string };
-    return { isHigh: !!payload.isHigh, reason: payload.reason || 'ML flagged high values' };
+    const payload = (await response.json()) as { isHigh: boolean; reason?: string; trace?: ReadingTrace };
+    return { isHigh: !!payload.isHigh, reason: payload.reason || 'ML flagged high values', trace: payload.trace };
   } catch (error) {
     console.error('ML decision failed, falling back to threshold:', error);
     return null;
@@ -64,39 +85,51 @@ function decideWithThreshold(reading: SensorReading): MlAlertDecision | null {
   return { isHigh: false, reason: 'Within normal range' };
 }
 
-async function sendNotification(title: string, body: string) {
+async function sendNotification(title: string, body: string, trace?: ReadingTrace) {
   try {
+    // The trace id and capture time let the app measure delivery to the phone
+    const data: Record<string, string> = { type: 'sensor_alert' };
+    if (trace) {
+      data.trace_id = trace.id;
+      if (trace.hops.read !== undefined) data.read_ms = String(trace.hops.read);
+    }
     await messaging.send({
       topic: CONFIG.fcmTopic,
       notification: { title, body },
-      data: { type: 'sensor_alert' },
+      data,
     });
+    markHop(trace, 'notified');
   } catch (e) {
     console.error('Failed to send FCM:', e);
   }
 }
 
-async function logAlert(readingId: string, reading: SensorReading, reason: string) {
+async function logAlert(readingId: string, reading: SensorReading, reason: string, trace?: ReadingTrace) {
   try {
-    await firestore.collection(CONFIG.alertsCollection).add({
+    const ref = await firestore.collection(CONFIG.alertsCollection).add({
       readingId,
       title: 'Sensor Alert',
       description: reason,
-      location: 'well-1',
+      location: reading.device_id || 'well-1',
       type: 'warning',
       status: 'active',
       reading,
+      ...(trace ? { trace } : {}),
       createdAt: admin.firestore.FieldValue.serverTimestamp(),
       updatedAt: admin.firestore.FieldValue.serverTimestamp(),
     });
+    markHop(trace, 'alert_logged');
+    return ref;
   } catch (e) {
     console.error('Failed to log alert:', e);
+    return null;
   }
 }
 
 export const onNewSensorReading = functions.database
   .ref(CONFIG.rtdbPath)
   .onCreate(async (snapshot, context) => {
+    const functionStart = Date.now();
     const readingId = context.params.readingId as string;
     const reading = snapshot.val() as SensorReading;
     if (!reading || typeof reading.temperature_celsius !== 'number' || typeof reading.humidity !== 'number') {
@@ -104,23 +137,41 @@ export const onNewSensorReading = functions.database
       return null;
     }
 
+    // The event timestamp is when the Realtime Database committed the write
+    const trace = reading.trace && reading.trace.hops ? reading.trace : undefined;
+    markHop(trace, 'rtdb_commit', Date.parse(context.timestamp));
+    markHop(trace, 'function_start', functionStart);
+
     // Try ML first
     const mlDecision = await decideWithMl(reading);
     const decision = mlDecision ?? decideWithThreshold(reading)!;
+    if (trace && mlDecision?.trace?.hops) {
+      Object.assign(trace.hops, mlDecision.trace.hops);
+    }
+    markHop(trace, 'decided');
 
     if (!decision.isHigh) {
-      console.log('Reading within range. No alert.');
+      console.log('Reading within range. No alert.', trace ? { trace_id: trace.id, hops: trace.hops } : '');
       return null;
     }
 
     const title = '🚨 Alert detected!';
     const body = `Reading ${readingId}: ${decision.reason}`;
 
-    await Promise.all([
-      sendNotification(title, body),
-      logAlert(readingId, reading, decision.reason),
+    const [, alertRef] = await Promise.all([
+      sendNotification(title, body, trace),
+      logAlert(readingId, reading, decision.reason, trace),
     ]);
 
+    // The record was written alongside the notification; complete its trace with both hops
+    if (trace && alertRef) {
+      try {
+        await alertRef.update({ 'trace.hops': trace.hops });
+      } catch (e) {
+        console.error('Failed to record alert trace:', e);
+      }
+    }
+
     return null;
   });
 
@@ -1,16 +1,31 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request, Response, WebSocket, WebSocketDisconnect
+from fastapi.encoders import jsonable_encoder
+from fastapi.exception_handlers import request_validation_exception_handler
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import BaseModel, Field
-import joblib
-import pandas as pd
+import asyncio
+import http.client
 import numpy as np
 import os
+import shutil
+import socket
+import time
 import warnings
-from sklearn.exceptions import InconsistentVersionWarning
-from typing import Dict, List
+from typing import Any, Dict, List, Optional
+from prometheus_client import generate_latest, CONTENT_TYPE_LATEST
 from mock_data_generator import MockDataGenerator
+from stream_evaluator import StreamEvaluator
+from feature_sketch import FeatureMonitor, load_reference
+from prediction_log import PredictionLogger, model_version
+from streaming import StreamingSession
+from batch_jobs import FINISHED, BatchScheduler, JobQuotaExceeded, check_priority, detect_format
+from metrics import registry
 
-# Suppress scikit-learn version warnings
-warnings.filterwarnings("ignore", category=InconsistentVersionWarning)
+# Suppress scikit-learn version warnings (matched by message so sklearn is only imported when the model is loaded)
+warnings.filterwarnings("ignore", message="Trying to unpickle estimator")
+# Samples are passed to the scaler as arrays in feature_cols order, which load_components checks
+warnings.filterwarnings("ignore", message="X does not have valid feature names")
 
 app = FastAPI(
     title="Water Quality Prediction API",
@@ -23,6 +38,16 @@ model = None
 scaler = None
 feature_cols = None
 mock_data_generator = None
+feature_monitor = None
+prediction_logger = None
+model_loading = None
+model_load_error = None
+batch_scheduler = None
+# Set in prefork.py workers other than the first, which forward /alert there
+alert_forward_socket = None
+
+# Per-sensor alert state; thresholds are read once here and reloaded on SIGHUP
+alert_evaluator = StreamEvaluator()
 
 class WaterSample(BaseModel):
     ph_value: float = Field(..., description="pH value of water", ge=0, le=14)
@@ -42,6 +67,20 @@ class WaterSample(BaseModel):
     total_hardness_value: float = Field(..., description="Total hardness", ge=0)
     total_suspended_solids_value: float = Field(..., description="Total suspended solids", ge=0)
 
+def field_bounds(model: type) -> Dict[str, tuple]:
+    """(low, high) of each numeric field from its ge/le constraints, for inputs validated outside pydantic"""
+    bounds = {}
+    for name, field in model.model_fields.items():
+        low, high = -float('inf'), float('inf')
+        for constraint in field.metadata:
+            low = getattr(constraint, 'ge', low)
+            high = getattr(constraint, 'le', high)
+        bounds[name] = (low, high)
+    return bounds
+
+# Same limits as /predict, for samples streamed over /ws/predict and rows of batch jobs
+SAMPLE_BOUNDS = field_bounds(WaterSample)
+
 class PredictionResponse(BaseModel):
     predicted_class: int
     confidence: float
@@ -50,12 +89,19 @@ class PredictionResponse(BaseModel):
     is_safe: bool
 
 class AlertSample(BaseModel):
-    humidity: float
-    temperature_celsius: float
+    humidity: float = Field(..., description="Humidity percentage", ge=0, le=100)
+    temperature_celsius: float = Field(..., description="Temperature in Celsius", ge=-50, le=80)
+    device_id: Optional[str] = Field(None, description="Sensor the reading came from; readings are evaluated per sensor")
+    timestamp: Optional[float] = Field(None, description="Capture time (unix seconds); defaults to arrival time",
+                                       gt=0, allow_inf_nan=False)
+    trace: Optional[Dict[str, Any]] = Field(None, description="Latency trace of the reading: id and hop times (epoch ms)")
 
 class AlertDecision(BaseModel):
     isHigh: bool
     reason: str
+    state: Optional[str] = None
+    stats: Optional[Dict[str, Dict[str, float]]] = None
+    trace: Optional[Dict[str, Any]] = None
 
 class SensorAnalysisRequest(BaseModel):
     humidity: float = Field(..., description="Humidity percentage", ge=0, le=100)
@@ -69,59 +115,128 @@ class SensorAnalysisResponse(BaseModel):
     health_risks_summary: str
     severity: str
 
+class BatchJobRequest(BaseModel):
+    path: Optional[str] = Field(None, description="Dataset (csv, jsonl or parquet) under BATCH_DATA_DIR")
+    format: Optional[str] = Field(None, description="csv, jsonl or parquet; inferred from the extension if omitted")
+    samples: Optional[List[Dict[str, Any]]] = Field(None, description="Inline samples, instead of a path")
+    priority: str = Field("normal", description="high, normal or low")
+    client: str = Field("anonymous", description="Submitter, for the per-client job quota")
+
+def load_components():
+    """Load the model, scaler, feature list and mock data generator into the module globals"""
+    global model, scaler, feature_cols, mock_data_generator
+    # joblib (and sklearn, through unpickling) are imported here rather than at module load,
+    # so the server can start answering before the model is in memory
+    import joblib
+
+    print("Loading model components from disk...")
+    loaded_model = joblib.load('water_quality_model_final.joblib')
+    loaded_scaler = joblib.load('scaler_final.joblib')
+    loaded_cols = joblib.load('feature_cols_final.joblib')
+    fitted_cols = getattr(loaded_scaler, 'feature_names_in_', None)
+    if fitted_cols is not None and list(fitted_cols) != list(loaded_cols):
+        raise RuntimeError("Feature columns do not match the order the scaler was fitted with.")
+    model, scaler, feature_cols = loaded_model, loaded_scaler, loaded_cols
+    mock_data_generator = MockDataGenerator()
+    print("✅ Components loaded successfully.")
+
 @app.on_event("startup")
 async def load_model():
     """Load model components on startup"""
-    global model, scaler, feature_cols, mock_data_generator
-    
+    global model_loading, alert_forward_socket
+    alert_evaluator.install_reload_signal()
+    alert_forward_socket = os.getenv("ALERT_FORWARD_SOCKET")
+
+    # Workers started by prefork.py inherit the components from the master process
+    if model is None and os.getenv("MODEL_LOAD", "startup") == "background":
+        # Answer /health (as "loading") right away and load the model on a worker thread
+        model_loading = asyncio.ensure_future(_load_in_background())
+        return
     try:
-        print("Loading model components from disk...")
-        model = joblib.load('water_quality_model_final.joblib')
-        scaler = joblib.load('scaler_final.joblib')
-        feature_cols = joblib.load('feature_cols_final.joblib')
-        mock_data_generator = MockDataGenerator()
-        print("✅ Components loaded successfully.")
+        if model is None:
+            load_components()
     except FileNotFoundError as e:
         print(f"❌ Error: Model files not found. {e}")
         raise RuntimeError("Model files not found. Please ensure model files are present.")
+    start_monitoring()
+    start_batch_jobs()
 
-def predict_water_quality(sample_data: dict) -> dict:
+async def _load_in_background():
+    global model_load_error
+    try:
+        await asyncio.get_running_loop().run_in_executor(None, load_components)
+    except Exception as e:
+        model_load_error = str(e)
+        print(f"❌ Error: Failed to load model components. {e}")
+        return
+    start_monitoring()
+    start_batch_jobs()
+
+def start_monitoring():
+    """Start the feature monitor and the prediction log for the loaded model"""
+    global feature_monitor, prediction_logger
+    # Input distributions are sketched on a background thread, off the request path
+    reference = load_reference(os.getenv("FEATURE_REFERENCE_PATH", "feature_reference.json"), scaler, feature_cols)
+    feature_monitor = FeatureMonitor(feature_cols, reference)
+    registry.register(feature_monitor)
+    feature_monitor.start()
+    print(f"✅ Feature monitoring started (drift method: {feature_monitor.method}).")
+
+    # Predictions are buffered and written to Parquet by a background task
+    try:
+        prediction_logger = PredictionLogger(
+            os.getenv("PREDICTION_LOG_DIR", "prediction_logs"),
+            feature_cols,
+            model_version('water_quality_model_final.joblib'),
+            policy=os.getenv("PREDICTION_LOG_POLICY", "drop"),
+        )
+        prediction_logger.start()
+        print(f"✅ Prediction log started (model version: {prediction_logger.model_version}).")
+    except (RuntimeError, ValueError, OSError) as e:
+        print(f"⚠️ Prediction log disabled: {e}")
+
+def start_batch_jobs():
+    """Start the worker pool for batch scoring jobs"""
+    global batch_scheduler
+    # Few workers, small chunks: jobs share the CPU with /predict and /alert and pause while those are in flight.
+    # Job state is kept in BATCH_JOB_DIR, so with BATCH_WORKERS=0 this process only submits and looks up jobs.
+    batch_scheduler = BatchScheduler(
+        predict_batch,
+        feature_cols,
+        os.getenv("BATCH_JOB_DIR", "batch_jobs"),
+        workers=int(os.getenv("BATCH_WORKERS", 1)),
+        chunk_size=int(os.getenv("BATCH_CHUNK_SIZE", 64)),
+        max_jobs_per_client=int(os.getenv("BATCH_MAX_JOBS_PER_CLIENT", 5)),
+        bounds=SAMPLE_BOUNDS,
+    )
+    batch_scheduler.start()
+    print(f"✅ Batch scoring started ({batch_scheduler.workers} workers).")
+
+# Map binary code to diseases from the research paper
+RISK_MAP = {
+    'A': "Gastrointestinal diseases (e.g., cholera, diarrhea)",
+    'B': "Kidney diseases",
+    'C': "Dental problems (Fluorosis, corrosion)",
+    'D': "Cardiovascular problems or Diabetes",
+    'E': "Metabolic alkalosis",
+    'F': "Convulsions (from Ammonia)",
+    'G': "Bladder cancer (from Chlorides)",
+    'H': "Blood disorders (Methemoglobinemia from Nitrates)"
+}
+
+def describe_prediction(predicted_class: int, confidence: float) -> dict:
     """
-    Makes a prediction and returns health risks associated with the predicted class.
+    Returns the health risks associated with a predicted class.
     """
-    # Prepare sample data
-    sample_df = pd.DataFrame(sample_data, index=[0])
-    sample_df = sample_df[feature_cols]
-    
-    # Scale the sample
-    sample_scaled = scaler.transform(sample_df)
-    
-    # Make prediction
-    predicted_class = model.predict(sample_scaled)[0]
-    predicted_proba = model.predict_proba(sample_scaled)[0]
-    confidence = np.max(predicted_proba) * 100
-    
     # Convert to binary representation
     binary_code = f'{predicted_class:08b}'
     
-    # Map binary code to diseases from the research paper
-    risk_map = {
-        'A': "Gastrointestinal diseases (e.g., cholera, diarrhea)",
-        'B': "Kidney diseases",
-        'C': "Dental problems (Fluorosis, corrosion)",
-        'D': "Cardiovascular problems or Diabetes",
-        'E': "Metabolic alkalosis",
-        'F': "Convulsions (from Ammonia)",
-        'G': "Bladder cancer (from Chlorides)",
-        'H': "Blood disorders (Methemoglobinemia from Nitrates)"
-    }
-    
     health_risks = []
     # Iterate through the binary code
     for i, bit in enumerate(binary_code):
         if bit == '1':
             class_letter = chr(ord('A') + i)
-            disease_info = risk_map.get(class_letter, "Unknown Risk")
+            disease_info = RISK_MAP.get(class_letter, "Unknown Risk")
             health_risks.append(f"Class {class_letter}: {disease_info}")
     
     is_safe = len(health_risks) == 0
@@ -134,6 +249,25 @@ def predict_water_quality(sample_data: dict) -> dict:
         "is_safe": is_safe
     }
 
+def predict_batch(samples: np.ndarray) -> List[dict]:
+    """
+    Makes predictions for a batch of samples (rows in feature_cols order) in one vectorized pass.
+    """
+    # Scale the samples
+    samples_scaled = scaler.transform(samples)
+    
+    # Make predictions
+    predicted_classes = model.predict(samples_scaled)
+    confidences = np.max(model.predict_proba(samples_scaled), axis=1) * 100
+    
+    return [describe_prediction(int(c), float(p)) for c, p in zip(predicted_classes, confidences)]
+
+def predict_water_quality(sample_data: dict) -> dict:
+    """
+    Makes a prediction and returns health risks associated with the predicted class.
+    """
+    return predict_batch(np.array([[sample_data[name] for name in feature_cols]], dtype=float))[0]
+
 @app.get("/")
 async def root():
     """Root endpoint with API information"""
@@ -142,7 +276,11 @@ async def root():
         "version": "1.0.0",
         "endpoints": {
             "predict": "/predict - POST endpoint for water quality prediction",
+            "stream": "/ws/predict - WebSocket for streamed predictions",
             "health": "/health - GET endpoint for health check",
+            "metrics": "/metrics - GET Prometheus metrics",
+            "feature_drift": "/feature-drift - GET input feature distributions and drift",
+            "jobs": "/jobs - POST a dataset for batch scoring, GET progress and paged results",
             "docs": "/docs - Interactive API documentation"
         }
     }
@@ -151,11 +289,98 @@ async def root():
 async def health_check():
     """Health check endpoint"""
     model_loaded = model is not None and scaler is not None and feature_cols is not None
+    loading = not model_loaded and model_loading is not None and not model_loading.done()
+    batch_jobs = None
+    if batch_scheduler is not None:
+        # Counting jobs reads every job.json, so it runs off the event loop like the job endpoints
+        batch_jobs = await asyncio.get_running_loop().run_in_executor(None, batch_scheduler.stats)
     return {
-        "status": "healthy" if model_loaded else "unhealthy",
-        "model_loaded": model_loaded
+        "status": "healthy" if model_loaded else "loading" if loading else "unhealthy",
+        "model_loaded": model_loaded,
+        "model_load_error": model_load_error,
+        "prediction_log": prediction_logger.stats() if prediction_logger is not None else None,
+        "batch_jobs": batch_jobs
     }
 
+@app.on_event("shutdown")
+async def stop_monitoring():
+    """Fold queued input vectors into the sketches and write buffered predictions before exiting"""
+    if batch_scheduler is not None:
+        batch_scheduler.stop(timeout=5)
+    if feature_monitor is not None:
+        feature_monitor.stop(timeout=5)
+    if prediction_logger is not None:
+        await prediction_logger.stop()
+
+@app.exception_handler(RequestValidationError)
+async def validation_error(request: Request, exc: RequestValidationError):
+    """The default 422, without the rejected input when it cannot be encoded (NaN or Infinity)"""
+    try:
+        return await request_validation_exception_handler(request, exc)
+    except ValueError:
+        errors = [{key: value for key, value in error.items() if key != "input"} for error in exc.errors()]
+        return JSONResponse(status_code=422, content={"detail": jsonable_encoder(errors)})
+
+# Batch jobs pause between chunks while any of these are being answered
+INTERACTIVE_PATHS = {"/predict", "/alert", "/sensor-analysis"}
+
+@app.middleware("http")
+async def prioritize_interactive(request: Request, call_next):
+    if batch_scheduler is None or request.url.path not in INTERACTIVE_PATHS:
+        return await call_next(request)
+    with batch_scheduler.interactive():
+        return await call_next(request)
+
+class _UnixHTTPConnection(http.client.HTTPConnection):
+    """HTTP over a Unix domain socket, to reach another worker of the same server"""
+
+    def __init__(self, socket_path: str, timeout: float = 10):
+        super().__init__("localhost", timeout=timeout)
+        self.socket_path = socket_path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.socket_path)
+
+def _forward(path: str, body: bytes, content_type: str) -> tuple:
+    connection = _UnixHTTPConnection(alert_forward_socket)
+    try:
+        connection.request("POST", path, body, {"Content-Type": content_type})
+        response = connection.getresponse()
+        return response.status, response.read(), response.getheader("Content-Type", "application/json")
+    finally:
+        connection.close()
+
+@app.middleware("http")
+async def forward_alerts(request: Request, call_next):
+    """
+    Alert state is per process, so under prefork.py /alert is answered by the first worker only;
+    the others forward it, and every reading of a sensor reaches the same evaluator.
+    """
+    if alert_forward_socket is None or request.method != "POST" or request.url.path != "/alert":
+        return await call_next(request)
+    body = await request.body()
+    try:
+        status, content, media_type = await asyncio.get_running_loop().run_in_executor(
+            None, _forward, request.url.path, body, request.headers.get("content-type", "application/json")
+        )
+    except OSError as e:
+        return JSONResponse({"detail": f"Alert worker unavailable: {e}"}, status_code=503)
+    return Response(content, status_code=status, media_type=media_type)
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus metrics endpoint"""
+    return Response(generate_latest(registry), media_type=CONTENT_TYPE_LATEST)
+
+@app.get("/feature-drift")
+async def feature_drift():
+    """Quantiles and drift score of each model input feature"""
+    if feature_monitor is None:
+        raise HTTPException(status_code=503, detail="Feature monitoring not started. Please check server logs.")
+    return feature_monitor.snapshot()
+
 @app.post("/predict", response_model=PredictionResponse)
 async def predict_water_quality_endpoint(water_sample: WaterSample):
     """
@@ -170,34 +395,71 @@ async def predict_water_quality_endpoint(water_sample: WaterSample):
         
         # Make prediction
         result = predict_water_quality(sample_data)
+        if feature_monitor is not None:
+            feature_monitor.observe(sample_data)
+        if prediction_logger is not None:
+            await prediction_logger.log("/predict", sample_data, result)
         
         return PredictionResponse(**result)
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Prediction failed: {str(e)}")
 
-@app.post("/alert", response_model=AlertDecision)
-async def alert_decision(sample: AlertSample):
+@app.websocket("/ws/predict")
+async def stream_predictions(websocket: WebSocket):
     """
-    Decide if a sensor reading (temp/humidity) is high.
-    This provides a consistent ML service surface for Cloud Functions.
-    Replace the simple rule below with an actual model if desired.
+    Streaming inference for gateways: samples in, results out on one connection.
+    Samples are batched for vectorized inference; see streaming.py for the protocol.
     """
+    await websocket.accept()
+    if model is None or scaler is None or feature_cols is None:
+        await websocket.close(code=1013, reason="Model not loaded")
+        return
+
+    session = StreamingSession(
+        websocket, feature_cols, predict_batch,
+        window=int(os.getenv("WS_WINDOW", 256)),
+        max_batch=int(os.getenv("WS_MAX_BATCH", 128)),
+        on_results=_record_stream_results,
+        bounds=SAMPLE_BOUNDS,
+    )
     try:
-        temp_high_c = float(os.getenv("TEMP_HIGH_C", 38))
-        humidity_high_pct = float(os.getenv("HUMIDITY_HIGH_PCT", 80))
-    except Exception:
-        temp_high_c = 38.0
-        humidity_high_pct = 80.0
+        await session.run()
+    except WebSocketDisconnect:
+        pass
+
+async def _record_stream_results(samples: List[dict], predictions: List[dict]):
+    """Feed streamed predictions to the feature monitor and the prediction log."""
+    for sample, prediction in zip(samples, predictions):
+        if feature_monitor is not None:
+            feature_monitor.observe(sample)
+        if prediction_logger is not None:
+            await prediction_logger.log("/ws/predict", sample, prediction)
 
-    reasons: List[str] = []
-    if sample.temperature_celsius >= temp_high_c:
-        reasons.append(f"Temperature too high: {sample.temperature_celsius}°C ≥ {temp_high_c}°C")
-    if sample.humidity >= humidity_high_pct:
-        reasons.append(f"Humidity too high: {sample.humidity}% ≥ {humidity_high_pct}%")
+@app.post("/alert", response_model=AlertDecision)
+async def alert_decision(sample: AlertSample):
+    """
+    Decide if a sensor reading (temp/humidity) should raise a notification.
+    Readings are evaluated against smoothed per-sensor statistics with hysteresis,
+    so isHigh is true when an alert is raised (or re-notified), not for every high reading.
+    """
+    received_ms = int(time.time() * 1000)
+    evaluation = alert_evaluator.evaluate(
+        sample.device_id or "default", sample.humidity, sample.temperature_celsius, sample.timestamp
+    )
+    return AlertDecision(
+        isHigh=evaluation.is_high,
+        reason=evaluation.reason,
+        state=evaluation.state,
+        stats=evaluation.stats,
+        trace=_extend_trace(sample.trace, ml_received=received_ms, ml_responded=int(time.time() * 1000)),
+    )
 
-    is_high = len(reasons) > 0
-    return AlertDecision(isHigh=is_high, reason="; ".join(reasons) or "Within normal range")
+def _extend_trace(trace: Optional[Dict[str, Any]], **hops: int) -> Optional[Dict[str, Any]]:
+    """Return a copy of a reading's latency trace with this service's hops added."""
+    if not trace:
+        return None
+    return {**trace, "hops": {**(trace.get("hops") or {}), **hops}}
 
 @app.post("/sensor-analysis", response_model=SensorAnalysisResponse)
 async def comprehensive_sensor_analysis(request: SensorAnalysisRequest):
@@ -260,6 +522,13 @@ async def comprehensive_sensor_analysis(request: SensorAnalysisRequest):
         
         # Determine if alert should be triggered
         is_high = severity in ["critical", "warning"]
+
+        if prediction_logger is not None:
+            await prediction_logger.log("/sensor-analysis", water_quality_dict, prediction_result, {
+                "humidity": request.humidity,
+                "temperature_celsius": request.temperature_celsius,
+                "severity": severity,
+            })
         
         return SensorAnalysisResponse(
             isHigh=is_high,
@@ -278,6 +547,132 @@ async def comprehensive_sensor_analysis(request: SensorAnalysisRequest):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Sensor analysis failed: {str(e)}")
 
+def _require_batch_jobs():
+    if batch_scheduler is None:
+        raise HTTPException(status_code=503, detail="Model not loaded. Please check server logs.")
+    return batch_scheduler
+
+async def _job_call(function, *args):
+    """Run a job lookup (which reads the job's files) off the event loop; unknown jobs are 404s"""
+    try:
+        return await asyncio.get_running_loop().run_in_executor(None, function, *args)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Job not found: {args[0]}")
+
+@app.post("/jobs", status_code=202)
+async def submit_batch_job(request: BatchJobRequest):
+    """
+    Queue a dataset for batch scoring: a file under BATCH_DATA_DIR, or inline samples.
+    Returns the job id to poll at /jobs/{job_id}.
+    """
+    scheduler = _require_batch_jobs()
+    if (request.path is None) == (request.samples is None):
+        raise HTTPException(status_code=400, detail="Provide exactly one of 'path' or 'samples'.")
+    loop = asyncio.get_running_loop()
+    try:
+        if request.samples is not None:
+            return await loop.run_in_executor(
+                None, scheduler.submit_samples, request.samples, request.priority, request.client
+            )
+        # Only files under the data directory may be read
+        data_dir = os.path.realpath(os.getenv("BATCH_DATA_DIR", "batch_data"))
+        path = os.path.realpath(os.path.join(data_dir, request.path))
+        if os.path.commonpath([data_dir, path]) != data_dir:
+            raise ValueError("Path must be inside the batch data directory")
+        return await loop.run_in_executor(
+            None, scheduler.submit, path, request.format, request.priority, request.client
+        )
+    except JobQuotaExceeded as e:
+        raise HTTPException(status_code=429, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.post("/jobs/upload", status_code=202)
+async def upload_batch_job(request: Request, format: str, priority: str = "normal", client: str = "anonymous"):
+    """
+    Queue an uploaded dataset for batch scoring. The request body is the file itself
+    (csv, jsonl or parquet, as given by `format`, at most BATCH_MAX_UPLOAD_BYTES) and is streamed to disk.
+    """
+    scheduler = _require_batch_jobs()
+    max_bytes = int(os.getenv("BATCH_MAX_UPLOAD_BYTES", 512 * 1024 * 1024))
+    loop = asyncio.get_running_loop()
+    # Everything that can reject the job is checked before the body is read
+    try:
+        detect_format('', format)
+        check_priority(priority)
+        await loop.run_in_executor(None, scheduler.check_quota, client)
+    except JobQuotaExceeded as e:
+        raise HTTPException(status_code=429, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    too_large = HTTPException(status_code=413, detail=f"Uploads are limited to {max_bytes} bytes")
+    if int(request.headers.get("content-length") or 0) > max_bytes:
+        raise too_large
+
+    job_id, job_dir = await loop.run_in_executor(None, scheduler.new_job_dir)
+    path = os.path.join(job_dir, f"input.{format}")
+    try:
+        f = await loop.run_in_executor(None, open, path, 'wb')
+        try:
+            size = 0
+            async for chunk in request.stream():
+                size += len(chunk)
+                if size > max_bytes:
+                    raise too_large
+                await loop.run_in_executor(None, f.write, chunk)
+        finally:
+            await loop.run_in_executor(None, f.close)
+        return await loop.run_in_executor(None, scheduler.submit, path, format, priority, client, job_id)
+    except (JobQuotaExceeded, ValueError) as e:
+        # The quota can still fill up while the body is uploaded
+        shutil.rmtree(job_dir, ignore_errors=True)
+        raise HTTPException(status_code=429 if isinstance(e, JobQuotaExceeded) else 400, detail=str(e))
+    except BaseException:
+        shutil.rmtree(job_dir, ignore_errors=True)
+        raise
+
+@app.get("/jobs")
+async def list_batch_jobs(client: Optional[str] = None):
+    """Status of all batch jobs, optionally of one client"""
+    return await asyncio.get_running_loop().run_in_executor(None, _require_batch_jobs().list_jobs, client)
+
+@app.get("/jobs/{job_id}")
+async def get_batch_job(job_id: str):
+    """Status and progress of a batch job"""
+    return await _job_call(_require_batch_jobs().get, job_id)
+
+@app.get("/jobs/{job_id}/results")
+async def get_batch_job_results(job_id: str, offset: int = 0, limit: int = 100):
+    """
+    A page of results, in input row order. Available while the job runs;
+    `next_offset` is null once the last row of a finished job has been returned.
+    """
+    scheduler = _require_batch_jobs()
+    if offset < 0 or not 1 <= limit <= 10000:
+        raise HTTPException(status_code=400, detail="offset must be >= 0 and limit between 1 and 10000")
+    job, results = await _job_call(scheduler.results, job_id, offset, limit)
+    next_offset = offset + len(results)
+    finished = job["status"] in FINISHED
+    return {
+        "job": job,
+        "offset": offset,
+        "results": results,
+        "next_offset": None if finished and next_offset >= job["processed"] else next_offset,
+    }
+
+@app.get("/jobs/{job_id}/results/stream")
+async def stream_batch_job_results(job_id: str):
+    """All results as JSON lines, following the job until it finishes"""
+    scheduler = _require_batch_jobs()
+    await _job_call(scheduler.get, job_id)
+    # A sync generator, so Starlette iterates it on a worker thread
+    return StreamingResponse(scheduler.stream(job_id), media_type="application/x-ndjson")
+
+@app.delete("/jobs/{job_id}")
+async def cancel_batch_job(job_id: str):
+    """Cancel a queued job, or stop a running one after its current chunk"""
+    return await _job_call(_require_batch_jobs().cancel, job_id)
+
 @app.get("/sample")
 async def get_sample_data():
     """Get sample water data for testing"""
@@ -0,0 +1,603 @@
+"""
+Asynchronous batch scoring jobs.
+
+A dataset (an uploaded file, a file under BATCH_DATA_DIR, or inline samples)
+is submitted as a job and scored in chunks by a small pool of worker threads
+with the same vectorized predict_batch as the interactive endpoints. Results
+are appended to a JSON-lines file per job, so they can be paged or streamed
+while the job is still running and memory does not grow with the dataset.
+
+Job state lives on disk, one directory per job under the job directory:
+
+    job.json       status and progress, replaced atomically after every chunk
+    results.jsonl  one result per input row, in row order
+    offsets        byte offset of each chunk in results.jsonl (int64), for paging
+    claim          pid of the process scoring the job
+    cancel         present once cancellation was requested
+
+so every process of the service (e.g. the workers of prefork.py) can submit,
+look up, page and cancel any job, and quotas count every job. Processes with
+workers=0 only do that; the ones with workers claim queued jobs, and a job
+whose claiming process died is queued again and resumes after its last chunk.
+
+Scheduling keeps interactive traffic first:
+
+- between chunks, workers wait (up to `max_pause`) while interactive
+  requests (/predict, /alert, ...) are in flight or one finished less than
+  `quiet_period` ago, so a burst of interactive traffic only ever competes
+  with the end of one scoring chunk
+- worker threads run at a lower CPU priority (`nice`), so the kernel favours
+  request handling in the other processes too
+- jobs run by priority (high, normal, low) and FIFO within a priority; a
+  running job hands its worker to a queued job of higher priority at the
+  next chunk boundary
+- each client may have at most `max_jobs_per_client` unfinished jobs, and
+  at most `max_queued_jobs` wait in total
+"""
+
+import csv
+import fcntl
+import itertools
+import json
+import math
+import os
+import re
+import shutil
+import threading
+import time
+import uuid
+from array import array
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+PRIORITIES = {'high': 0, 'normal': 1, 'low': 2}
+FORMATS = ('csv', 'jsonl', 'parquet')
+FINISHED = ('completed', 'failed', 'cancelled')
+
+_JOB_ID = re.compile(r'^[0-9a-f]{12}$')
+_STATE = ('id', 'path', 'format', 'priority', 'client', 'chunk_size', 'status', 'total', 'processed',
+          'failed_rows', 'result_bytes', 'requeued', 'error', 'created_at', 'started_at', 'finished_at')
+
+class JobQuotaExceeded(Exception):
+    """Raised when a client (or the service) already has as many jobs as it may queue"""
+
+def detect_format(path: str, fmt: Optional[str] = None) -> str:
+    """The given format, else one inferred from the file extension."""
+    if fmt is None:
+        name = path.lower()
+        fmt = next((f for f in FORMATS if name.endswith(f'.{f}')), 'jsonl' if name.endswith('.ndjson') else None)
+    if fmt not in FORMATS:
+        raise ValueError(f"Unsupported format: {fmt}. Must be one of {FORMATS}")
+    return fmt
+
+def check_priority(priority: str):
+    if priority not in PRIORITIES:
+        raise ValueError(f"Invalid priority: {priority}. Must be one of {tuple(PRIORITIES)}")
+
+def count_rows(path: str, fmt: str) -> int:
+    if fmt == 'parquet':
+        import pyarrow.parquet as pq
+
+        return pq.ParquetFile(path).metadata.num_rows
+    with open(path, 'rb') as f:
+        lines = sum(1 for line in f if line.strip())
+    return max(lines - 1, 0) if fmt == 'csv' else lines
+
+def iter_rows(path: str, fmt: str) -> Iterator[Dict[str, Any]]:
+    """Rows of a dataset file as dicts, read lazily."""
+    if fmt == 'parquet':
+        import pyarrow.parquet as pq
+
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=4096):
+            yield from batch.to_pylist()
+    elif fmt == 'csv':
+        with open(path, newline='') as f:
+            yield from csv.DictReader(f)
+    else:
+        with open(path) as f:
+            for line in f:
+                if line.strip():
+                    try:
+                        row = json.loads(line)
+                    except ValueError as e:
+                        yield {'__error__': f"Invalid JSON: {e}"}
+                        continue
+                    yield row if isinstance(row, dict) else {'__error__': "Expected a JSON object"}
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+class BatchJob:
+    """State and progress of one scoring job, as stored in its job.json"""
+
+    def __init__(self, directory: str, **state):
+        self.directory = directory
+        self.id = state['id']
+        self.path = state['path']
+        self.format = state['format']
+        self.priority = state['priority']
+        self.client = state['client']
+        self.chunk_size = state['chunk_size']
+        self.status = state.get('status', 'queued')
+        self.total: Optional[int] = state.get('total')
+        self.processed = state.get('processed', 0)
+        self.failed_rows = state.get('failed_rows', 0)
+        self.result_bytes = state.get('result_bytes', 0)
+        self.requeued = state.get('requeued', False)  # Preempted or recovered; resumes ahead of its priority
+        self.error: Optional[str] = state.get('error')
+        self.created_at = state.get('created_at', time.time())
+        self.started_at: Optional[float] = state.get('started_at')
+        self.finished_at: Optional[float] = state.get('finished_at')
+
+    @classmethod
+    def load(cls, directory: str) -> Optional['BatchJob']:
+        try:
+            with open(os.path.join(directory, 'job.json')) as f:
+                return cls(directory, **json.load(f))
+        except (OSError, ValueError, KeyError, TypeError):
+            return None  # Being uploaded, or not a job directory
+
+    def save(self):
+        temporary = os.path.join(self.directory, f'job.json.{os.getpid()}.{threading.get_ident()}')
+        with open(temporary, 'w') as f:
+            json.dump({name: getattr(self, name) for name in _STATE}, f)
+        os.replace(temporary, os.path.join(self.directory, 'job.json'))
+
+    def file(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    @property
+    def finished(self) -> bool:
+        return self.status in FINISHED
+
+    @property
+    def cancel_requested(self) -> bool:
+        return os.path.exists(self.file('cancel'))
+
+    def to_dict(self) -> Dict[str, Any]:
+        elapsed = ((self.finished_at or time.time()) - self.started_at) if self.started_at else None
+        return {
+            'job_id': self.id,
+            'status': self.status,
+            'priority': self.priority,
+            'client': self.client,
+            'format': self.format,
+            'total': self.total,
+            'processed': self.processed,
+            'failed_rows': self.failed_rows,
+            'progress': round(self.processed / self.total, 4) if self.total else (1.0 if self.finished else 0.0),
+            'rows_per_second': round(self.processed / elapsed, 1) if elapsed else None,
+            'cancel_requested': not self.finished and self.cancel_requested,
+            'error': self.error,
+            'created_at': self.created_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+        }
+
+class BatchScheduler:
+    """Jobs stored under a directory, scored by worker threads that yield to interactive requests"""
+
+    def __init__(self, predict: Callable[[np.ndarray], List[dict]], feature_cols: List[str], directory: str,
+                 workers: int = 1, chunk_size: int = 64, max_pause: float = 0.5, quiet_period: float = 0.05,
+                 max_queued_jobs: int = 100, max_jobs_per_client: int = 5, retention_seconds: float = 86400,
+                 bounds: Optional[Dict[str, Tuple[float, float]]] = None, poll_interval: float = 1.0,
+                 nice: int = 10):
+        self.predict = predict
+        self.feature_cols = list(feature_cols)
+        self.directory = directory
+        self.workers = workers
+        self.chunk_size = chunk_size
+        self.max_pause = max_pause
+        self.quiet_period = quiet_period
+        self.max_queued_jobs = max_queued_jobs
+        self.max_jobs_per_client = max_jobs_per_client
+        self.retention_seconds = retention_seconds
+        self.poll_interval = poll_interval
+        self.nice = nice
+        # (low, high) per feature, in feature_cols order; rows outside them are rejected like at /predict
+        bounds = bounds or {}
+        self.bounds = [bounds.get(name, (-math.inf, math.inf)) for name in self.feature_cols]
+        self._work = threading.Condition()
+        self._interactive = 0
+        self._last_interactive = 0.0
+        self._idle = threading.Condition()
+        self._threads: List[threading.Thread] = []
+        self._stopping = False
+        self._last_maintenance = 0.0
+        os.makedirs(directory, exist_ok=True)
+
+    # --- Interactive traffic ---
+
+    @contextmanager
+    def interactive(self):
+        """Mark an interactive request as in flight; batch chunks wait until none are."""
+        with self._idle:
+            self._interactive += 1
+        try:
+            yield
+        finally:
+            with self._idle:
+                self._interactive -= 1
+                self._last_interactive = time.monotonic()
+
+    def _yield_to_interactive(self):
+        deadline = time.monotonic() + self.max_pause
+        with self._idle:
+            while not self._stopping:
+                now = time.monotonic()
+                if now >= deadline:
+                    return
+                if self._interactive:
+                    self._idle.wait(deadline - now)
+                elif now - self._last_interactive < self.quiet_period:
+                    self._idle.wait(min(self._last_interactive + self.quiet_period, deadline) - now)
+                else:
+                    return
+
+    # --- Job files ---
+
+    def _job_dir(self, job_id: str) -> str:
+        if not _JOB_ID.match(job_id):
+            raise KeyError(job_id)
+        return os.path.join(self.directory, job_id)
+
+    def load(self, job_id: str) -> BatchJob:
+        """The job's current state; KeyError if there is no such job."""
+        job = BatchJob.load(self._job_dir(job_id))
+        if job is None:
+            raise KeyError(job_id)
+        return job
+
+    def _jobs(self) -> List[BatchJob]:
+        jobs = []
+        for name in os.listdir(self.directory):
+            if _JOB_ID.match(name):
+                job = BatchJob.load(os.path.join(self.directory, name))
+                if job is not None:
+                    jobs.append(job)
+        return jobs
+
+    def get(self, job_id: str) -> Dict[str, Any]:
+        return self.load(job_id).to_dict()
+
+    def list_jobs(self, client: Optional[str] = None) -> List[Dict[str, Any]]:
+        jobs = sorted(self._jobs(), key=lambda job: job.created_at)
+        return [job.to_dict() for job in jobs if client is None or job.client == client]
+
+    @contextmanager
+    def _submit_lock(self):
+        """Serializes quota checks and submissions across processes."""
+        with open(os.path.join(self.directory, '.lock'), 'w') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _claim(self, job: BatchJob) -> bool:
+        try:
+            fd = os.open(job.file('claim'), os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            return False
+        with os.fdopen(fd, 'w') as f:
+            f.write(str(os.getpid()))
+        return True
+
+    def _release(self, job: BatchJob):
+        try:
+            os.remove(job.file('claim'))
+        except FileNotFoundError:
+            pass
+
+    def _claimed_by(self, job: BatchJob) -> Optional[int]:
+        try:
+            with open(job.file('claim')) as f:
+                return int(f.read() or 0)
+        except (OSError, ValueError):
+            return None
+
+    # --- Submission ---
+
+    def check_quota(self, client: str):
+        """Raise JobQuotaExceeded if a new job of this client would exceed a quota."""
+        jobs = self._jobs()
+        queued = sum(1 for job in jobs if job.status == 'queued')
+        if queued >= self.max_queued_jobs:
+            raise JobQuotaExceeded(f"{queued} jobs are already queued; try again later")
+        active = sum(1 for job in jobs if job.client == client and not job.finished)
+        if active >= self.max_jobs_per_client:
+            raise JobQuotaExceeded(f"Client '{client}' already has {active} unfinished jobs")
+
+    def new_job_dir(self) -> Tuple[str, str]:
+        job_id = uuid.uuid4().hex[:12]
+        job_dir = os.path.join(self.directory, job_id)
+        os.makedirs(job_dir)
+        return job_id, job_dir
+
+    def submit(self, path: str, fmt: Optional[str] = None, priority: str = 'normal', client: str = 'anonymous',
+               job_id: Optional[str] = None) -> Dict[str, Any]:
+        """Queue a dataset file for scoring."""
+        check_priority(priority)
+        fmt = detect_format(path, fmt)
+        if not os.path.isfile(path):
+            raise ValueError(f"Dataset not found: {path}")
+        with self._submit_lock():
+            self.check_quota(client)
+            if job_id is None:
+                job_id, job_dir = self.new_job_dir()
+            else:
+                job_dir = self._job_dir(job_id)
+            job = BatchJob(job_dir, id=job_id, path=path, format=fmt, priority=priority, client=client,
+                           chunk_size=self.chunk_size)
+            job.save()
+        with self._work:
+            self._work.notify()  # Other processes find it on their next poll
+        return job.to_dict()
+
+    def submit_samples(self, samples: List[Dict[str, Any]], priority: str = 'normal',
+                       client: str = 'anonymous') -> Dict[str, Any]:
+        """Queue inline samples; they are written to the job directory first."""
+        job_id, job_dir = self.new_job_dir()
+        path = os.path.join(job_dir, 'input.jsonl')
+        with open(path, 'w') as f:
+            for sample in samples:
+                f.write(json.dumps(sample) + '\n')
+        try:
+            return self.submit(path, 'jsonl', priority, client, job_id)
+        except Exception:
+            shutil.rmtree(job_dir, ignore_errors=True)
+            raise
+
+    def cancel(self, job_id: str) -> Dict[str, Any]:
+        """Cancel a queued job now, or a running one (in any process) after its current chunk."""
+        job = self.load(job_id)
+        if job.finished:
+            return job.to_dict()
+        open(job.file('cancel'), 'w').close()
+        if job.status == 'queued' and self._claim(job):
+            job = self.load(job_id)
+            self._finish(job, 'cancelled')
+        return self.load(job_id).to_dict()
+
+    # --- Maintenance ---
+
+    def _maintain(self, starting: bool = False):
+        """Requeue jobs of processes that died and delete expired jobs; at most every 30 seconds."""
+        now = time.time()
+        if not starting and now - self._last_maintenance < 30:
+            return
+        self._last_maintenance = now
+        for job in self._jobs():
+            if job.status == 'running':
+                pid = self._claimed_by(job)
+                # Before our workers start, a claim with our pid is from an earlier run (e.g. pid 1 in a container)
+                if pid is None or not _pid_alive(pid) or (starting and pid == os.getpid()):
+                    print(f"⚠️ Batch job {job.id} lost its worker, requeueing it")
+                    job.status = 'queued'
+                    job.requeued = True
+                    job.save()
+                    self._release(job)
+            elif job.finished and now - job.finished_at > self.retention_seconds:
+                shutil.rmtree(job.directory, ignore_errors=True)
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            # Directories of uploads that never became jobs
+            if _JOB_ID.match(name) and not os.path.exists(os.path.join(path, 'job.json')) \
+                    and now - os.path.getmtime(path) > self.retention_seconds:
+                shutil.rmtree(path, ignore_errors=True)
+
+    # --- Workers ---
+
+    def _queued(self) -> List[BatchJob]:
+        """Unclaimed queued jobs, in the order they should run."""
+        jobs = [job for job in self._jobs() if job.status == 'queued' and not os.path.exists(job.file('claim'))]
+        jobs.sort(key=lambda job: (PRIORITIES[job.priority], not job.requeued, job.created_at))
+        return jobs
+
+    def _next_job(self) -> Optional[BatchJob]:
+        while not self._stopping:
+            self._maintain()
+            for job in self._queued():
+                if not self._claim(job):
+                    continue  # Another worker or process took it
+                job = BatchJob.load(job.directory)
+                if job is None or job.status != 'queued':
+                    continue
+                if job.cancel_requested:
+                    self._finish(job, 'cancelled')
+                    continue
+                job.status = 'running'
+                job.started_at = job.started_at or time.time()
+                job.save()
+                return job
+            with self._work:
+                self._work.wait(self.poll_interval)
+        return None
+
+    def _preempted(self, job: BatchJob, checked_at: List[float]) -> bool:
+        """Whether a queued job of higher priority should take this worker (checked every poll interval)."""
+        now = time.monotonic()
+        if now - checked_at[0] < self.poll_interval:
+            return False
+        checked_at[0] = now
+        queued = self._queued()
+        if queued and PRIORITIES[queued[0].priority] < PRIORITIES[job.priority]:
+            job.status = 'queued'
+            job.requeued = True
+            job.save()
+            self._release(job)
+            return True
+        return False
+
+    def _finish(self, job: BatchJob, status: str, error: Optional[str] = None):
+        job.status = status
+        job.error = error
+        job.finished_at = time.time()
+        job.save()
+
+    def _vector(self, row: Dict[str, Any]) -> Tuple[Optional[List[float]], Optional[str]]:
+        if '__error__' in row:
+            return None, row['__error__']
+        try:
+            vector = [float(row[name]) for name in self.feature_cols]
+        except KeyError as e:
+            return None, f"Missing feature: {e.args[0]}"
+        except (TypeError, ValueError):
+            return None, "Feature values must be numbers"
+        if not all(np.isfinite(vector)):
+            return None, "Feature values must be finite"
+        for name, value, (low, high) in zip(self.feature_cols, vector, self.bounds):
+            if not low <= value <= high:
+                return None, f"{name} out of range: {value:g}"
+        return vector, None
+
+    def _score(self, job: BatchJob, rows: List[Dict[str, Any]], results_file, offsets_file):
+        vectors, positions, results = [], [], []
+        for offset, row in enumerate(rows):
+            result = {'row': job.processed + offset}
+            if 'id' in row:
+                result['id'] = row['id']
+            results.append(result)
+            vector, error = self._vector(row)
+            if error is not None:
+                result['error'] = error
+                continue
+            vectors.append(vector)
+            positions.append(offset)
+
+        if vectors:
+            for offset, prediction in zip(positions, self.predict(np.array(vectors, dtype=float))):
+                results[offset].update({
+                    'predicted_class': prediction['predicted_class'],
+                    'confidence': prediction['confidence'],
+                    'is_safe': prediction['is_safe'],
+                    'health_risks': prediction['health_risks'],
+                })
+
+        data = ''.join(json.dumps(result, separators=(',', ':')) + '\n' for result in results).encode()
+        results_file.write(data)
+        results_file.flush()
+        offsets_file.write(array('q', [job.result_bytes]).tobytes())
+        offsets_file.flush()
+        # job.json is written last, so readers never see rows beyond what is in the files
+        job.result_bytes += len(data)
+        job.processed += len(rows)
+        job.failed_rows += len(rows) - len(vectors)
+        job.save()
+
+    def _run(self, job: BatchJob):
+        try:
+            if job.total is None:
+                job.total = count_rows(job.path, job.format)
+                job.save()
+            # Resume after the last complete chunk: drop anything a dead worker wrote past it
+            rows = itertools.islice(iter_rows(job.path, job.format), job.processed, None)
+            checked_at = [time.monotonic()]
+            with open(job.file('results.jsonl'), 'ab') as results_file, open(job.file('offsets'), 'ab') as offsets_file:
+                results_file.truncate(job.result_bytes)
+                offsets_file.truncate(-(-job.processed // job.chunk_size) * 8)
+                while True:
+                    if job.cancel_requested:
+                        self._finish(job, 'cancelled')
+                        return
+                    if self._stopping:
+                        # Picked up again, after its last chunk, when the service restarts
+                        job.status = 'queued'
+                        job.requeued = True
+                        job.save()
+                        self._release(job)
+                        return
+                    self._yield_to_interactive()
+                    if self._preempted(job, checked_at):
+                        return
+                    chunk = list(itertools.islice(rows, job.chunk_size))
+                    if not chunk:
+                        self._finish(job, 'completed')
+                        return
+                    self._score(job, chunk, results_file, offsets_file)
+        except Exception as e:
+            print(f"❌ Batch job {job.id} failed: {e}")
+            self._finish(job, 'failed', str(e))
+
+    def _worker(self):
+        try:
+            # Linux applies a thread id's nice value to that thread only
+            os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), self.nice)
+        except (AttributeError, OSError):
+            pass
+        while True:
+            job = self._next_job()
+            if job is None:
+                return
+            self._run(job)
+
+    def start(self):
+        if self.workers:
+            self._maintain(starting=True)
+        for index in range(self.workers):
+            thread = threading.Thread(target=self._worker, name=f'batch-worker-{index}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, timeout: Optional[float] = None):
+        """Stop after the current chunks; running jobs are queued again and resume when the service restarts."""
+        self._stopping = True
+        with self._work:
+            self._work.notify_all()
+        with self._idle:
+            self._idle.notify_all()
+        for thread in self._threads:
+            thread.join(timeout)
+
+    # --- Results ---
+
+    def results(self, job_id: str, offset: int = 0, limit: int = 100) -> Tuple[Dict[str, Any], List[Dict[str, Any]]]:
+        """The job's state and a page of results of the rows scored so far."""
+        job = self.load(job_id)
+        if offset >= job.processed:
+            return job.to_dict(), []
+        chunk = offset // job.chunk_size
+        with open(job.file('offsets'), 'rb') as f:
+            f.seek(chunk * 8)
+            position = array('q', f.read(8))[0]
+        page = []
+        with open(job.file('results.jsonl'), 'rb') as f:
+            f.seek(position)
+            for row in range(chunk * job.chunk_size, job.processed):
+                line = f.readline()
+                if len(page) >= limit:
+                    break
+                if row >= offset:
+                    page.append(json.loads(line))
+        return job.to_dict(), page
+
+    def stream(self, job_id: str, poll_interval: float = 0.5) -> Iterator[bytes]:
+        """Every result line, following the file until the job has finished."""
+        job = self.load(job_id)
+        sent = 0
+        with open(job.file('results.jsonl'), 'ab+') as f:
+            f.seek(0)
+            while True:
+                job = self.load(job_id)
+                if job.result_bytes > sent:
+                    chunk = f.read(job.result_bytes - sent)
+                    sent += len(chunk)
+                    yield chunk
+                elif job.finished:
+                    return
+                else:
+                    time.sleep(poll_interval)
+
+    def stats(self) -> Dict[str, Any]:
+        statuses: Dict[str, int] = {}
+        for job in self._jobs():
+            statuses[job.status] = statuses.get(job.status, 0) + 1
+        return {'workers': self.workers, 'jobs': statuses, 'interactive_in_flight': self._interactive}
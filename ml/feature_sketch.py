@@ -0,0 +1,324 @@
+"""
+Constant-memory monitoring of the feature distributions arriving at /predict.
+
+Each feature keeps a KLL quantile sketch, a histogram over the training
+reference bins and running moments. All of these are bounded no matter how
+much traffic arrives. The request path only appends the input vector to a
+bounded queue; a background thread updates the sketches.
+
+Drift is measured against a training-time reference snapshot:
+
+- with a reference file (see `python feature_sketch.py reference`), the
+  Population Stability Index over the reference decile bins
+  (< 0.1 stable, 0.1-0.25 moderate, > 0.25 significant drift)
+- otherwise, the shift of the mean in training standard deviations, using
+  the mean and scale stored in the fitted StandardScaler
+
+Scores cover the last one to two windows of `window` vectors, so a recent
+calibration fault is not averaged away by months of healthy traffic.
+"""
+
+import argparse
+import json
+import math
+import os
+import random
+import threading
+from bisect import bisect_right
+from collections import deque
+from typing import Dict, List, Optional
+
+from prometheus_client.core import GaugeMetricFamily, HistogramMetricFamily, Metric
+from metrics import metric_feature_samples_dropped_total
+
+QUANTILES = (0.01, 0.05, 0.25, 0.5, 0.75, 0.95, 0.99)
+
+class KLLSketch:
+    """KLL streaming quantile sketch; keeps O(k) items however many values are added"""
+
+    def __init__(self, k: int = 200, seed: Optional[int] = None):
+        self.k = k
+        self.count = 0
+        self._compactors: List[List[float]] = [[]]
+        self._size = 0
+        self._max_size = self._capacity(0)
+        self._random = random.Random(seed)
+
+    def _capacity(self, level: int) -> int:
+        depth = len(self._compactors) - level - 1
+        return int(math.ceil(self.k * (2 / 3) ** depth)) + 1
+
+    def update(self, value: float):
+        self._compactors[0].append(value)
+        self._size += 1
+        self.count += 1
+        if self._size >= self._max_size:
+            self._compress()
+
+    def _compress(self):
+        for level, items in enumerate(self._compactors):
+            if len(items) >= self._capacity(level):
+                if level + 1 == len(self._compactors):
+                    self._compactors.append([])
+                    self._max_size = sum(self._capacity(h) for h in range(len(self._compactors)))
+                # Keep every other sorted item at double the weight; an odd item stays behind
+                items.sort()
+                leftover = [items.pop()] if len(items) % 2 else []
+                offset = 1 if self._random.random() < 0.5 else 0
+                self._compactors[level + 1].extend(items[offset::2])
+                self._compactors[level] = leftover
+                self._size = sum(len(c) for c in self._compactors)
+                if self._size < self._max_size:
+                    break
+
+    def weighted_items(self):
+        """(value, weight) pairs summarizing every value added."""
+        return [(value, 1 << level) for level, items in enumerate(self._compactors) for value in items]
+
+def weighted_quantiles(items, quantiles):
+    """Quantiles of (value, weight) pairs, e.g. from one or more sketches."""
+    if not items:
+        return [math.nan for _ in quantiles]
+    items = sorted(items)
+    total = sum(weight for _, weight in items)
+    results = []
+    index = 0
+    cumulative = items[0][1]
+    for q in sorted(quantiles):
+        while cumulative < q * total and index + 1 < len(items):
+            index += 1
+            cumulative += items[index][1]
+        results.append(items[index][0])
+    return results
+
+class _Window:
+    """Sketch, histogram and moments of a bounded run of values"""
+
+    __slots__ = ('sketch', 'bins', 'count', 'total', 'total_sq')
+
+    def __init__(self, bin_count: int, k: int):
+        self.sketch = KLLSketch(k)
+        self.bins = [0] * bin_count
+        self.count = 0
+        self.total = 0.0
+        self.total_sq = 0.0
+
+class FeatureStats:
+    """Distribution of one feature: lifetime totals plus the current and previous window"""
+
+    def __init__(self, reference: Dict, window: int, k: int):
+        self.reference = reference
+        self.edges = reference.get('edges') or []
+        self.window = window
+        self.k = k
+        self.count = 0
+        self.total = 0.0
+        self.bins = [0] * (len(self.edges) + 1)
+        self.current = _Window(len(self.bins), k)
+        self.previous: Optional[_Window] = None
+
+    def update(self, value: float):
+        bin_index = bisect_right(self.edges, value)
+        self.count += 1
+        self.total += value
+        self.bins[bin_index] += 1
+        window = self.current
+        window.sketch.update(value)
+        window.bins[bin_index] += 1
+        window.count += 1
+        window.total += value
+        window.total_sq += value * value
+        if window.count >= self.window:
+            self.previous, self.current = window, _Window(len(self.bins), self.k)
+
+    def _windows(self):
+        return [w for w in (self.previous, self.current) if w is not None and w.count]
+
+    def quantiles(self):
+        items = [item for w in self._windows() for item in w.sketch.weighted_items()]
+        return weighted_quantiles(items, QUANTILES)
+
+    def drift(self, min_count: int) -> Optional[float]:
+        """PSI over the reference bins, or the mean shift in training standard deviations."""
+        windows = self._windows()
+        count = sum(w.count for w in windows)
+        if count < min_count:
+            return None
+        if self.edges and self.reference.get('proportions'):
+            psi = 0.0
+            for index, expected in enumerate(self.reference['proportions']):
+                actual = sum(w.bins[index] for w in windows) / count
+                expected, actual = max(expected, 1e-4), max(actual, 1e-4)
+                psi += (actual - expected) * math.log(actual / expected)
+            return psi
+        if self.reference.get('std'):
+            mean = sum(w.total for w in windows) / count
+            return abs(mean - self.reference['mean']) / self.reference['std']
+        return None
+
+class FeatureMonitor:
+    """Feature sketches updated off the request path, exposed as a Prometheus collector"""
+
+    def __init__(self, feature_cols: List[str], reference: Optional[Dict] = None, k: int = 200,
+                 window: int = 10000, queue_size: int = 10000, min_count: int = 100):
+        self.feature_cols = list(feature_cols)
+        self.reference = reference or {}
+        self.method = self.reference.get('method', 'none')
+        self.min_count = min_count
+        self.features = {
+            name: FeatureStats(self.reference.get('features', {}).get(name, {}), window, k)
+            for name in self.feature_cols
+        }
+        self._queue = deque()
+        self._queue_size = queue_size
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='feature-monitor', daemon=True)
+
+    def observe(self, sample: Dict[str, float]):
+        """Queue an input vector; O(1) and never blocks, dropping the vector if the queue is full."""
+        if len(self._queue) >= self._queue_size:
+            metric_feature_samples_dropped_total.inc()
+            return
+        self._queue.append(sample)
+        if len(self._queue) >= 100:
+            self._wakeup.set()
+
+    def _drain(self):
+        with self._lock:
+            while self._queue:
+                sample = self._queue.popleft()
+                for name, stats in self.features.items():
+                    value = sample.get(name)
+                    if value is not None and math.isfinite(value):
+                        stats.update(float(value))
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            self._wakeup.wait(1)
+            self._wakeup.clear()
+            self._drain()
+        self._drain()
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self, timeout: Optional[float] = None):
+        self._stop_event.set()
+        self._wakeup.set()
+        self._thread.join(timeout)
+
+    def drift_scores(self) -> Dict[str, Optional[float]]:
+        with self._lock:
+            return {name: stats.drift(self.min_count) for name, stats in self.features.items()}
+
+    def snapshot(self) -> Dict:
+        """Per-feature count, quantiles and drift score."""
+        with self._lock:
+            features = {}
+            for name, stats in self.features.items():
+                drift = stats.drift(self.min_count)
+                features[name] = {
+                    'count': stats.count,
+                    'quantiles': {str(q): (None if math.isnan(v) else round(v, 4))
+                                  for q, v in zip(QUANTILES, stats.quantiles())},
+                    'drift': None if drift is None else round(drift, 4),
+                }
+            return {'method': self.method, 'pending': len(self._queue), 'features': features}
+
+    def collect(self):
+        """Prometheus collector: per-feature summaries, histograms and drift scores."""
+        with self._lock:
+            summary = Metric('ml_feature_value', 'Distribution of model input features', 'summary')
+            histogram = HistogramMetricFamily(
+                'ml_feature_histogram', 'Model input features over the training reference bins',
+                labels=['feature']
+            )
+            drift = GaugeMetricFamily(
+                'ml_feature_drift_score', 'Drift of a model input feature from its training reference',
+                labels=['feature', 'method']
+            )
+            for name, stats in self.features.items():
+                for q, value in zip(QUANTILES, stats.quantiles()):
+                    summary.add_sample('ml_feature_value', {'feature': name, 'quantile': str(q)}, value)
+                summary.add_sample('ml_feature_value_count', {'feature': name}, stats.count)
+                summary.add_sample('ml_feature_value_sum', {'feature': name}, stats.total)
+
+                if stats.edges:
+                    cumulative = 0
+                    buckets = []
+                    for edge, count in zip(stats.edges + [math.inf], stats.bins):
+                        cumulative += count
+                        buckets.append(('+Inf' if edge == math.inf else repr(edge), cumulative))
+                    histogram.add_metric([name], buckets, stats.total)
+
+                score = stats.drift(self.min_count)
+                if score is not None:
+                    drift.add_metric([name, self.method], score)
+        yield summary
+        yield histogram
+        yield drift
+
+def build_reference(rows: List[Dict[str, float]], feature_cols: List[str], bins: int = 10) -> Dict:
+    """Reference snapshot from training rows: decile bin edges and the share of rows in each bin."""
+    features = {}
+    for name in feature_cols:
+        values = sorted(float(row[name]) for row in rows if row.get(name) is not None)
+        if not values:
+            continue
+        edges = sorted({values[int(len(values) * i / bins)] for i in range(1, bins)})
+        counts = [0] * (len(edges) + 1)
+        for value in values:
+            counts[bisect_right(edges, value)] += 1
+        mean = math.fsum(values) / len(values)
+        features[name] = {
+            'edges': edges,
+            'proportions': [count / len(values) for count in counts],
+            'mean': mean,
+            'std': math.sqrt(math.fsum((v - mean) ** 2 for v in values) / len(values)),
+        }
+    return {'method': 'psi', 'rows': len(rows), 'features': features}
+
+def reference_from_scaler(scaler, feature_cols: List[str]) -> Dict:
+    """Reference snapshot from the training mean and scale stored in a fitted StandardScaler."""
+    return {
+        'method': 'mean_shift',
+        'rows': int(getattr(scaler, 'n_samples_seen_', 0)),
+        'features': {
+            name: {'mean': float(mean), 'std': float(scale)}
+            for name, mean, scale in zip(feature_cols, scaler.mean_, scaler.scale_)
+        },
+    }
+
+def load_reference(path: str, scaler=None, feature_cols: Optional[List[str]] = None) -> Optional[Dict]:
+    """The reference file if present, else a mean/scale reference from the scaler."""
+    if path and os.path.exists(path):
+        with open(path) as f:
+            return json.load(f)
+    if scaler is not None and feature_cols is not None and hasattr(scaler, 'mean_'):
+        return reference_from_scaler(scaler, feature_cols)
+    return None
+
+def main():
+    parser = argparse.ArgumentParser(description='Build the training-time feature reference used for drift scores.')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    reference = subparsers.add_parser('reference', help='Build a reference snapshot from training data (CSV)')
+    reference.add_argument('csv', help='Training data with one column per model feature')
+    reference.add_argument('--features', default='feature_cols_final.joblib', help='Feature column list')
+    reference.add_argument('--bins', type=int, default=10)
+    reference.add_argument('--out', default='feature_reference.json')
+    args = parser.parse_args()
+
+    import joblib
+    import pandas as pd
+
+    feature_cols = joblib.load(args.features)
+    frame = pd.read_csv(args.csv, usecols=feature_cols)
+    snapshot = build_reference(frame.to_dict('records'), feature_cols, args.bins)
+    with open(args.out, 'w') as f:
+        json.dump(snapshot, f, indent=2)
+    print(f"✅ Reference for {len(snapshot['features'])} features from {snapshot['rows']} rows written to {args.out}")
+
+if __name__ == "__main__":
+    main()
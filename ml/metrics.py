@@ -0,0 +1,20 @@
+from prometheus_client import Counter, Gauge, CollectorRegistry
+
+# Prometheus metrics registry and metrics of the ML service
+registry = CollectorRegistry()
+metric_feature_samples_dropped_total = Counter(
+    'ml_feature_samples_dropped_total',
+    'Feature vectors not added to the distribution sketches because the monitor queue was full',
+    registry=registry,
+)
+metric_prediction_log_rows_total = Counter(
+    'ml_prediction_log_rows_total',
+    'Predictions handled by the prediction log, by outcome (written, dropped, failed)',
+    ['status'],
+    registry=registry,
+)
+metric_prediction_log_buffered = Gauge(
+    'ml_prediction_log_buffered',
+    'Predictions waiting in memory to be written to the prediction log',
+    registry=registry,
+)
@@ -0,0 +1,256 @@
+"""
+Append-only columnar log of model predictions for audit and retraining.
+
+Endpoints hand each prediction to PredictionLogger.log(), which only puts it
+in a bounded in-memory buffer. A background asyncio task takes batches from
+the buffer and hands them to the Parquet writer on a worker thread, so
+requests never wait for disk I/O. The writer writes a row group only once
+batch_size rows are pending (or the file is closed), so files hold a few
+large row groups at any request rate. When the buffer is full the 'drop'
+policy discards the new record (counted in ml_prediction_log_rows_total) and
+the 'block' policy makes the request wait for space.
+
+Files rotate by row count and age. A file is written as
+predictions-<start>-<n>.parquet.tmp and renamed once its footer is written,
+so readers only ever see complete files:
+
+    pd.read_parquet('prediction_logs', columns=['predicted_class', 'ph_value'])
+
+pyarrow is imported when a logger is created rather than with this module,
+so the API can answer /health before it is loaded.
+"""
+
+import asyncio
+import hashlib
+import os
+import time
+from collections import deque
+from datetime import datetime, timezone
+from functools import partial
+from typing import Any, Dict, List, Optional
+
+from metrics import metric_prediction_log_rows_total, metric_prediction_log_buffered
+
+POLICIES = ('drop', 'block')
+
+def model_version(path: str) -> str:
+    """MODEL_VERSION if set, else the model file name and a hash of its contents."""
+    if os.getenv("MODEL_VERSION"):
+        return os.environ["MODEL_VERSION"]
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return f"{os.path.splitext(os.path.basename(path))[0]}@{digest.hexdigest()[:12]}"
+
+def prediction_schema(feature_cols: List[str]):
+    """One column per input feature, so offline scans read only the columns they need."""
+    import pyarrow as pa
+
+    return pa.schema(
+        [
+            ('logged_at', pa.timestamp('ms', tz='UTC')),
+            ('endpoint', pa.string()),
+            ('model_version', pa.string()),
+        ]
+        + [(name, pa.float64()) for name in feature_cols]
+        + [
+            ('predicted_class', pa.int32()),
+            ('confidence', pa.float64()),
+            ('is_safe', pa.bool_()),
+            ('health_risks', pa.list_(pa.string())),
+            ('humidity', pa.float64()),
+            ('temperature_celsius', pa.float64()),
+            ('severity', pa.string()),
+        ]
+    )
+
+class ParquetRotatingWriter:
+    """Collects records into row groups of row_group_rows, starting a new file by size or age"""
+
+    def __init__(self, directory: str, schema, rotate_rows: int, rotate_seconds: float, row_group_rows: int):
+        self.directory = directory
+        self.schema = schema
+        self.rotate_rows = rotate_rows
+        self.rotate_seconds = rotate_seconds
+        self.row_group_rows = row_group_rows
+        self.files_written = 0
+        self._writer = None
+        self._path = None
+        self._rows = 0
+        self._pending: List[Dict[str, Any]] = []
+        self._started_at = None  # When the first record of the current file arrived
+        os.makedirs(directory, exist_ok=True)
+
+    @property
+    def pending(self) -> int:
+        return len(self._pending)
+
+    def _open(self):
+        import pyarrow.parquet as pq
+
+        stamp = datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+        self._path = os.path.join(self.directory, f"predictions-{stamp}-{self.files_written:04d}.parquet")
+        self._writer = pq.ParquetWriter(f"{self._path}.tmp", self.schema, compression='zstd')
+        self._rows = 0
+
+    def _flush(self) -> int:
+        """Write the pending records as one row group; they are discarded if that fails."""
+        if not self._pending:
+            return 0
+        import pyarrow as pa
+
+        records, self._pending = self._pending, []
+        if self._writer is None:
+            self._open()
+        self._writer.write_table(pa.Table.from_pylist(records, schema=self.schema))
+        self._rows += len(records)
+        return len(records)
+
+    def close(self) -> int:
+        """Write the pending records, finish the current file and make it visible under its final name."""
+        written = self._flush()
+        self._started_at = None
+        if self._writer is not None:
+            self._writer.close()
+            os.replace(f"{self._path}.tmp", self._path)
+            self._writer = None
+            self.files_written += 1
+        return written
+
+    def write(self, records: List[Dict[str, Any]]) -> int:
+        """Add records (none just checks the file's age); returns how many rows reached the file."""
+        written = 0
+        if self._started_at is not None and time.monotonic() - self._started_at >= self.rotate_seconds:
+            written += self.close()
+        if records and self._started_at is None:
+            self._started_at = time.monotonic()
+        self._pending.extend(records)
+        if len(self._pending) >= self.row_group_rows or self._rows + len(self._pending) >= self.rotate_rows:
+            written += self._flush()
+        if self._rows >= self.rotate_rows:
+            written += self.close()
+        return written
+
+class PredictionLogger:
+    """Bounded buffer of predictions flushed to rotating Parquet files by a background task"""
+
+    def __init__(self, directory: str, feature_cols: List[str], model_version: str,
+                 batch_size: int = 1000, flush_interval: float = 5.0, max_buffer: int = 10000,
+                 policy: str = 'drop', rotate_rows: int = 100000, rotate_seconds: float = 3600):
+        if policy not in POLICIES:
+            raise ValueError(f"Invalid policy: {policy}. Must be one of {POLICIES}")
+        self.feature_cols = list(feature_cols)
+        try:
+            schema = prediction_schema(self.feature_cols)
+        except ImportError:  # Logging is disabled without pyarrow
+            raise RuntimeError("pyarrow is not installed. Install it with: pip install pyarrow") from None
+        self.model_version = model_version
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_buffer = max_buffer
+        self.policy = policy
+        self.writer = ParquetRotatingWriter(directory, schema, rotate_rows, rotate_seconds, batch_size)
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+        self._buffer = deque()
+        self._task: Optional[asyncio.Task] = None
+        self._space = None
+        self._batch_ready = None
+        self._stopping = False
+
+    def _record(self, endpoint: str, features: Dict[str, float], prediction: Dict[str, Any],
+                extra: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        record = {
+            'logged_at': datetime.now(timezone.utc),
+            'endpoint': endpoint,
+            'model_version': self.model_version,
+            'predicted_class': prediction['predicted_class'],
+            'confidence': prediction['confidence'],
+            'is_safe': prediction['is_safe'],
+            'health_risks': prediction['health_risks'],
+        }
+        for name in self.feature_cols:
+            record[name] = features.get(name)
+        if extra:
+            record.update(extra)
+        return record
+
+    async def log(self, endpoint: str, features: Dict[str, float], prediction: Dict[str, Any],
+                  extra: Optional[Dict[str, Any]] = None):
+        """Buffer one prediction; only waits when the buffer is full and the policy is 'block'."""
+        if self._stopping:
+            return
+        while len(self._buffer) >= self.max_buffer:
+            if self.policy == 'drop':
+                self.dropped += 1
+                metric_prediction_log_rows_total.labels(status='dropped').inc()
+                return
+            self._space.clear()
+            await self._space.wait()
+        self._buffer.append(self._record(endpoint, features, prediction, extra))
+        metric_prediction_log_buffered.set(len(self._buffer))
+        if len(self._buffer) >= self.batch_size:
+            self._batch_ready.set()
+
+    def _take_batch(self) -> List[Dict[str, Any]]:
+        count = min(len(self._buffer), self.batch_size)
+        batch = [self._buffer.popleft() for _ in range(count)]
+        metric_prediction_log_buffered.set(len(self._buffer))
+        self._space.set()
+        return batch
+
+    async def _write(self, batch: List[Dict[str, Any]], close: bool = False):
+        loop = asyncio.get_running_loop()
+        # Rows the writer holds for its next row group are lost with the batch if a write fails
+        at_risk = self.writer.pending + len(batch)
+        try:
+            # Parquet encoding and disk I/O run on a worker thread, off the event loop
+            write = self.writer.close if close else partial(self.writer.write, batch)
+            written = await loop.run_in_executor(None, write)
+            self.written += written
+            metric_prediction_log_rows_total.labels(status='written').inc(written)
+        except Exception as e:
+            self.failed += at_risk
+            metric_prediction_log_rows_total.labels(status='failed').inc(at_risk)
+            print(f"❌ Failed to write {at_risk} predictions to the log: {e}")
+
+    async def _run(self):
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._batch_ready.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._batch_ready.clear()
+            # Runs even with nothing buffered, so a quiet file still rotates by age
+            await self._write(self._take_batch())
+            while len(self._buffer) >= self.batch_size:
+                await self._write(self._take_batch())
+
+    def start(self):
+        """Start the background writer task on the running event loop."""
+        self._space = asyncio.Event()
+        self._batch_ready = asyncio.Event()
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        """Write everything buffered and close the current file."""
+        self._stopping = True
+        if self._task is not None:
+            self._batch_ready.set()
+            await self._task
+        while self._buffer:
+            await self._write(self._take_batch())
+        await self._write([], close=True)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'buffered': len(self._buffer) + self.writer.pending,
+            'written': self.written,
+            'dropped': self.dropped,
+            'failed': self.failed,
+            'files': self.writer.files_written,
+            'policy': self.policy,
+            'model_version': self.model_version,
+        }
@@ -0,0 +1,320 @@
+"""
+Pre-fork launcher for running the ML API with one worker per core.
+
+`uvicorn app:app --workers N` starts N fresh interpreters, and each one loads
+the model on its own, so memory grows with every worker. This launcher loads
+the model, scaler and mock data generator once in the master, then forks the
+workers so they share those pages copy-on-write:
+
+- the cyclic GC is disabled while loading and everything loaded is moved to
+  the permanent generation with gc.freeze() before forking, so collections in
+  the workers never write to (and so unshare) the pages of inherited objects
+- large NumPy arrays in the model are moved into one shared memory block and
+  made read-only, so they stay shared for the life of the workers and an
+  accidental write fails instead of silently copying the pages
+
+The master binds the socket, restarts workers that die and reports each
+worker's start-up time and memory (RSS, and PSS, which counts shared pages
+once across the processes sharing them):
+
+    python prefork.py --workers 4 --port 8001
+
+The alert evaluator keeps per-sensor state (confirm streaks, suppression
+windows), so /alert is answered by worker 0 only: it also listens on a Unix
+socket held by the master, and the other workers forward /alert to it. A
+SIGHUP to the master is passed on to reload the alert thresholds.
+
+Batch scoring jobs are scored by worker 0 only; the others submit and look
+them up in the shared job directory. Other per-worker state (feature
+sketches, prediction log) is not shared; each worker writes its prediction
+log to its own subdirectory.
+"""
+
+import gc
+
+gc.disable()  # Before the heavy imports, so loading does not leave freed holes in shared pages
+
+import argparse
+import asyncio
+import os
+import random
+import select
+import signal
+import shutil
+import socket
+import tempfile
+import time
+from multiprocessing import shared_memory
+from typing import Dict, Optional
+
+import numpy as np
+
+_ALIGNMENT = 64
+
+def _large_arrays(obj, min_bytes: int, seen: set, depth: int = 0):
+    """(container, key, array) for every large numeric array reachable through attributes, lists and dicts."""
+    if depth > 12 or id(obj) in seen:
+        return
+    seen.add(id(obj))
+    if isinstance(obj, dict):
+        items = list(obj.items())
+    elif isinstance(obj, list):
+        items = list(enumerate(obj))
+    elif hasattr(obj, '__dict__') and not isinstance(obj, type) and not callable(obj):
+        items = [(key, value) for key, value in vars(obj).items()]
+        obj = vars(obj)
+    else:
+        return
+    for key, value in items:
+        if isinstance(value, np.ndarray):
+            if value.nbytes >= min_bytes and value.dtype != object and id(value) not in seen:
+                seen.add(id(value))
+                yield obj, key, value
+        else:
+            yield from _large_arrays(value, min_bytes, seen, depth + 1)
+
+def share_arrays(obj, min_bytes: int = 64 * 1024) -> Optional[shared_memory.SharedMemory]:
+    """
+    Move the large NumPy arrays of an object (e.g. a fitted model) into one shared memory block.
+    Arrays are replaced by read-only views on the block; returns the block, or None if nothing moved.
+    """
+    found = list(_large_arrays(obj, min_bytes, set()))
+    if not found:
+        return None
+    offsets = []
+    size = 0
+    for _, _, array in found:
+        offsets.append(size)
+        size += -(-array.nbytes // _ALIGNMENT) * _ALIGNMENT
+    block = shared_memory.SharedMemory(create=True, size=size)
+    for (container, key, array), offset in zip(found, offsets):
+        order = 'F' if array.flags.f_contiguous and not array.flags.c_contiguous else 'C'
+        view = np.ndarray(array.shape, array.dtype, buffer=block.buf, offset=offset, order=order)
+        view[...] = array
+        view.flags.writeable = False
+        container[key] = view
+    print(f"✅ Moved {len(found)} model arrays ({size / 2**20:.1f} MiB) to shared memory")
+    return block
+
+def process_memory(pid: int) -> Dict[str, Optional[int]]:
+    """RSS and PSS of a process in KiB, from /proc (None where unavailable)."""
+    memory = {'rss_kb': None, 'pss_kb': None}
+    for path, fields in ((f'/proc/{pid}/status', {'VmRSS:': 'rss_kb'}),
+                         (f'/proc/{pid}/smaps_rollup', {'Pss:': 'pss_kb'})):
+        try:
+            with open(path) as f:
+                for line in f:
+                    parts = line.split()
+                    if parts and parts[0] in fields:
+                        memory[fields[parts[0]]] = int(parts[1])
+        except OSError:
+            pass
+    return memory
+
+def _format_kb(value: Optional[int]) -> str:
+    return 'n/a' if value is None else f"{value / 1024:.1f} MiB"
+
+class PreforkServer:
+    """Loads the app once, forks the workers and keeps them running"""
+
+    def __init__(self, host: str, port: int, workers: int, share_min_bytes: int, report_interval: float):
+        self.host = host
+        self.port = port
+        self.workers = workers
+        self.share_min_bytes = share_min_bytes
+        self.report_interval = report_interval
+        self.children: Dict[int, int] = {}          # pid -> worker index
+        self.startup_seconds: Dict[int, float] = {}
+        self.shared_block = None
+        self.sock = None
+        self.alert_sock = None
+        self.alert_socket_path = None
+        self._ready_read, self._ready_write = os.pipe()
+        self._stopping = False
+
+    def load(self):
+        import app
+
+        started = time.perf_counter()
+        app.load_components()
+        self.shared_block = share_arrays(app.model, self.share_min_bytes)
+        gc.collect()
+        gc.freeze()  # Everything loaded so far is left alone by the workers' collections
+        print(f"✅ Master loaded the model in {time.perf_counter() - started:.2f}s "
+              f"({gc.get_freeze_count()} objects frozen, {_format_kb(process_memory(os.getpid())['rss_kb'])} RSS)")
+
+    def bind(self):
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sock.bind((self.host, self.port))
+        self.sock.listen(2048)
+        self.sock.set_inheritable(True)
+
+        # Held by the master so a restarted worker 0 takes over the same path
+        self.alert_socket_path = os.path.join(tempfile.mkdtemp(prefix='prefork-'), 'alert.sock')
+        self.alert_sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.alert_sock.bind(self.alert_socket_path)
+        self.alert_sock.listen(2048)
+        self.alert_sock.set_inheritable(True)
+
+    def spawn(self, index: int):
+        forked_at = time.perf_counter()
+        pid = os.fork()
+        if pid:
+            self.children[pid] = index
+            return
+        try:
+            os.close(self._ready_read)
+            self._run_worker(index, forked_at)
+            os._exit(0)
+        except BaseException as e:
+            print(f"❌ Worker {index} failed: {e}")
+            os._exit(1)
+
+    def _run_worker(self, index: int, forked_at: float):
+        master_pid = os.getppid()
+        gc.enable()
+        random.seed()  # Otherwise every worker would generate the same mock data
+        for sig in (signal.SIGTERM, signal.SIGINT, signal.SIGHUP):
+            signal.signal(sig, signal.SIG_DFL)
+        base = os.getenv("PREDICTION_LOG_DIR", "prediction_logs")
+        os.environ["PREDICTION_LOG_DIR"] = os.path.join(base, f"worker-{index}")
+        if index == 0:
+            sockets = [self.sock, self.alert_sock]
+        else:
+            sockets = [self.sock]
+            self.alert_sock.close()
+            os.environ["ALERT_FORWARD_SOCKET"] = self.alert_socket_path
+            # Batch jobs are stored in BATCH_JOB_DIR, where every worker can look them up; only worker 0 scores them
+            os.environ["BATCH_WORKERS"] = "0"
+
+        import uvicorn
+        import app
+
+        server = uvicorn.Server(uvicorn.Config(app.app, log_level="info"))
+
+        async def serve():
+            task = asyncio.ensure_future(server.serve(sockets=sockets))
+            while not server.started and not task.done():
+                await asyncio.sleep(0.01)
+            if server.started:
+                os.write(self._ready_write, f"{os.getpid()} {time.perf_counter() - forked_at:.6f}\n".encode())
+            while not task.done():
+                if os.getppid() != master_pid:
+                    server.should_exit = True  # The master died; do not keep serving unsupervised
+                await asyncio.wait({task}, timeout=1.0)
+            await task
+
+        asyncio.run(serve())
+
+    def report(self):
+        print(f"{'worker':>6} {'pid':>8} {'startup':>9} {'rss':>12} {'pss':>12}")
+        for pid, index in sorted(self.children.items(), key=lambda item: item[1]):
+            memory = process_memory(pid)
+            startup = self.startup_seconds.get(pid)
+            print(f"{index:>6} {pid:>8} {'starting' if startup is None else f'{startup:.3f}s':>9} "
+                  f"{_format_kb(memory['rss_kb']):>12} {_format_kb(memory['pss_kb']):>12}")
+        master = process_memory(os.getpid())
+        print(f"{'master':>6} {os.getpid():>8} {'':>9} {_format_kb(master['rss_kb']):>12} "
+              f"{_format_kb(master['pss_kb']):>12}")
+
+    def _read_ready(self, buffer: bytes) -> bytes:
+        buffer += os.read(self._ready_read, 4096)
+        *lines, buffer = buffer.split(b'\n')
+        for line in lines:
+            pid, seconds = line.split()
+            self.startup_seconds[int(pid)] = float(seconds)
+            print(f"✅ Worker {self.children.get(int(pid))} (pid {int(pid)}) ready in {float(seconds):.3f}s")
+        if len(self.startup_seconds) >= len(self.children) and lines:
+            self.report()
+        return buffer
+
+    def _reap(self):
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            index = self.children.pop(pid, None)
+            self.startup_seconds.pop(pid, None)
+            if index is not None and not self._stopping:
+                print(f"⚠️ Worker {index} (pid {pid}) exited with status {os.waitstatus_to_exitcode(status)}, restarting")
+                time.sleep(1)  # Avoid a tight restart loop if workers fail on start-up
+                self.spawn(index)
+
+    def _stop(self, *_):
+        self._stopping = True
+
+    def _reload(self, *_):
+        for pid in list(self.children):
+            try:
+                os.kill(pid, signal.SIGHUP)
+            except ProcessLookupError:
+                pass
+
+    def run(self):
+        self.load()
+        self.bind()
+        signal.signal(signal.SIGTERM, self._stop)
+        signal.signal(signal.SIGINT, self._stop)
+        signal.signal(signal.SIGHUP, self._reload)
+        for index in range(self.workers):
+            self.spawn(index)
+        print(f"✅ Serving on http://{self.host}:{self.port} with {self.workers} workers")
+
+        buffer = b''
+        last_report = time.monotonic()
+        try:
+            while not self._stopping:
+                try:
+                    readable, _, _ = select.select([self._ready_read], [], [], 1.0)
+                except InterruptedError:
+                    continue
+                if readable:
+                    buffer = self._read_ready(buffer)
+                self._reap()
+                if self.report_interval and time.monotonic() - last_report >= self.report_interval:
+                    self.report()
+                    last_report = time.monotonic()
+        finally:
+            self.shutdown()
+
+    def shutdown(self):
+        self._stopping = True
+        print("Stopping workers...")
+        for pid in list(self.children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        deadline = time.monotonic() + 30
+        while self.children and time.monotonic() < deadline:
+            self._reap()
+            time.sleep(0.1)
+        for pid in list(self.children):
+            os.kill(pid, signal.SIGKILL)
+        self._reap()
+        if self.shared_block is not None:
+            self.shared_block.unlink()  # The model still holds views on it, so it is not closed
+        if self.alert_socket_path is not None:
+            self.alert_sock.close()
+            shutil.rmtree(os.path.dirname(self.alert_socket_path), ignore_errors=True)
+        print("✅ All workers stopped")
+
+def main():
+    parser = argparse.ArgumentParser(description='Run the ML API with pre-forked workers sharing one loaded model.')
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=8001)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='Worker processes (default: one per core)')
+    parser.add_argument('--share-min-bytes', type=int, default=64 * 1024,
+                        help='Model arrays at least this large are moved to shared memory')
+    parser.add_argument('--report-interval', type=float, default=0,
+                        help='Print per-worker memory every N seconds (0: only once all workers are ready)')
+    args = parser.parse_args()
+
+    PreforkServer(args.host, args.port, args.workers, args.share_min_bytes, args.report_interval).run()
+
+if __name__ == "__main__":
+    main()
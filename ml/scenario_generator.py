@@ -0,0 +1,479 @@
+"""
+Time-correlated synthetic sensor streams for soak tests.
+
+MockDataGenerator draws each sample independently. This module produces
+streams that look like real deployments over days:
+
+- a diurnal temperature cycle with humidity moving the opposite way, plus
+  a monsoon period of raised humidity and slow seasonal drift
+- noise that is correlated in time (AR(1)) and between the two channels
+- water quality that wanders slowly around a per-sensor baseline within the
+  normal ranges, is pushed up by very humid conditions, and moves into the
+  contaminated ranges during injected contamination events
+- sensor faults: stuck values, spikes, dropouts and calibration drift
+
+Readings are produced lazily, in timestamp order across all sensors, so
+memory is O(sensors) however long the scenario is. Each reading carries
+its ground truth (`event`, `fault`) for checking what the services made of it.
+
+A scenario can be written to a JSON-lines file, or replayed at a speed-up
+factor against the ML service (/alert, /predict) or the sensors MQTT bridge:
+
+    python scenario_generator.py generate --sensors 1000 --days 3 --out scenario.jsonl.gz
+    python scenario_generator.py replay --sensors 500 --days 3 --interval 300 --speedup 1440 --target alert
+    python scenario_generator.py replay --from scenario.jsonl.gz --speedup 720 --target mqtt
+"""
+
+import argparse
+import gzip
+import json
+import math
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, asdict, fields
+from typing import Dict, Iterable, Iterator, List, Optional
+
+from mock_data_generator import MockDataGenerator
+
+DAY = 86400.0
+
+# Water quality parameters pushed up by very humid conditions (run-off, bacterial growth)
+_HUMIDITY_SENSITIVE = ('turbidity_value', 'total_coliform_value', 'ammonia_nitrogen_value',
+                       'total_suspended_solids_value')
+
+FAULTS = ('stuck', 'spike', 'dropout', 'drift')
+
+@dataclass
+class ScenarioConfig:
+    """Shape of a synthetic scenario; every reading is determined by these and the seed"""
+    sensors: int = 100
+    days: float = 3.0
+    interval_seconds: float = 60.0          # Time between readings of one sensor
+    start: Optional[float] = None           # Unix time of the first reading (default: ends now)
+    seed: int = 0
+    temperature_mean: float = 28.0
+    temperature_amplitude: float = 6.0      # Half the day-night swing (°C)
+    humidity_mean: float = 62.0
+    humidity_amplitude: float = 15.0        # Half the day-night swing (%), opposite to temperature
+    sensor_spread: float = 1.5              # Standard deviation of per-sensor offsets
+    noise: float = 0.6                      # Standard deviation of the AR(1) noise
+    noise_correlation: float = 0.9          # AR(1) coefficient per reading
+    channel_correlation: float = -0.6       # Correlation of the humidity and temperature noise
+    seasonal_drift_per_day: float = 0.3     # °C per day
+    monsoon_start_day: float = 1.0          # Set below 0 or beyond `days` for no monsoon
+    monsoon_days: float = 1.0
+    monsoon_humidity: float = 20.0          # Humidity added at the height of the monsoon (%)
+    contamination_per_sensor_day: float = 0.05
+    contamination_hours: float = 12.0
+    fault_per_sensor_day: float = 0.05
+    fault_hours: float = 2.0
+    water_quality: bool = True              # Include the 16 water quality parameters
+
+    def validate(self):
+        if self.sensors < 1 or self.days <= 0 or self.interval_seconds <= 0:
+            raise ValueError("sensors, days and interval_seconds must be positive")
+        if not -1 < self.channel_correlation < 1 or not 0 <= self.noise_correlation < 1:
+            raise ValueError("channel_correlation must be in (-1, 1) and noise_correlation in [0, 1)")
+
+class _SensorState:
+    """Evolving state of one virtual sensor"""
+
+    __slots__ = ('device_id', 'temperature_offset', 'humidity_offset', 'noise_t', 'noise_h',
+                 'baseline', 'level', 'event_start', 'event_end', 'fault', 'fault_since', 'fault_end',
+                 'fault_drift', 'last')
+
+    def __init__(self, device_id: str, rng: random.Random, config: ScenarioConfig, params: List[str]):
+        self.device_id = device_id
+        self.temperature_offset = rng.gauss(0, config.sensor_spread)
+        self.humidity_offset = rng.gauss(0, config.sensor_spread * 2)
+        self.noise_t = 0.0
+        self.noise_h = 0.0
+        # Position of each water quality parameter within its normal range (0-1), in `params` order
+        self.baseline = [rng.uniform(0.2, 0.8) for _ in params]
+        self.level = list(self.baseline)
+        self.event_start = self.event_end = None
+        self.fault = None
+        self.fault_since = 0.0
+        self.fault_end = 0.0
+        self.fault_drift = 0.0
+        self.last = None
+
+class ScenarioGenerator:
+    """Lazily generates correlated readings for many virtual sensors"""
+
+    def __init__(self, config: ScenarioConfig):
+        config.validate()
+        self.config = config
+        reference = MockDataGenerator()
+        self.normal_ranges = reference.normal_ranges
+        self.contaminated_ranges = reference.contaminated_ranges
+        self.params = list(self.normal_ranges) if config.water_quality else []
+        # (name, normal low, normal span, contaminated low, contaminated span, humidity sensitive) per parameter
+        self._param_ranges = [
+            (name, self.normal_ranges[name][0], self.normal_ranges[name][1] - self.normal_ranges[name][0],
+             self.contaminated_ranges[name][0], self.contaminated_ranges[name][1] - self.contaminated_ranges[name][0],
+             name in _HUMIDITY_SENSITIVE)
+            for name in self.params
+        ]
+        self.start = config.start if config.start is not None else math.floor(time.time() - config.days * DAY)
+        self.steps = int(config.days * DAY / config.interval_seconds)
+
+    def __len__(self) -> int:
+        return self.steps * self.config.sensors
+
+    def _climate(self, t: float):
+        """Mean temperature and humidity at time t, before per-sensor offsets and noise."""
+        c = self.config
+        day = (t - self.start) / DAY
+        hour = (t % DAY) / 3600 + 5.5  # Local time (IST)
+        cycle = math.sin(2 * math.pi * (hour - 9) / 24)  # Warmest mid-afternoon, coolest before dawn
+        temperature = c.temperature_mean + c.temperature_amplitude * cycle + c.seasonal_drift_per_day * day
+        humidity = c.humidity_mean - c.humidity_amplitude * cycle
+        if c.monsoon_days > 0 and c.monsoon_start_day <= day < c.monsoon_start_day + c.monsoon_days:
+            # Rises and falls over the monsoon period
+            humidity += c.monsoon_humidity * math.sin(math.pi * (day - c.monsoon_start_day) / c.monsoon_days)
+        return temperature, humidity
+
+    def _event_severity(self, state: _SensorState, t: float) -> float:
+        """Contamination 0-1: ramps up over the first fifth of the event, holds, then decays."""
+        if state.event_end is None or t >= state.event_end:
+            return 0.0
+        length = state.event_end - state.event_start
+        progress = (t - state.event_start) / length
+        if progress < 0.2:
+            return progress / 0.2
+        if progress > 0.7:
+            return (1 - progress) / 0.3
+        return 1.0
+
+    def _maybe_start(self, state: _SensorState, rng: random.Random, t: float):
+        c = self.config
+        per_step = c.interval_seconds / DAY
+        if (state.event_end is None or t >= state.event_end) and rng.random() < c.contamination_per_sensor_day * per_step:
+            state.event_start = t
+            state.event_end = t + rng.uniform(0.5, 1.5) * c.contamination_hours * 3600
+        if state.fault is not None and t >= state.fault_end and state.fault != 'drift':
+            state.fault = None
+        if state.fault is None and rng.random() < c.fault_per_sensor_day * per_step:
+            state.fault = rng.choice(FAULTS)
+            state.fault_since = t
+            state.fault_end = t + rng.uniform(0.5, 1.5) * c.fault_hours * 3600
+            if state.fault == 'drift':
+                # Calibration drift persists until the end of the scenario, growing steadily
+                state.fault_drift = rng.choice((-1, 1)) * rng.uniform(0.5, 2.0) / 3600
+
+    def _water_quality(self, state: _SensorState, rng: random.Random, humidity: float, severity: float) -> Dict[str, float]:
+        values = {}
+        wetness = 0.4 * min(max((humidity - 75) / 25, 0.0), 1.0)
+        baseline, levels, uniform = state.baseline, state.level, rng.random
+        for index, (name, low, span, contaminated_low, contaminated_span, sensitive) in enumerate(self._param_ranges):
+            # Slow mean-reverting wander around the sensor's baseline (uniform steps with a std of 0.02,
+            # much cheaper than 16 gauss() calls per reading)
+            level = baseline[index] + 0.98 * (levels[index] - baseline[index]) + (uniform() - 0.5) * 0.0693
+            level = levels[index] = 0.0 if level < 0.0 else 1.0 if level > 1.0 else level
+            if sensitive and wetness:
+                level = min(level + wetness, 1.0)
+            value = low + level * span
+            if severity:
+                value += severity * (contaminated_low + level * contaminated_span - value)
+            values[name] = round(value, 4)
+        return values
+
+    def readings(self) -> Iterator[Dict]:
+        """Every reading of the scenario in timestamp order, generated on demand."""
+        c = self.config
+        rng = random.Random(c.seed)
+        states = [_SensorState(f"sim-{index + 1:05d}", rng, c, self.params) for index in range(c.sensors)]
+        phi = c.noise_correlation
+        innovation = c.noise * math.sqrt(1 - phi * phi)
+        cross = math.sqrt(1 - c.channel_correlation ** 2)
+        # Sensors report at staggered offsets within each interval, like unsynchronized nodes
+        offsets = [index * c.interval_seconds / c.sensors for index in range(c.sensors)]
+
+        for step in range(self.steps):
+            tick = self.start + step * c.interval_seconds
+            for state, offset in zip(states, offsets):
+                t = tick + offset
+                self._maybe_start(state, rng, t)
+                z_t = rng.gauss(0, 1)
+                z_h = c.channel_correlation * z_t + cross * rng.gauss(0, 1)
+                state.noise_t = phi * state.noise_t + innovation * z_t
+                state.noise_h = phi * state.noise_h + innovation * 2 * z_h
+
+                if state.fault == 'dropout' and t < state.fault_end:
+                    continue
+                temperature_mean, humidity_mean = self._climate(t)
+                temperature = temperature_mean + state.temperature_offset + state.noise_t
+                humidity = humidity_mean + state.humidity_offset + state.noise_h
+                severity = self._event_severity(state, t)
+
+                fault = state.fault
+                if fault == 'stuck' and state.last is not None:
+                    temperature, humidity = state.last
+                elif fault == 'spike':
+                    temperature += rng.choice((-1, 1)) * rng.uniform(15, 30)
+                    state.fault = None  # A spike is a single reading
+                elif fault == 'drift':
+                    temperature += state.fault_drift * (t - state.fault_since)
+                humidity = min(max(humidity, 0.0), 100.0)
+                if fault != 'stuck':
+                    state.last = (temperature, humidity)
+
+                reading = {
+                    'device_id': state.device_id,
+                    'timestamp': round(t, 3),
+                    'humidity': round(humidity, 2),
+                    'temperature_celsius': round(temperature, 2),
+                    'event': 'contamination' if severity > 0 else None,
+                    'fault': fault,
+                }
+                if self.params:
+                    reading['water_quality'] = self._water_quality(state, rng, humidity, severity)
+                yield reading
+
+def write_jsonl(readings: Iterable[Dict], path: str, header: Optional[Dict] = None) -> int:
+    """Write readings as JSON lines (gzip-compressed for a .gz path); returns the count."""
+    opener = gzip.open if path.endswith('.gz') else open
+    count = 0
+    with opener(path, 'wt') as f:
+        if header is not None:
+            f.write(json.dumps({'scenario': header}) + '\n')
+        for reading in readings:
+            f.write(json.dumps(reading, separators=(',', ':')) + '\n')
+            count += 1
+    return count
+
+def read_jsonl(path: str) -> Iterator[Dict]:
+    """Readings from a file written by write_jsonl, one at a time."""
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'rt') as f:
+        for line in f:
+            record = json.loads(line)
+            if 'scenario' not in record:
+                yield record
+
+# --- Replay targets ---
+
+class HttpTarget:
+    """POSTs readings to the ML service from a pool of threads, each with its own session"""
+
+    def __init__(self, url: str, endpoint: str, workers: int = 16, timeout: float = 10.0):
+        import requests
+
+        self.url = url.rstrip('/') + endpoint
+        self.endpoint = endpoint
+        self.timeout = timeout
+        self._requests = requests
+        self._local = threading.local()
+        self._pool = ThreadPoolExecutor(max_workers=workers)
+        self._slots = threading.Semaphore(workers * 4)  # Bound queued requests; replay falls behind instead
+        self._lock = threading.Lock()
+        self.sent = 0
+        self.failed = 0
+        self.latencies: List[float] = []
+
+    def _body(self, reading: Dict) -> Optional[Dict]:
+        if self.endpoint == '/predict':
+            return reading.get('water_quality')
+        return {
+            'device_id': reading['device_id'],
+            'timestamp': reading['timestamp'],
+            'humidity': reading['humidity'],
+            'temperature_celsius': reading['temperature_celsius'],
+        }
+
+    def _post(self, body: Dict):
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = self._local.session = self._requests.Session()
+        start = time.perf_counter()
+        try:
+            ok = session.post(self.url, json=body, timeout=self.timeout).ok
+        except self._requests.RequestException:
+            ok = False
+        with self._lock:
+            self.latencies.append(time.perf_counter() - start)
+            if ok:
+                self.sent += 1
+            else:
+                self.failed += 1
+        self._slots.release()
+
+    def send(self, reading: Dict):
+        body = self._body(reading)
+        if body is None:
+            return
+        self._slots.acquire()
+        self._pool.submit(self._post, body)
+
+    def close(self):
+        self._pool.shutdown(wait=True)
+
+    def stats(self) -> Dict:
+        latencies = sorted(self.latencies)
+
+        def percentile(q):
+            return round(latencies[min(int(q * len(latencies)), len(latencies) - 1)] * 1000, 1) if latencies else None
+        return {'sent': self.sent, 'failed': self.failed, 'p50_ms': percentile(0.5), 'p99_ms': percentile(0.99)}
+
+class MqttTarget:
+    """Publishes readings to the sensors MQTT bridge as sensors/<device>/reading JSON messages"""
+
+    def __init__(self, host: str, port: int = 1883, qos: int = 1):
+        try:
+            import paho.mqtt.client as mqtt
+        except ImportError:
+            raise RuntimeError("paho-mqtt is not installed. Install it with: pip install paho-mqtt")
+
+        self.qos = qos
+        self.client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2, client_id=f"scenario-{random.getrandbits(32):08x}")
+        self.client.max_queued_messages_set(10000)
+        self.client.connect(host, port)
+        self.client.loop_start()
+        self.sent = 0
+
+    def send(self, reading: Dict):
+        payload = {key: reading[key] for key in ('humidity', 'temperature_celsius', 'timestamp')}
+        self.client.publish(f"sensors/{reading['device_id']}/reading", json.dumps(payload), qos=self.qos)
+        self.sent += 1
+
+    def close(self):
+        self.client.loop_stop()
+        self.client.disconnect()
+
+    def stats(self) -> Dict:
+        return {'sent': self.sent}
+
+class CountingTarget:
+    """Discards readings; measures how fast the scenario itself can be generated and paced"""
+
+    def __init__(self):
+        self.sent = 0
+
+    def send(self, reading: Dict):
+        self.sent += 1
+
+    def close(self):
+        pass
+
+    def stats(self) -> Dict:
+        return {'sent': self.sent}
+
+def replay(readings: Iterable[Dict], target, speedup: float = 60.0, report_every: float = 10.0) -> Dict:
+    """
+    Send readings to a target, compressing scenario time by `speedup` (0 = as fast as possible).
+    When the target cannot keep up, replay falls behind schedule rather than dropping readings;
+    the report shows how far behind it got.
+    """
+    wall_start = time.monotonic()
+    scenario_start = None
+    sent = 0
+    max_lag = 0.0
+    last_report = wall_start
+    for reading in readings:
+        if scenario_start is None:
+            scenario_start = reading['timestamp']
+        if speedup > 0:
+            due = wall_start + (reading['timestamp'] - scenario_start) / speedup
+            now = time.monotonic()
+            if due > now:
+                time.sleep(due - now)
+            else:
+                max_lag = max(max_lag, now - due)
+        target.send(reading)
+        sent += 1
+        now = time.monotonic()
+        if report_every and now - last_report >= report_every:
+            last_report = now
+            simulated = reading['timestamp'] - scenario_start
+            print(f"  {sent} readings, {simulated / 3600:.1f}h of scenario in {now - wall_start:.0f}s, "
+                  f"{sent / (now - wall_start):.0f}/s, max lag {max_lag:.2f}s")
+    target.close()
+    elapsed = time.monotonic() - wall_start
+    return {
+        'readings': sent,
+        'seconds': round(elapsed, 2),
+        'rate': round(sent / elapsed, 1) if elapsed else None,
+        'max_lag_seconds': round(max_lag, 3),
+        'target': target.stats(),
+    }
+
+def summarize(readings: Iterable[Dict], expected: Optional[int] = None) -> Dict:
+    """Counts of readings, contamination readings and faults, consuming the stream."""
+    # Dropouts show up as readings missing from the stream rather than as labelled readings
+    summary = {'readings': 0, 'contamination': 0, 'faults': {fault: 0 for fault in FAULTS if fault != 'dropout'},
+               'sensors': set()}
+    for reading in readings:
+        summary['readings'] += 1
+        summary['sensors'].add(reading['device_id'])
+        if reading['event']:
+            summary['contamination'] += 1
+        if reading['fault']:
+            summary['faults'][reading['fault']] += 1
+    summary['sensors'] = len(summary['sensors'])
+    if expected is not None:
+        summary['dropped'] = expected - summary['readings']
+    return summary
+
+def _add_scenario_arguments(parser):
+    for field in fields(ScenarioConfig):
+        flag = '--' + field.name.replace('_', '-')
+        if field.type is bool:
+            parser.add_argument(flag, action=argparse.BooleanOptionalAction, default=field.default)
+        else:
+            parser.add_argument(flag, type=float if field.name == 'start' else field.type, default=field.default)
+    parser.add_argument('--interval', dest='interval_seconds', type=float, help='Alias for --interval-seconds')
+
+def _config(args) -> ScenarioConfig:
+    return ScenarioConfig(**{field.name: getattr(args, field.name) for field in fields(ScenarioConfig)})
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate and replay time-correlated synthetic sensor scenarios.')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    generate = subparsers.add_parser('generate', help='Write a scenario to a JSON-lines file')
+    _add_scenario_arguments(generate)
+    generate.add_argument('--out', default='scenario.jsonl.gz')
+
+    summary = subparsers.add_parser('summary', help='Print counts of readings, events and faults')
+    _add_scenario_arguments(summary)
+
+    replayer = subparsers.add_parser('replay', help='Replay a scenario against a service')
+    _add_scenario_arguments(replayer)
+    replayer.add_argument('--from', dest='source', help='Replay this file instead of generating')
+    replayer.add_argument('--speedup', type=float, default=60.0, help='Scenario seconds per wall-clock second (0 = unpaced)')
+    replayer.add_argument('--target', choices=('alert', 'predict', 'mqtt', 'none'), default='alert')
+    replayer.add_argument('--url', default='http://localhost:8001', help='ML service base URL')
+    replayer.add_argument('--workers', type=int, default=16, help='Concurrent HTTP requests')
+    replayer.add_argument('--broker', default='localhost', help='MQTT broker host')
+    replayer.add_argument('--broker-port', type=int, default=1883)
+    args = parser.parse_args()
+
+    if args.command == 'replay' and args.source:
+        readings = read_jsonl(args.source)
+        print(f"Replaying {args.source} at {args.speedup:g}x")
+    else:
+        scenario = ScenarioGenerator(_config(args))
+        readings = scenario.readings()
+        print(f"Scenario: {args.sensors} sensors, {args.days:g} days, {len(scenario)} readings at most")
+
+    if args.command == 'generate':
+        started = time.perf_counter()
+        count = write_jsonl(readings, args.out, asdict(scenario.config) | {'start': scenario.start})
+        print(f"✅ {count} readings written to {args.out} in {time.perf_counter() - started:.1f}s")
+    elif args.command == 'summary':
+        print(json.dumps(summarize(readings, len(scenario)), indent=2))
+    else:
+        if args.target == 'mqtt':
+            target = MqttTarget(args.broker, args.broker_port)
+        elif args.target == 'none':
+            target = CountingTarget()
+        else:
+            target = HttpTarget(args.url, '/alert' if args.target == 'alert' else '/predict', args.workers)
+        result = replay(readings, target, args.speedup)
+        print(f"✅ Replay finished: {json.dumps(result)}")
+
+if __name__ == "__main__":
+    main()
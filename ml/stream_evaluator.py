@@ -0,0 +1,297 @@
+"""
+Stateful streaming alert evaluator for sensor readings.
+
+Keeps constant-memory rolling statistics per sensor (EWMA, rolling
+mean/variance and rate of change over the last N readings) and decides
+alerts on those instead of on single readings:
+
+- an alert is raised when the EWMA crosses a threshold, or when the rate of
+  change projects it across within the horizon, for `confirm` readings in a row
+- it clears only once the EWMA is back below the threshold minus a margin
+  (hysteresis), so a reading hovering at the threshold does not flap
+- while it stays active, repeat notifications are suppressed for
+  `suppress_seconds`
+
+Thresholds are snapshotted at start-up from the environment and an optional
+JSON file (ALERT_THRESHOLDS_FILE), and reloaded from them on SIGHUP.
+
+State lives in the process, so run the service with a single worker (or
+route each sensor to the same worker) for the statistics to see every reading;
+prefork.py forwards /alert from every worker to the first one.
+"""
+
+import json
+import math
+import os
+import signal
+import threading
+import time
+from collections import OrderedDict, deque
+from dataclasses import dataclass, asdict, fields
+from typing import Dict, Optional
+
+CHANNELS = ('temperature_celsius', 'humidity')
+
+@dataclass
+class Thresholds:
+    """Alert thresholds and smoothing parameters, read once and reloaded on demand"""
+    temp_high_c: float = 38.0
+    humidity_high_pct: float = 80.0
+    temp_clear_margin: float = 1.0          # °C below the threshold before an alert clears
+    humidity_clear_margin: float = 3.0      # % below the threshold before an alert clears
+    ewma_alpha: float = 0.3                 # Weight of the newest reading in the EWMA
+    window: int = 30                        # Readings in the rolling mean/variance and rate
+    min_readings: int = 3                   # Readings needed before the rate is trusted
+    horizon_seconds: float = 300.0          # Look-ahead for rising values (0 disables)
+    confirm: int = 2                        # Breaching readings in a row before raising
+    suppress_seconds: float = 1800.0        # Minimum time between notifications of one alert
+    reset_after_seconds: float = 900.0      # Gap after which a sensor's history is discarded
+    max_clock_skew: float = 300.0           # Timestamps further ahead than this are replaced by arrival time
+
+    # Environment variables shared with the Cloud Function and the sensors
+    _ENV_NAMES = {'temp_high_c': 'TEMP_HIGH_C', 'humidity_high_pct': 'HUMIDITY_HIGH_PCT'}
+
+    @classmethod
+    def load(cls) -> 'Thresholds':
+        """Defaults, overridden by environment variables, then by ALERT_THRESHOLDS_FILE."""
+        values = {}
+        for field in fields(cls):
+            env_name = cls._ENV_NAMES.get(field.name, f"ALERT_{field.name.upper()}")
+            if os.getenv(env_name) is not None:
+                values[field.name] = os.getenv(env_name)
+
+        path = os.getenv('ALERT_THRESHOLDS_FILE')
+        if path and os.path.exists(path):
+            with open(path) as f:
+                values.update(json.load(f))
+
+        unknown = set(values) - {field.name for field in fields(cls)}
+        if unknown:
+            raise ValueError(f"Unknown threshold settings: {', '.join(sorted(unknown))}")
+        thresholds = cls(**{field.name: field.type(values[field.name]) if field.name in values else field.default
+                            for field in fields(cls)})
+        thresholds.validate()
+        return thresholds
+
+    def validate(self):
+        if not 0 < self.ewma_alpha <= 1:
+            raise ValueError(f"ewma_alpha must be in (0, 1], got {self.ewma_alpha}")
+        if self.window < 2 or self.min_readings < 2 or self.confirm < 1:
+            raise ValueError("window and min_readings must be at least 2 and confirm at least 1")
+
+    def high(self, channel: str) -> float:
+        return self.temp_high_c if channel == 'temperature_celsius' else self.humidity_high_pct
+
+    def clear_margin(self, channel: str) -> float:
+        return self.temp_clear_margin if channel == 'temperature_celsius' else self.humidity_clear_margin
+
+class RollingStats:
+    """EWMA, mean, variance and rate of change of the last `size` values, updated in O(1)"""
+
+    __slots__ = ('alpha', 'values', 'times', 'total', 'total_sq', 'ewma', 'updates')
+
+    def __init__(self, size: int, alpha: float):
+        self.alpha = alpha
+        self.values = deque(maxlen=size)
+        self.times = deque(maxlen=size)
+        self.total = 0.0
+        self.total_sq = 0.0
+        self.ewma: Optional[float] = None
+        self.updates = 0
+
+    def update(self, value: float, timestamp: float):
+        if len(self.values) == self.values.maxlen:
+            oldest = self.values[0]
+            self.total -= oldest
+            self.total_sq -= oldest * oldest
+        self.values.append(value)
+        self.times.append(timestamp)
+        self.total += value
+        self.total_sq += value * value
+        self.ewma = value if self.ewma is None else self.ewma + self.alpha * (value - self.ewma)
+
+        # Recompute the running sums once per window so rounding errors cannot accumulate
+        # (amortised O(1) per update)
+        self.updates += 1
+        if self.updates % self.values.maxlen == 0:
+            self.total = math.fsum(self.values)
+            self.total_sq = math.fsum(v * v for v in self.values)
+
+    @property
+    def count(self) -> int:
+        return len(self.values)
+
+    @property
+    def mean(self) -> float:
+        return self.total / len(self.values)
+
+    @property
+    def variance(self) -> float:
+        mean = self.mean
+        return max(self.total_sq / len(self.values) - mean * mean, 0.0)
+
+    @property
+    def rate_per_second(self) -> float:
+        """Average change per second across the window."""
+        elapsed = self.times[-1] - self.times[0]
+        return (self.values[-1] - self.values[0]) / elapsed if elapsed > 0 else 0.0
+
+    def snapshot(self) -> Dict[str, float]:
+        return {
+            'ewma': round(self.ewma, 3),
+            'mean': round(self.mean, 3),
+            'std': round(math.sqrt(self.variance), 3),
+            'rate_per_min': round(self.rate_per_second * 60, 3),
+            'count': self.count,
+        }
+
+class SensorState:
+    """Rolling statistics and alert state of one sensor"""
+
+    __slots__ = ('stats', 'last_timestamp', 'active', 'streak', 'raised_at', 'last_notified')
+
+    def __init__(self, thresholds: Thresholds):
+        self.stats = {channel: RollingStats(thresholds.window, thresholds.ewma_alpha) for channel in CHANNELS}
+        self.last_timestamp: Optional[float] = None
+        self.active = False
+        self.streak = 0
+        self.raised_at: Optional[float] = None
+        self.last_notified: Optional[float] = None
+
+@dataclass
+class Evaluation:
+    """Outcome of evaluating one reading; is_high means a notification should be sent"""
+    is_high: bool
+    state: str          # normal, pending, raised, suppressed, reminder, cleared or late
+    reason: str
+    stats: Dict[str, Dict[str, float]]
+
+class StreamEvaluator:
+    """Per-sensor streaming alert decisions with hysteresis and suppression"""
+
+    def __init__(self, thresholds: Optional[Thresholds] = None, max_sensors: int = 10000):
+        self.thresholds = thresholds or Thresholds.load()
+        self.max_sensors = max_sensors
+        self._sensors: 'OrderedDict[str, SensorState]' = OrderedDict()
+        self._reload_requested = False
+
+    def _state(self, sensor_id: str) -> SensorState:
+        state = self._sensors.get(sensor_id)
+        if state is None:
+            state = self._sensors[sensor_id] = SensorState(self.thresholds)
+            if len(self._sensors) > self.max_sensors:
+                self._sensors.popitem(last=False)  # Forget the least recently seen sensor
+        else:
+            self._sensors.move_to_end(sensor_id)
+        return state
+
+    def _breaches(self, state: SensorState):
+        """Reasons the smoothed values are (or are about to be) over a threshold."""
+        t = self.thresholds
+        reasons = []
+        for channel in CHANNELS:
+            stats = state.stats[channel]
+            high = t.high(channel)
+            unit = '°C' if channel == 'temperature_celsius' else '%'
+            label = 'Temperature' if channel == 'temperature_celsius' else 'Humidity'
+            if stats.ewma >= high:
+                reasons.append(f"{label} too high: {stats.ewma:.1f}{unit} (smoothed) ≥ {high}{unit}")
+            elif t.horizon_seconds > 0 and stats.count >= t.min_readings:
+                rate = stats.rate_per_second
+                if rate > 0 and stats.ewma + rate * t.horizon_seconds >= high:
+                    reasons.append(f"{label} rising {rate * 60:.2f}{unit}/min, "
+                                   f"expected to reach {high}{unit} within {t.horizon_seconds:g}s")
+        return reasons
+
+    def _cleared(self, state: SensorState) -> bool:
+        """Whether every channel is back below its threshold minus the clear margin."""
+        t = self.thresholds
+        for channel in CHANNELS:
+            stats = state.stats[channel]
+            limit = t.high(channel) - t.clear_margin(channel)
+            if stats.ewma >= limit:
+                return False
+            if t.horizon_seconds > 0 and stats.count >= t.min_readings:
+                if stats.ewma + max(stats.rate_per_second, 0.0) * t.horizon_seconds >= t.high(channel):
+                    return False
+        return True
+
+    def evaluate(self, sensor_id: str, humidity: float, temperature_celsius: float,
+                 timestamp: Optional[float] = None) -> Evaluation:
+        """Update a sensor's statistics with one reading and decide whether to notify."""
+        if not (math.isfinite(humidity) and math.isfinite(temperature_celsius)):
+            # A single NaN would stay in the EWMA and silence the sensor's alerts for good
+            raise ValueError(f"Non-finite reading: humidity={humidity}, temperature_celsius={temperature_celsius}")
+        if self._reload_requested:
+            self.reload()
+        arrived = time.time()
+        now = timestamp
+        # A clock far ahead (or a millisecond stamp) would make every later reading look late
+        if now is None or not math.isfinite(now) or now > arrived + self.thresholds.max_clock_skew:
+            now = arrived
+        state = self._state(sensor_id)
+
+        if state.last_timestamp is not None and now <= state.last_timestamp:
+            # Triggers can be delivered out of order; an older reading must not move the statistics
+            return Evaluation(False, 'late', 'Reading older than the latest evaluated one', self._snapshot(state))
+        if state.last_timestamp is not None and now - state.last_timestamp > self.thresholds.reset_after_seconds:
+            state = self._sensors[sensor_id] = SensorState(self.thresholds)
+        state.last_timestamp = now
+        state.stats['temperature_celsius'].update(temperature_celsius, now)
+        state.stats['humidity'].update(humidity, now)
+
+        t = self.thresholds
+        if not state.active:
+            reasons = self._breaches(state)
+            state.streak = state.streak + 1 if reasons else 0
+            if state.streak < t.confirm:
+                return Evaluation(False, 'pending' if reasons else 'normal',
+                                  "; ".join(reasons) or "Within normal range", self._snapshot(state))
+            state.active = True
+            state.raised_at = state.last_notified = now
+            return Evaluation(True, 'raised', "; ".join(reasons), self._snapshot(state))
+
+        if self._cleared(state):
+            state.active = False
+            state.streak = 0
+            return Evaluation(False, 'cleared', "Back within normal range", self._snapshot(state))
+
+        reason = "; ".join(self._breaches(state)) or "Still above the clear level"
+        if now - state.last_notified >= t.suppress_seconds:
+            state.last_notified = now
+            return Evaluation(True, 'reminder', f"{reason} (active for {now - state.raised_at:.0f}s)",
+                              self._snapshot(state))
+        return Evaluation(False, 'suppressed', reason, self._snapshot(state))
+
+    def _snapshot(self, state: SensorState) -> Dict[str, Dict[str, float]]:
+        return {channel: state.stats[channel].snapshot() for channel in CHANNELS}
+
+    def request_reload(self, *_):
+        """Reload thresholds before the next evaluation; safe to call from a signal handler."""
+        self._reload_requested = True
+
+    def reload(self):
+        """Re-read thresholds, keeping the current ones if the new settings are invalid."""
+        self._reload_requested = False
+        try:
+            thresholds = Thresholds.load()
+        except (ValueError, TypeError, OSError) as e:
+            print(f"❌ Keeping previous alert thresholds, reload failed: {e}")
+            return
+        if (thresholds.window, thresholds.ewma_alpha) != (self.thresholds.window, self.thresholds.ewma_alpha):
+            self._sensors.clear()  # Existing statistics were built with the old window
+        self.thresholds = thresholds
+        print(f"✅ Alert thresholds reloaded: {asdict(thresholds)}")
+
+    def install_reload_signal(self):
+        """Reload thresholds on SIGHUP, where the platform has it."""
+        if not hasattr(signal, 'SIGHUP'):
+            return
+        if threading.current_thread() is not threading.main_thread():
+            # Signal handlers can only be installed from the main thread (not e.g. under a test client)
+            print("⚠️ Not in the main thread; alert thresholds will not reload on SIGHUP")
+            return
+        signal.signal(signal.SIGHUP, self.request_reload)
+
+    def sensor_count(self) -> int:
+        return len(self._sensors)
@@ -0,0 +1,212 @@
+"""
+WebSocket streaming inference for sensor gateways.
+
+A gateway keeps one connection open and streams samples; the server groups
+whatever has arrived into micro-batches for one vectorized prediction each,
+and streams the results back tagged with the client's correlation ids.
+
+Protocol (after the server's {"type": "ready", ...} greeting):
+
+    JSON   client -> {"id": <any>, "sample": {<feature>: <value>, ...}}, or a list of these
+           server -> {"type": "results", "results": [{"id": .., "predicted_class": .., "confidence": ..,
+                      "is_safe": .., "health_risks": [..]} | {"id": .., "error": ".."}]}
+    binary client -> records packed as '<I' + n*'d': uint32 id and the features in `features` order
+           server -> records packed as '<IBf': uint32 id, predicted class, confidence (%)
+                     (class 255 with confidence -1 marks a sample that could not be scored)
+
+Flow control: at most `window` samples are in flight per connection. Once
+the window is full the server stops reading the socket until results have
+been sent, so TCP pushes back on a gateway that sends faster than we infer.
+"""
+
+import asyncio
+import json
+import math
+import struct
+from collections import deque
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+BINARY_RESULT = struct.Struct('<IBf')
+_INVALID_CLASS = 255
+
+class _Item:
+    """One sample in flight: its correlation id, feature vector (or error) and reply format"""
+
+    __slots__ = ('id', 'vector', 'error', 'binary')
+
+    def __init__(self, correlation_id: Any, vector: Optional[List[float]], error: Optional[str], binary: bool):
+        self.id = correlation_id
+        self.vector = vector
+        self.error = error
+        self.binary = binary
+
+class StreamingSession:
+    """Serves one WebSocket connection: reads samples, batches inference and streams results"""
+
+    def __init__(self, websocket, feature_cols: List[str], predict: Callable[[np.ndarray], List[dict]],
+                 window: int = 256, max_batch: int = 128, linger: float = 0.002,
+                 on_results: Optional[Callable[[List[Dict[str, float]], List[dict]], Awaitable[None]]] = None,
+                 bounds: Optional[Dict[str, Tuple[float, float]]] = None):
+        self.websocket = websocket
+        self.feature_cols = list(feature_cols)
+        # (low, high) per feature, in feature_cols order; samples outside them are rejected
+        bounds = bounds or {}
+        self.bounds = [bounds.get(name, (-math.inf, math.inf)) for name in self.feature_cols]
+        self.predict = predict
+        self.window = window
+        self.max_batch = max_batch
+        self.linger = linger
+        self.on_results = on_results
+        self.binary_request = struct.Struct('<I' + 'd' * len(self.feature_cols))
+        self.received = 0
+        self.completed = 0
+        self._pending = deque()
+        self._ready = asyncio.Event()
+        self._slots = asyncio.Semaphore(window)
+
+    def _parse_json(self, text: str) -> List[_Item]:
+        try:
+            messages = json.loads(text)
+        except ValueError as e:
+            return [_Item(None, None, f"Invalid JSON: {e}", False)]
+        if not isinstance(messages, list):
+            messages = [messages]
+        items = []
+        for message in messages:
+            if not isinstance(message, dict) or not isinstance(message.get('sample'), dict):
+                items.append(_Item(message.get('id') if isinstance(message, dict) else None, None,
+                                   "Expected {\"id\": .., \"sample\": {..}}", False))
+                continue
+            sample = message['sample']
+            missing = [name for name in self.feature_cols if name not in sample]
+            if missing:
+                items.append(_Item(message.get('id'), None, f"Missing features: {', '.join(missing)}", False))
+                continue
+            try:
+                vector = [float(sample[name]) for name in self.feature_cols]
+            except (TypeError, ValueError):
+                items.append(_Item(message.get('id'), None, "Feature values must be numbers", False))
+                continue
+            items.append(self._checked(message.get('id'), vector, False))
+        return items
+
+    def _parse_binary(self, data: bytes) -> List[_Item]:
+        size = self.binary_request.size
+        if not data or len(data) % size:
+            return [_Item(0, None, f"Binary frames must hold whole {size}-byte records", True)]
+        items = []
+        for record in self.binary_request.iter_unpack(data):
+            items.append(self._checked(record[0], list(record[1:]), True))
+        return items
+
+    def _checked(self, correlation_id: Any, vector: List[float], binary: bool) -> _Item:
+        if not all(math.isfinite(value) for value in vector):
+            return _Item(correlation_id, None, "Feature values must be finite", binary)
+        for name, value, (low, high) in zip(self.feature_cols, vector, self.bounds):
+            if not low <= value <= high:
+                limit = f">= {low:g}" if high == math.inf else f"<= {high:g}" if low == -math.inf \
+                    else f"between {low:g} and {high:g}"
+                return _Item(correlation_id, None, f"{name} must be {limit}", binary)
+        return _Item(correlation_id, vector, None, binary)
+
+    async def _receive(self):
+        """Read samples into the pending queue, waiting for a free slot per sample."""
+        while True:
+            message = await self.websocket.receive()
+            if message['type'] == 'websocket.disconnect':
+                return
+            if message.get('text') is not None:
+                items = self._parse_json(message['text'])
+            else:
+                items = self._parse_binary(message.get('bytes') or b'')
+            for item in items:
+                await self._slots.acquire()  # Stop reading the socket while the window is full
+                self._pending.append(item)
+                self.received += 1
+                self._ready.set()
+
+    def _take_batch(self) -> List[_Item]:
+        count = min(len(self._pending), self.max_batch)
+        return [self._pending.popleft() for _ in range(count)]
+
+    async def _infer(self):
+        """Predict pending samples in batches and send the results back."""
+        loop = asyncio.get_running_loop()
+        while True:
+            await self._ready.wait()
+            if self.linger and len(self._pending) < self.max_batch:
+                await asyncio.sleep(self.linger)  # Let a burst arriving together share one batch
+            batch = self._take_batch()
+            if not self._pending:
+                self._ready.clear()
+
+            valid = [item for item in batch if item.vector is not None]
+            predictions = []
+            if valid:
+                # Vectorized inference on a worker thread so the socket keeps being read meanwhile
+                vectors = np.array([item.vector for item in valid], dtype=float)
+                try:
+                    predictions = await loop.run_in_executor(None, self.predict, vectors)
+                except Exception as e:
+                    for item in valid:
+                        item.vector, item.error = None, f"Prediction failed: {e}"
+                    valid, predictions = [], []
+
+            await self._send(batch, dict(zip(map(id, valid), predictions)))
+            self.completed += len(batch)
+            for _ in batch:
+                self._slots.release()
+
+            if self.on_results is not None and valid:
+                samples = [dict(zip(self.feature_cols, item.vector)) for item in valid]
+                await self.on_results(samples, predictions)
+
+    async def _send(self, batch: List[_Item], predictions: Dict[int, dict]):
+        """One JSON and/or one binary message per batch."""
+        json_results = []
+        binary_results = []
+        for item in batch:
+            prediction = predictions.get(id(item))
+            if item.binary:
+                if prediction is None:
+                    binary_results.append(BINARY_RESULT.pack(item.id, _INVALID_CLASS, -1.0))
+                else:
+                    binary_results.append(BINARY_RESULT.pack(
+                        item.id, prediction['predicted_class'], prediction['confidence']
+                    ))
+            elif prediction is None:
+                json_results.append({'id': item.id, 'error': item.error})
+            else:
+                json_results.append({
+                    'id': item.id,
+                    'predicted_class': prediction['predicted_class'],
+                    'confidence': prediction['confidence'],
+                    'is_safe': prediction['is_safe'],
+                    'health_risks': prediction['health_risks'],
+                })
+        if json_results:
+            await self.websocket.send_text(json.dumps({'type': 'results', 'results': json_results}))
+        if binary_results:
+            await self.websocket.send_bytes(b''.join(binary_results))
+
+    async def run(self):
+        """Serve the connection until the client disconnects."""
+        await self.websocket.send_text(json.dumps({
+            'type': 'ready',
+            'window': self.window,
+            'max_batch': self.max_batch,
+            'features': self.feature_cols,
+            'binary_request': self.binary_request.format,
+            'binary_result': BINARY_RESULT.format,
+        }))
+        receiver = asyncio.ensure_future(self._receive())
+        inference = asyncio.ensure_future(self._infer())
+        try:
+            done, _ = await asyncio.wait({receiver, inference}, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                task.result()  # Surface errors from either side
+        finally:
+            receiver.cancel()
+            inference.cancel()
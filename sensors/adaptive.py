@@ -0,0 +1,119 @@
+"""
+Sampling controllers deciding which readings become continuous uploads.
+
+FixedSampler keeps one reading per device per period. AdaptiveSampler moves
+the period between a fast and a slow limit: it drops to the fast limit as
+soon as readings change quickly or approach an alert threshold, and backs
+off gradually once the signal has been flat for a while.
+"""
+
+import math
+import os
+from collections import deque
+from config import ADAPTIVE_SAMPLING_CONFIG
+from metrics import metric_sampling_interval_seconds
+
+CHANNELS = ('humidity', 'temperature_celsius')
+
+class FixedSampler:
+    """Samples each device once per fixed period."""
+
+    def __init__(self, period=0):
+        self.period = period
+        self._last_sampled = {}
+
+    def should_sample(self, reading):
+        device_id = reading.get('device_id')
+        if reading['timestamp'] - self._last_sampled.get(device_id, -math.inf) < self.period:
+            return False
+        self._last_sampled[device_id] = reading['timestamp']
+        return True
+
+    def periods(self):
+        return {device_id or 'default': self.period for device_id in list(self._last_sampled)}
+
+class _DeviceState:
+    """Recent readings and the current period of one device."""
+
+    def __init__(self, period):
+        self.window = deque()
+        self.period = period
+        self.last_sampled = -math.inf
+
+class AdaptiveSampler:
+    """Per-device sampling period driven by signal volatility and alert proximity."""
+
+    def __init__(self, min_period=None, max_period=None,
+                 window=ADAPTIVE_SAMPLING_CONFIG['window'],
+                 full_change=ADAPTIVE_SAMPLING_CONFIG['full_change'],
+                 noise_floor=ADAPTIVE_SAMPLING_CONFIG['noise_floor'],
+                 alert_margin=ADAPTIVE_SAMPLING_CONFIG['alert_margin'],
+                 backoff=ADAPTIVE_SAMPLING_CONFIG['backoff'],
+                 temp_high_c=None, humidity_high_pct=None):
+        self.min_period = min_period if min_period is not None else float(
+            os.getenv('SAMPLING_MIN_PERIOD', ADAPTIVE_SAMPLING_CONFIG['min_period']))
+        self.max_period = max_period if max_period is not None else float(
+            os.getenv('SAMPLING_MAX_PERIOD', ADAPTIVE_SAMPLING_CONFIG['max_period']))
+        if not 0 < self.min_period <= self.max_period:
+            raise ValueError(f"Invalid sampling limits: {self.min_period}s to {self.max_period}s")
+        self.window = window
+        self.full_change = full_change
+        self.noise_floor = noise_floor
+        self.alert_margin = alert_margin
+        self.backoff = backoff
+        # Same alert thresholds (and defaults) as the compressor, Cloud Function and ML service
+        self.thresholds = {
+            'temperature_celsius': temp_high_c if temp_high_c is not None else float(os.getenv('TEMP_HIGH_C', 38)),
+            'humidity': humidity_high_pct if humidity_high_pct is not None else float(os.getenv('HUMIDITY_HIGH_PCT', 80)),
+        }
+        self._states = {}
+
+    def _urgency(self, state, reading):
+        """0 for a flat signal far from any threshold, 1 when the fastest rate is warranted."""
+        urgency = 0.0
+        for channel in CHANNELS:
+            values = [r[channel] for r in state.window]
+            change = max(values) - min(values) - self.noise_floor[channel]
+            urgency = max(urgency, change / self.full_change[channel])
+            distance = self.thresholds[channel] - reading[channel]
+            urgency = max(urgency, 1 - distance / self.alert_margin[channel])
+        return min(max(urgency, 0.0), 1.0)
+
+    def _target_period(self, urgency):
+        # Interpolate geometrically so moderate urgency already samples noticeably faster
+        return self.max_period * (self.min_period / self.max_period) ** urgency
+
+    def should_sample(self, reading):
+        """Record a reading and return whether it should be uploaded."""
+        device_id = reading.get('device_id')
+        state = self._states.get(device_id)
+        if state is None:
+            state = self._states[device_id] = _DeviceState(self.max_period)
+        state.window.append(reading)
+        while state.window[0]['timestamp'] < reading['timestamp'] - self.window:
+            state.window.popleft()
+
+        target = self._target_period(self._urgency(state, reading))
+        if target < state.period:
+            state.period = target  # Speed up immediately
+        if reading['timestamp'] - state.last_sampled < state.period:
+            metric_sampling_interval_seconds.labels(device=device_id or 'default').set(state.period)
+            return False
+
+        state.last_sampled = reading['timestamp']
+        if target > state.period:
+            state.period = min(target, state.period * self.backoff)  # Slow down gradually
+        metric_sampling_interval_seconds.labels(device=device_id or 'default').set(state.period)
+        return True
+
+    def periods(self):
+        return {device_id or 'default': state.period for device_id, state in list(self._states.items())}
+
+def create_sampler(period):
+    """AdaptiveSampler if enabled via ADAPTIVE_SAMPLING or config, else a FixedSampler."""
+    enabled = os.getenv('ADAPTIVE_SAMPLING')
+    if enabled is None:
+        enabled = ADAPTIVE_SAMPLING_CONFIG['enabled']
+    else:
+        enabled = enabled.strip().lower() in ('1', 'true', 'yes', 'on')
+    return AdaptiveSampler() if enabled else FixedSampler(period)
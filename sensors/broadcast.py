@@ -0,0 +1,68 @@
+import queue
+import threading
+from config import STREAM_CONFIG
+from metrics import metric_stream_clients, metric_stream_evictions_total
+
+class Subscriber:
+    """One stream client with its own bounded buffer of pending readings."""
+
+    def __init__(self, device_id=None, maxsize=STREAM_CONFIG['client_buffer']):
+        self.device_id = device_id
+        self.evicted = False
+        self._queue = queue.Queue(maxsize=maxsize)
+
+    def offer(self, reading):
+        """Queue a reading without blocking; returns False if the buffer is full."""
+        try:
+            self._queue.put_nowait(reading)
+            return True
+        except queue.Full:
+            return False
+
+    def get(self, timeout=None):
+        """Wait for the next reading, returning None on timeout or eviction."""
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+class ReadingBroadcaster:
+    """Fans each published reading out to all subscribers; slow consumers are evicted."""
+
+    def __init__(self, max_clients=STREAM_CONFIG['max_clients']):
+        self.max_clients = max_clients
+        self._subscribers = set()
+        self._lock = threading.Lock()
+
+    def subscribe(self, device_id=None):
+        """Register a new subscriber, optionally filtered to one device. Returns None when full."""
+        with self._lock:
+            if len(self._subscribers) >= self.max_clients:
+                return None
+            subscriber = Subscriber(device_id)
+            self._subscribers.add(subscriber)
+            metric_stream_clients.set(len(self._subscribers))
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        """Remove a subscriber; safe to call more than once."""
+        with self._lock:
+            self._subscribers.discard(subscriber)
+            metric_stream_clients.set(len(self._subscribers))
+
+    def publish(self, reading):
+        """Deliver a reading to every matching subscriber without blocking the producer."""
+        with self._lock:
+            subscribers = list(self._subscribers)
+
+        for subscriber in subscribers:
+            if subscriber.device_id is not None and subscriber.device_id != reading.get('device_id'):
+                continue
+            if not subscriber.offer(reading):
+                subscriber.evicted = True
+                metric_stream_evictions_total.inc()
+                self.unsubscribe(subscriber)
+
+    def client_count(self):
+        with self._lock:
+            return len(self._subscribers)
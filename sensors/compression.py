@@ -0,0 +1,135 @@
+"""
+Change-based compression of sensor readings before they are uploaded.
+
+Supports a plain deadband (send when a channel moves more than its band) and
+swinging-door trending (send only the points needed to redraw the trend within
+the band). Both force a heartbeat upload every few minutes and always send
+readings that cross an alert threshold in either direction.
+"""
+
+import math
+import os
+from config import COMPRESSION_CONFIG
+from metrics import metric_compression_readings_total, metric_compression_ratio
+
+CHANNELS = ('humidity', 'temperature_celsius')
+
+class _DeviceState:
+    """Compression state of one device."""
+
+    def __init__(self):
+        self.last_sent = None
+        self.last_seen = None
+        self.alerting = False
+        self.received = 0
+        self.sent = 0
+        self.reset_door()
+
+    def reset_door(self):
+        """Forget the swinging-door slopes, e.g. after the anchor point moved."""
+        self.max_low = {channel: -math.inf for channel in CHANNELS}
+        self.min_up = {channel: math.inf for channel in CHANNELS}
+
+class ReadingCompressor:
+    """Decides which readings of each device are worth uploading."""
+
+    def __init__(self, mode=None, deadband=COMPRESSION_CONFIG['deadband'],
+                 relative_deadband=COMPRESSION_CONFIG['relative_deadband'],
+                 heartbeat=COMPRESSION_CONFIG['heartbeat'],
+                 temp_high_c=None, humidity_high_pct=None):
+        self.mode = mode or os.getenv('COMPRESSION_MODE', COMPRESSION_CONFIG['mode'])
+        if self.mode not in ('none', 'deadband', 'swinging_door'):
+            raise ValueError(f"Invalid compression mode: {self.mode}")
+        self.deadband = deadband
+        self.relative_deadband = relative_deadband
+        self.heartbeat = heartbeat
+        # Same alert thresholds (and defaults) as the Cloud Function and ML service
+        self.thresholds = {
+            'temperature_celsius': temp_high_c if temp_high_c is not None else float(os.getenv('TEMP_HIGH_C', 38)),
+            'humidity': humidity_high_pct if humidity_high_pct is not None else float(os.getenv('HUMIDITY_HIGH_PCT', 80)),
+        }
+        self._states = {}
+
+    def _band(self, channel, anchor_value):
+        return max(self.deadband[channel], self.relative_deadband * abs(anchor_value))
+
+    def _is_alert(self, reading):
+        return any(reading[channel] >= threshold for channel, threshold in self.thresholds.items())
+
+    def crosses_threshold(self, reading):
+        """Whether a reading is above an alert threshold or is the first back below one."""
+        state = self._states.get(reading.get('device_id'))
+        alert = self._is_alert(reading)
+        return alert or (state is not None and state.alerting)
+
+    def _outside_deadband(self, state, reading):
+        return any(
+            abs(reading[channel] - state.last_sent[channel]) > self._band(channel, state.last_sent[channel])
+            for channel in CHANNELS
+        )
+
+    def _door_closed(self, state, reading):
+        """Narrow each channel's door with the new point; True once any door has closed."""
+        anchor = state.last_sent
+        elapsed = reading['timestamp'] - anchor['timestamp']
+        if elapsed <= 0:
+            return False
+        closed = False
+        for channel in CHANNELS:
+            band = self._band(channel, anchor[channel])
+            state.min_up[channel] = min(state.min_up[channel], (reading[channel] + band - anchor[channel]) / elapsed)
+            state.max_low[channel] = max(state.max_low[channel], (reading[channel] - band - anchor[channel]) / elapsed)
+            closed = closed or state.max_low[channel] > state.min_up[channel]
+        return closed
+
+    def offer(self, reading):
+        """Feed one reading and return the readings to upload now, oldest first."""
+        device_id = reading.get('device_id')
+        state = self._states.get(device_id)
+        if state is None:
+            state = self._states[device_id] = _DeviceState()
+        state.received += 1
+
+        alert = self._is_alert(reading)
+        pending = state.last_seen if state.last_seen is not None and state.last_seen is not state.last_sent else None
+        to_send = []
+
+        if state.last_sent is None or self.mode == 'none':
+            to_send = [reading]
+        elif alert or alert != state.alerting or reading['timestamp'] - state.last_sent['timestamp'] >= self.heartbeat:
+            # Threshold crossings and heartbeats go out immediately; keep the held trend point too
+            to_send = ([pending] if self.mode == 'swinging_door' and pending is not None else []) + [reading]
+        elif self.mode == 'deadband':
+            if self._outside_deadband(state, reading):
+                to_send = [reading]
+        elif self._door_closed(state, reading):
+            # The previous point is the last one the trend can be redrawn through
+            to_send = [pending]
+            state.last_sent = pending
+            state.reset_door()
+            self._door_closed(state, reading)
+
+        if to_send and to_send[-1] is reading:
+            state.last_sent = reading
+            state.reset_door()
+        state.last_seen = reading
+        state.alerting = alert
+
+        state.sent += len(to_send)
+        label = device_id or 'default'
+        metric_compression_readings_total.labels(device=label, decision='received').inc()
+        if to_send:
+            metric_compression_readings_total.labels(device=label, decision='sent').inc(len(to_send))
+        metric_compression_ratio.labels(device=label).set(state.received / max(state.sent, 1))
+        return to_send
+
+    def flush(self):
+        """Return held readings that were never uploaded, e.g. before shutting down."""
+        held = []
+        for state in self._states.values():
+            if state.last_seen is not None and state.last_seen is not state.last_sent:
+                held.append(state.last_seen)
+                state.last_sent = state.last_seen
+                state.sent += 1
+                state.reset_door()
+        return held
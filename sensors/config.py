@@ -1,6 +1,6 @@
 # Firebase database keys for different data collection modes
 FIREBASE_KEYS = {
-    'continuous': 'sensor_data_continuous',  # Every 30 seconds
+    'continuous': 'sensor_data_continuous',  # Every sampling period (SAMPLING_CONFIG)
     'cron': 'sensor_data_cron',              # Every 1 minute or at 8:00 AM
     'on_demand': 'sensor_data_on_demand'     # When endpoint is hit
 }
@@ -18,3 +18,165 @@ FLASK_CONFIG = {
     'port': 5001,
     'debug': False
 }
+
+# Background serial reader configuration
+READER_CONFIG = {
+    'buffer_size': 256,       # Number of recent readings kept in memory
+    'stale_after': 90,        # Seconds before the latest reading is considered stale
+    'reconnect_delay': 5      # Seconds to wait before reopening a failed port
+}
+
+# Write-behind batching of Firebase writes
+FIREBASE_WRITER_CONFIG = {
+    'batch_size': 50,         # Flush as soon as this many readings are queued
+    'flush_interval': 5,      # Flush at least this often (seconds)
+    'max_queue': 10000,       # Oldest readings are dropped beyond this size
+    'max_retries': 5,         # Attempts per batch before it is requeued
+    'backoff_initial': 1,     # First retry delay (seconds), doubled per attempt
+    'backoff_max': 60         # Upper bound for the retry delay (seconds)
+}
+
+# Durable on-disk spool that readings are written to before Firebase
+SPOOL_CONFIG = {
+    'path': 'sensor_spool.db',  # SQLite database file (WAL mode)
+    'max_rows': 500000,         # Oldest unsent readings are dropped beyond this count
+    'max_age_days': 30,         # Unsent readings older than this are dropped
+    'prune_every': 1000         # Apply the retention policy every N appended readings
+}
+
+# Devices served by the multi-device ingestion daemon. Override with the
+# SENSOR_DEVICES environment variable (inline JSON list or path to a JSON file).
+DEVICES = [
+    {'id': 'well-1', 'port': SERIAL_CONFIG['port'], 'baud_rate': SERIAL_CONFIG['baud_rate']}
+]
+
+# Multi-device ingestion daemon configuration
+INGEST_CONFIG = {
+    'reconnect_initial': 1,   # First reconnect delay (seconds), doubled per failure
+    'reconnect_max': 60       # Upper bound for the reconnect delay (seconds)
+}
+
+# Continuous sampling. High-frequency mode (HIGH_FREQUENCY=1) samples faster
+# and switches Firebase keys to microsecond precision so readings taken
+# within the same second no longer overwrite each other.
+SAMPLING_CONFIG = {
+    'period': 30,                  # Seconds between continuous uploads per device
+    'high_frequency': False,       # Enable high-frequency mode by default
+    'high_frequency_period': 1     # Sampling period in high-frequency mode (seconds, may be < 1)
+}
+
+# Server-Sent Events stream of live readings
+STREAM_CONFIG = {
+    'client_buffer': 100,     # Readings buffered per client before it is evicted as too slow
+    'max_clients': 200,       # Maximum concurrent stream subscribers
+    'heartbeat': 15           # Seconds between keep-alive comments on idle streams
+}
+
+# Embedded time-series store for /sensor/history
+TIMESERIES_CONFIG = {
+    'path': 'sensor_history',   # Root directory of the store
+    'tz_offset': 19800,         # Align day buckets to IST midnight (UTC+5:30, seconds)
+    'max_points': 1000,         # Most points a history query returns; smaller steps are raised
+    'retention_days': {         # Chunks older than this are deleted; None keeps forever
+        'raw': 30,
+        '1m': 365,
+        '1h': None,
+        '1d': None
+    }
+}
+
+# Compression applied to readings before they are uploaded to Firebase
+COMPRESSION_CONFIG = {
+    'mode': 'swinging_door',  # 'none', 'deadband' or 'swinging_door'
+    'deadband': {             # Absolute change per channel that is always worth sending
+        'humidity': 1.0,
+        'temperature_celsius': 0.5
+    },
+    'relative_deadband': 0.0, # Extra deadband as a fraction of the last sent value
+    'heartbeat': 600          # Always send at least one reading this often (seconds)
+}
+
+# In-process scheduler used by `cron_data.py --daemon`
+SCHEDULER_CONFIG = {
+    'schedules': {                 # Job name -> cron expression (IST)
+        'every_minute': '* * * * *',
+        'daily_0800': '0 8 * * *'
+    },
+    'misfire_grace': 30,           # Runs later than this (seconds) are skipped as misfires
+    'max_reading_age': 10          # Buffered readings older than this are not captured (seconds)
+}
+
+# Framed binary serial protocol (CSV lines keep working alongside it)
+PROTOCOL_CONFIG = {
+    'sync': b'\xa5\x5a',      # Frame start marker; never valid in ASCII CSV lines
+    'max_channels': 16,       # Frames claiming more channels are treated as corrupt
+    'channel_scale': 100,     # Channels are int16 values in hundredths (e.g. 2345 = 23.45)
+    'max_buffer': 65536       # Unparsed bytes kept while waiting for the rest of a frame
+}
+
+# Fan-out of readings to independent sinks (see sinks.py). Each sink has its
+# own queue and flusher thread, so a slow destination never stalls the others.
+SINK_CONFIG = {
+    'queue_size': 10000,           # Readings buffered per sink; the oldest are dropped beyond this
+    'batch_size': 100,             # Readings handed to a sink per write
+    'flush_interval': 1,           # Write at least this often when readings are waiting (seconds)
+    'max_retries': 3,              # Attempts per batch before it is dropped
+    'backoff_initial': 1,          # First retry delay (seconds), doubled per attempt
+    'backoff_max': 30,             # Upper bound for the retry delay (seconds)
+    'sqlite_path': 'sensor_readings.db',
+    'webhook_url': 'http://localhost:8000/sensor-analysis',
+    'webhook_timeout': 5           # Seconds per webhook request
+}
+
+# Adaptive sampling of continuous uploads (ADAPTIVE_SAMPLING=1 to enable). The
+# period moves between the two limits: the faster the readings change within
+# the window, or the closer they are to an alert threshold, the shorter it gets.
+ADAPTIVE_SAMPLING_CONFIG = {
+    'enabled': False,
+    'min_period': 1,               # Fastest sampling period (seconds)
+    'max_period': 300,             # Slowest sampling period when the signal is flat (seconds)
+    'window': 120,                 # Seconds of readings used to measure volatility
+    'full_change': {               # Change within the window that warrants the fastest rate
+        'humidity': 10.0,
+        'temperature_celsius': 3.0
+    },
+    'noise_floor': {               # Change ignored as sensor noise (DHT11 resolution)
+        'humidity': 1.0,
+        'temperature_celsius': 1.0
+    },
+    'alert_margin': {              # Distance below an alert threshold where sampling speeds up
+        'humidity': 10.0,
+        'temperature_celsius': 3.0
+    },
+    'backoff': 1.5                 # Most the period may grow per uploaded reading (factor)
+}
+
+# End-to-end latency tracing (see trace_collector.py). Each uploaded packet
+# carries a trace id and wall-clock hop times in epoch milliseconds, which
+# the Cloud Function and ML service extend up to the alert notification.
+TRACE_CONFIG = {
+    'enabled': True,               # Attach a trace to every packet (TRACE_READINGS=0 to disable)
+    'alerts_collection': 'alerts', # Firestore collection holding alert records with their traces
+    'poll_interval': 60,           # Seconds between collector polls
+    'metrics_port': 9105,          # Port of the collector's /metrics with --serve (scraped as job 'traces')
+    'lookback': 3600,              # Seconds of alert records read on the first poll
+    'samples': 10000               # Recent latencies kept per hop for percentile reports
+}
+
+# MQTT ingestion bridge for remote sensor nodes (see mqtt_bridge.py). Nodes
+# publish to sensors/<device_id>/reading either JSON
+# {"humidity": .., "temperature_celsius": .., "timestamp": ..} or 'humidity,temperature'.
+MQTT_CONFIG = {
+    'host': 'localhost',
+    'port': 1883,
+    'topic': 'sensors/+/reading', # The '+' level is the device id
+    'qos': 1,                      # QoS 1/2 messages are acknowledged only once handed to the sinks
+    'client_id': 'sensor-mqtt-bridge',
+    'keepalive': 60,
+    'topic_queue_size': 1000,      # Readings held per topic; QoS 0 readings beyond this are dropped
+    'high_water': 0.8,             # Stop draining (and acknowledging) when a sink queue is this full
+    'max_clock_skew': 300,         # Node timestamps further than this in the future are replaced (seconds)
+    'max_reading_age': 7 * 86400,  # Readings with older timestamps are rejected (seconds)
+    'reconnect_min': 1,            # Reconnect backoff limits (seconds)
+    'reconnect_max': 60
+}
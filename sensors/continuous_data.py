@@ -1,8 +1,12 @@
 import serial
 import time
 import os
-from firebase_utils import initialize_firebase, send_to_firebase, read_sensor_data_from_arduino
+from prometheus_client import start_http_server
+from firebase_utils import initialize_firebase
+from sinks import SinkDispatcher, create_sinks
+from serial_reader import SerialReader
 from config import SERIAL_CONFIG
+from metrics import registry
 
 def main():
     """Main function for continuous data collection."""
@@ -16,38 +20,45 @@ def main():
         print(f"Firebase initialization failed: {e}")
         return
     
+    # Fan readings out to Firebase (sampled, compressed and spooled) and any other sinks
+    dispatcher = SinkDispatcher(create_sinks(os.getenv('SENSOR_SINKS', 'firebase')))
+    dispatcher.start()
+    
+    # Optionally expose write queue metrics for Prometheus
+    metrics_port = os.getenv('METRICS_PORT')
+    if metrics_port:
+        start_http_server(int(metrics_port), registry=registry)
+        print(f"Metrics available on port {metrics_port}")
+    
     # Get serial configuration
     serial_port = os.getenv('SERIAL_PORT', SERIAL_CONFIG['port'])
     baud_rate = int(os.getenv('BAUD_RATE', SERIAL_CONFIG['baud_rate']))
     
     try:
-        # Connect to the serial port
+        # Connect to the serial port and keep parsing lines in the background
         arduino = serial.Serial(serial_port, baud_rate, timeout=SERIAL_CONFIG['timeout'])
         time.sleep(2)  # Wait for the connection to establish
         print(f"Connected to Arduino on {serial_port} at {baud_rate} baud")
+        reader = SerialReader(serial_port, baud_rate, timeout=SERIAL_CONFIG['timeout'], connection=arduino)
+        reader.start()
+        last_seq = 0
 
         while True:
             print("Waiting for Arduino data...")
-            # Read sensor data from Arduino
-            humidity, temperature, error = read_sensor_data_from_arduino(arduino)
+            # Block until the background reader has parsed something new
+            reading = reader.buffer.wait_for_new(last_seq, timeout=10)
 
             # Check if we got valid data
-            if humidity is not None and temperature is not None:
+            if reading is not None:
+                # Hand over every reading since the last pass so fast sampling loses nothing
+                for reading in reader.buffer.since(last_seq):
+                    last_seq = reading['seq']
+                    dispatcher.dispatch(reading)
+                humidity = reading['humidity']
+                temperature = reading['temperature_celsius']
                 print(f"✅ Received from Arduino: Humidity={humidity}%, Temperature={temperature}°C")
-                
-                # Send to Firebase with 'continuous' data type
-                success = send_to_firebase('continuous', humidity, temperature)
-                
-                if success:
-                    print("✅ Data sent to Firebase successfully")
-                else:
-                    print("❌ Failed to send data to Firebase")
-                
-                # Wait 30 seconds before next reading (matches Arduino timing)
-                print("⏳ Waiting 30 seconds for next reading...")
-                time.sleep(30)
             else:
-                print(f"❌ Failed to read sensor data: {error}")
+                print(f"❌ Failed to read sensor data: {reader.last_error or 'no new reading'}")
                 print("⏳ Waiting 10 seconds before retrying...")
                 time.sleep(10)
 
@@ -58,6 +69,9 @@ def main():
         print("Please make sure the .json file is in the same folder as this script and the filename is correct.\n")
     except Exception as e:
         print(f"An unexpected error occurred: {e}")
+    finally:
+        # Flush what we can before exiting; spooled Firebase writes are replayed on the next start
+        dispatcher.stop(timeout=30)
 
 if __name__ == "__main__":
     main()
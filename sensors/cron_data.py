@@ -2,12 +2,82 @@ import serial
 import time
 import os
 import sys
-from firebase_utils import initialize_firebase, send_to_firebase, read_sensor_data_from_arduino
-from config import SERIAL_CONFIG
+from firebase_utils import initialize_firebase
+from serial_reader import SerialReader
+from config import SERIAL_CONFIG, SPOOL_CONFIG, SCHEDULER_CONFIG
+from metrics import metric_serial_read_seconds
 
 
+def capture_reading(reader, writer):
+    """Spool the freshest buffered reading as a 'cron' data point."""
+    max_age = SCHEDULER_CONFIG['max_reading_age']
+    # Taken before latest(), so a reading arriving in between is not waited past
+    seq = reader.buffer.seq
+    reading = reader.buffer.latest(max_age=max_age)
+    if reading is None:
+        # Buffered readings are too old; only one read from now on will do
+        start = time.perf_counter()
+        reading = reader.buffer.wait_for_new(seq, timeout=max_age)
+        metric_serial_read_seconds.labels(device=reader.device_id, mode='cron', phase='wait').observe(
+            time.perf_counter() - start
+        )
+    if reading is None:
+        raise RuntimeError(reader.last_error or f"no reading within {max_age} seconds")
+    
+    writer.enqueue('cron', reading['humidity'], reading['temperature_celsius'], timestamp=reading['timestamp'])
+    print(f"Captured: Humidity={reading['humidity']}%, Temperature={reading['temperature_celsius']}°C")
+
+def run_daemon():
+    """Keep Firebase and the serial port open and capture readings on cron schedules."""
+    from prometheus_client import start_http_server
+    from firebase_writer import FirebaseBatchWriter
+    from spool import ReadingSpool
+    from scheduler import Scheduler
+    from metrics import registry
+    
+    print("Starting cron scheduler daemon...")
+    
+    try:
+        initialize_firebase()
+        print("Firebase initialized successfully")
+    except Exception as e:
+        print(f"Firebase initialization failed: {e}")
+        sys.exit(1)
+    
+    metrics_port = os.getenv('METRICS_PORT')
+    if metrics_port:
+        start_http_server(int(metrics_port), registry=registry)
+        print(f"Metrics available on port {metrics_port}")
+    
+    serial_port = os.getenv('SERIAL_PORT', SERIAL_CONFIG['port'])
+    baud_rate = int(os.getenv('BAUD_RATE', SERIAL_CONFIG['baud_rate']))
+    
+    # The port stays open, so the board is reset once instead of on every run
+    reader = SerialReader(serial_port, baud_rate, timeout=SERIAL_CONFIG['timeout'], mode='cron')
+    reader.start()
+    spool = ReadingSpool(os.getenv('SPOOL_PATH', SPOOL_CONFIG['path']))
+    writer = FirebaseBatchWriter(spool=spool)
+    writer.start()
+    
+    scheduler = Scheduler()
+    for name, expression in SCHEDULER_CONFIG['schedules'].items():
+        scheduler.add_job(name, expression, lambda: capture_reading(reader, writer))
+        print(f"Scheduled {name}: '{expression}' (IST)")
+    
+    try:
+        scheduler.run()
+    except KeyboardInterrupt:
+        print("Stopping cron scheduler daemon...")
+    finally:
+        reader.stop()
+        writer.stop(timeout=30)
+
 def main():
     """Main function for cron-based data collection."""
+    if '--daemon' in sys.argv[1:]:
+        run_daemon()
+        return
+    
     print("Starting cron-based sensor data collection...")
     
     # Initialize Firebase
@@ -28,22 +98,41 @@ def main():
         time.sleep(2)  # Wait for the connection to establish
         print(f"Connected to Arduino on {serial_port} at {baud_rate} baud")
 
-        # Read sensor data
-        humidity, temperature, error = read_sensor_data_from_arduino(arduino)
+        # Read sensor data from the first line parsed by the background reader
+        reader = SerialReader(serial_port, baud_rate, timeout=SERIAL_CONFIG['timeout'], connection=arduino, mode='cron')
+        reader.start()
+        start = time.perf_counter()
+        reading = reader.buffer.wait_for_new(0, timeout=10)
+        metric_serial_read_seconds.labels(device=reader.device_id, mode='cron', phase='wait').observe(
+            time.perf_counter() - start
+        )
+        reader.stop()
         
-        if humidity is not None and temperature is not None:
+        if reading is not None:
+            humidity = reading['humidity']
+            temperature = reading['temperature_celsius']
             print(f"Read sensor data: Humidity={humidity}%, Temperature={temperature}°C")
             
-            # Send to Firebase with 'cron' data type
-            success = send_to_firebase('cron', humidity, temperature)
+            # Spool first, so an offline run keeps the reading for the next one to replay
+            from firebase_writer import FirebaseBatchWriter
+            from spool import ReadingSpool
+            
+            spool = ReadingSpool(os.getenv('SPOOL_PATH', SPOOL_CONFIG['path']))
+            writer = FirebaseBatchWriter(spool=spool)
+            writer.enqueue('cron', humidity, temperature, timestamp=reading['timestamp'])
+            writer.start()
+            writer.stop(timeout=30)
+            pending = writer.queue_depth()
+            if not writer.is_alive():
+                spool.close()
             
-            if success:
+            if pending == 0:
                 print("Data successfully sent to Firebase (cron collection)")
             else:
-                print("Failed to send data to Firebase")
+                print(f"Failed to send data to Firebase; {pending} reading(s) spooled for the next run")
                 sys.exit(1)
         else:
-            print(f"Failed to read valid sensor data: {error}")
+            print(f"Failed to read valid sensor data: {reader.last_error or 'no reading within 10 seconds'}")
             sys.exit(1)
 
     except serial.SerialException as e:
@@ -1,10 +1,14 @@
 import os
+import math
 import time
+import itertools
+import uuid
 import firebase_admin
 from firebase_admin import credentials, db
 from datetime import datetime, timezone, timedelta
 from dotenv import load_dotenv
-from config import FIREBASE_KEYS
+from config import FIREBASE_KEYS, SAMPLING_CONFIG, TRACE_CONFIG
+from metrics import metric_serial_read_seconds, metric_parse_failures_total, metric_firebase_write_seconds
 
 # Load environment variables
 load_dotenv()
@@ -22,66 +26,182 @@ def initialize_firebase():
         'databaseURL': FIREBASE_DATABASE_URL
     })
 
+# Cached database references, keyed by path
+_firebase_refs = {}
+
+def _get_cached_ref(path):
+    """Return a database reference for path, creating it only once."""
+    ref = _firebase_refs.get(path)
+    if ref is None:
+        ref = db.reference(path)
+        _firebase_refs[path] = ref
+    return ref
+
 def get_firebase_ref(data_type='continuous'):
     """Get Firebase reference for specific data type."""
     if data_type not in FIREBASE_KEYS:
         raise ValueError(f"Invalid data type: {data_type}. Must be one of {list(FIREBASE_KEYS.keys())}")
     
-    return db.reference(FIREBASE_KEYS[data_type])
+    return _get_cached_ref(FIREBASE_KEYS[data_type])
+
+def get_root_ref():
+    """Get the database root reference used for multi-path updates."""
+    return _get_cached_ref('/')
 
-def _get_ist_time():
-    """Get current IST time."""
+def _get_ist_time(timestamp=None):
+    """Get IST time for a unix timestamp, or the current IST time."""
     ist = timezone(timedelta(hours=5, minutes=30))  # IST is UTC+5:30
+    if timestamp is not None:
+        return datetime.fromtimestamp(timestamp, ist)
     return datetime.now(ist)
 
-def create_data_packet(humidity, temperature):
-    """Create a standardized data packet with timestamp."""
-    current_time_ist = _get_ist_time()
+def is_high_frequency():
+    """Whether high-frequency sampling (and sub-second keys) is enabled."""
+    value = os.getenv('HIGH_FREQUENCY')
+    if value is None:
+        return SAMPLING_CONFIG['high_frequency']
+    return value.strip().lower() in ('1', 'true', 'yes', 'on')
+
+def get_sampling_period():
+    """Seconds between continuous uploads; SAMPLING_PERIOD overrides the mode default."""
+    value = os.getenv('SAMPLING_PERIOD')
+    if value is not None:
+        return float(value)
+    return SAMPLING_CONFIG['high_frequency_period'] if is_high_frequency() else SAMPLING_CONFIG['period']
+
+def create_data_packet(humidity, temperature, device_id=None, timestamp=None):
+    """Create a standardized data packet with timestamp (capture time if given, else now)."""
+    current_time_ist = _get_ist_time(timestamp)
     
-    return {
+    packet = {
         'humidity': float(humidity),
         'temperature_celsius': float(temperature),
         'timestamp_ist': current_time_ist.strftime('%Y-%m-%d %H:%M:%S IST'),
-        'timestamp_unix': int(current_time_ist.timestamp())
+        'timestamp_unix': int(current_time_ist.timestamp()),
+        'timestamp_ms': int(current_time_ist.timestamp() * 1000)
+    }
+    if device_id is not None:
+        packet['device_id'] = device_id
+    if is_tracing_enabled():
+        packet['trace'] = create_trace(timestamp)
+    return packet
+
+def is_tracing_enabled():
+    """Whether packets carry an end-to-end latency trace."""
+    enabled = os.getenv('TRACE_READINGS')
+    if enabled is None:
+        return TRACE_CONFIG['enabled']
+    return enabled.strip().lower() in ('1', 'true', 'yes', 'on')
+
+def _now_ms():
+    return int(time.time() * 1000)
+
+def create_trace(timestamp=None):
+    """New trace with the capture ('read') and packet creation hops.
+
+    Hops are wall-clock epoch milliseconds because later hops are recorded
+    on other machines (Cloud Functions, the ML service).
+    """
+    now = _now_ms()
+    return {
+        'id': uuid.uuid4().hex,
+        'hops': {
+            'read': int(timestamp * 1000) if timestamp is not None else now,
+            'packet': now
+        }
     }
 
-def create_readable_key():
-    """Create a readable key using IST timestamp."""
-    current_time_ist = _get_ist_time()
-    return f"sensor_{current_time_ist.strftime('%Y%m%d_%H%M%S')}"
+def mark_hop(packet, hop):
+    """Record the current time as a hop of the packet's trace, if it has one."""
+    trace = packet.get('trace')
+    if trace is not None:
+        trace['hops'][hop] = _now_ms()
+
+# Tie-breaker for sub-second keys created within the same microsecond
+_key_sequence = itertools.count()
+
+def create_readable_key(device_id=None, timestamp=None, sub_second=None):
+    """Create a readable key using IST timestamp, suffixed with the device id if given.
+
+    Sub-second keys (the default in high-frequency mode) look like
+    sensor_20250101_083000_123456_000042 and sort in capture order.
+    """
+    current_time_ist = _get_ist_time(timestamp)
+    if sub_second is None:
+        sub_second = is_high_frequency()
+    if sub_second:
+        sequence = next(_key_sequence) % 1000000
+        key = f"sensor_{current_time_ist.strftime('%Y%m%d_%H%M%S_%f')}_{sequence:06d}"
+    else:
+        key = f"sensor_{current_time_ist.strftime('%Y%m%d_%H%M%S')}"
+    return f"{key}_{device_id}" if device_id is not None else key
 
-def read_sensor_data_from_arduino(arduino_connection):
+def create_reading(humidity, temperature, device_id=None, timestamp=None):
+    """Create a (key, packet) pair that share one capture timestamp."""
+    if timestamp is None:
+        timestamp = time.time()
+    return (create_readable_key(device_id, timestamp),
+            create_data_packet(humidity, temperature, device_id, timestamp))
+
+def parse_sensor_line(line):
+    """Parse a 'humidity,temperature' line sent by the Arduino."""
+    if not line or ',' not in line:
+        return None, None, f"No valid sensor data received (got: '{line}')"
+    
+    try:
+        humidity, temperature = (float(value) for value in line.split(','))
+    except ValueError:
+        return None, None, f"Could not parse sensor line: '{line}'"
+    if not (math.isfinite(humidity) and math.isfinite(temperature)):
+        return None, None, f"Sensor line has non-finite values: '{line}'"
+    return humidity, temperature, None
+
+def read_sensor_data_from_arduino(arduino_connection, device_id='default', mode='continuous'):
     """Read sensor data from Arduino connection."""
+    def timed(phase, func, *args):
+        start = time.perf_counter()
+        try:
+            return func(*args)
+        finally:
+            metric_serial_read_seconds.labels(device=device_id, mode=mode, phase=phase).observe(
+                time.perf_counter() - start
+            )
+    
     try:
         # Clear buffer and wait for fresh data
-        arduino_connection.flushInput()
-        time.sleep(1)
+        timed('flush', arduino_connection.flushInput)
+        timed('settle', time.sleep, 1)
         
         # Read sensor data with longer timeout
-        line = arduino_connection.readline().decode('utf-8').strip()
+        line = timed('readline', arduino_connection.readline).decode('utf-8').strip()
         
         # If no data or not sensor data, wait longer and try again
         if not line or ',' not in line:
-            time.sleep(5)  # Wait longer for Arduino to send data
-            line = arduino_connection.readline().decode('utf-8').strip()
+            timed('settle', time.sleep, 5)  # Wait longer for Arduino to send data
+            line = timed('readline', arduino_connection.readline).decode('utf-8').strip()
         
-        if line and ',' in line:
-            humidity, temperature = line.split(',')
-            return float(humidity), float(temperature), None
-        else:
-            return None, None, f"No valid sensor data received (got: '{line}')"
+        humidity, temperature, error = parse_sensor_line(line)
+        if error:
+            kind = 'timeout' if not line else ('value' if ',' in line else 'status')
+            metric_parse_failures_total.labels(device=device_id, mode=mode, kind=kind).inc()
+        return humidity, temperature, error
             
     except Exception as e:
+        metric_parse_failures_total.labels(device=device_id, mode=mode, kind='io').inc()
         return None, None, f"Error reading sensor: {str(e)}"
 
-def send_to_firebase(data_type, humidity, temperature):
+def send_to_firebase(data_type, humidity, temperature, device_id=None):
     """Send sensor data to Firebase with specified data type."""
     try:
         ref = get_firebase_ref(data_type)
-        data_packet = create_data_packet(humidity, temperature)
-        readable_key = create_readable_key()
+        readable_key, data_packet = create_reading(humidity, temperature, device_id)
         
+        start = time.perf_counter()
+        mark_hop(data_packet, 'upload')
         ref.child(readable_key).set(data_packet)
+        metric_firebase_write_seconds.labels(device=device_id or 'default', mode=data_type).observe(
+            time.perf_counter() - start
+        )
         print(f"Data sent to Firebase ({data_type}): {data_packet}")
         return True
     except Exception as e:
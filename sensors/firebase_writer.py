@@ -0,0 +1,151 @@
+import threading
+import time
+from firebase_utils import get_root_ref, create_reading, mark_hop
+from spool import MemoryQueue
+from config import FIREBASE_KEYS, FIREBASE_WRITER_CONFIG
+from metrics import (
+    timed_lock,
+    metric_queue_depth,
+    metric_firebase_write_seconds,
+    metric_firebase_writes_total,
+    metric_firebase_queue_depth,
+    metric_firebase_flush_seconds,
+    metric_firebase_flush_batch_size,
+)
+
+class FirebaseBatchWriter(threading.Thread):
+    """Write-behind queue that groups readings into multi-path Firebase updates.
+
+    Pending writes live in an in-memory queue, or in a durable ReadingSpool when
+    one is given, in which case the flusher also replays whatever an earlier
+    run left behind.
+    """
+
+    def __init__(self, batch_size=FIREBASE_WRITER_CONFIG['batch_size'],
+                 flush_interval=FIREBASE_WRITER_CONFIG['flush_interval'],
+                 max_queue=FIREBASE_WRITER_CONFIG['max_queue'],
+                 max_retries=FIREBASE_WRITER_CONFIG['max_retries'],
+                 backoff_initial=FIREBASE_WRITER_CONFIG['backoff_initial'],
+                 backoff_max=FIREBASE_WRITER_CONFIG['backoff_max'],
+                 spool=None):
+        super().__init__(daemon=True)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_queue = max_queue
+        self.max_retries = max_retries
+        self.backoff_initial = backoff_initial
+        self.backoff_max = backoff_max
+        self._queue = spool if spool is not None else MemoryQueue(max_queue)
+        self._condition = threading.Condition()
+        self._stop_event = threading.Event()
+        self._depth_labels = set()
+        self._depth_updated = 0
+
+    def enqueue(self, data_type, humidity, temperature, device_id=None, timestamp=None):
+        """Queue a reading for the next batched write and return immediately."""
+        if data_type not in FIREBASE_KEYS:
+            raise ValueError(f"Invalid data type: {data_type}. Must be one of {list(FIREBASE_KEYS.keys())}")
+
+        # Build the packet now so its timestamp reflects capture time, not flush time
+        key, data_packet = create_reading(humidity, temperature, device_id, timestamp)
+        path = f"{FIREBASE_KEYS[data_type]}/{key}"
+
+        with timed_lock(self._condition, 'firebase_queue', device_id or 'default', data_type):
+            self._queue.append(data_type, path, data_packet)
+            metric_firebase_queue_depth.set(len(self._queue))
+            if len(self._queue) >= self.batch_size:
+                self._condition.notify()
+        return True
+
+    def _take_batch(self, wait=True):
+        """Wait for a full batch or the flush interval, then return up to batch_size pending writes."""
+        with self._condition:
+            if wait:
+                self._condition.wait_for(
+                    lambda: self._stop_event.is_set() or len(self._queue) >= self.batch_size,
+                    timeout=self.flush_interval
+                )
+            return self._queue.peek(self.batch_size)
+
+    def _ack(self, batch):
+        """Drop a delivered batch from the queue."""
+        with self._condition:
+            self._queue.ack(batch)
+            metric_firebase_queue_depth.set(len(self._queue))
+
+    def _flush(self, batch):
+        """Send one batch as a single multi-path update, retrying with exponential backoff."""
+        updates = {path: data_packet for _, _, path, data_packet in batch}
+        delay = self.backoff_initial
+
+        for attempt in range(1, self.max_retries + 1):
+            start = time.perf_counter()
+            for data_packet in updates.values():
+                mark_hop(data_packet, 'upload')
+            try:
+                get_root_ref().update(updates)
+                elapsed = time.perf_counter() - start
+                metric_firebase_flush_seconds.observe(elapsed)
+                for device_id, data_type in {(packet.get('device_id', 'default'), data_type)
+                                             for _, data_type, _, packet in batch}:
+                    metric_firebase_write_seconds.labels(device=device_id, mode=data_type).observe(elapsed)
+                metric_firebase_flush_batch_size.observe(len(batch))
+                for _, data_type, _, _ in batch:
+                    metric_firebase_writes_total.labels(mode=data_type, status='success').inc()
+                print(f"Flushed {len(batch)} readings to Firebase")
+                return True
+            except Exception as e:
+                print(f"Error flushing {len(batch)} readings to Firebase (attempt {attempt}/{self.max_retries}): {e}")
+                if attempt < self.max_retries and not self._stop_event.is_set():
+                    self._stop_event.wait(delay)
+                    delay = min(delay * 2, self.backoff_max)
+
+        for _, data_type, _, _ in batch:
+            metric_firebase_writes_total.labels(mode=data_type, status='failure').inc()
+        return False
+
+    def _update_depth_metrics(self, force=False):
+        """Publish pending writes per device and mode, at most once per flush interval."""
+        if not force and time.monotonic() - self._depth_updated < self.flush_interval:
+            return
+        self._depth_updated = time.monotonic()
+        counts = self._queue.counts()
+        # Zero out combinations that have drained so their last value does not linger
+        for device_id, data_type in self._depth_labels - set(counts):
+            metric_queue_depth.labels(queue='firebase', device=device_id, mode=data_type).set(0)
+        for (device_id, data_type), count in counts.items():
+            metric_queue_depth.labels(queue='firebase', device=device_id, mode=data_type).set(count)
+        self._depth_labels |= set(counts)
+
+    def run(self):
+        """Flush batches until stopped and the queue is drained."""
+        backlog = len(self._queue) >= self.batch_size
+        self._update_depth_metrics(force=True)
+        while True:
+            self._update_depth_metrics()
+            # Catch up on a backlog without waiting for the flush interval
+            batch = self._take_batch(wait=not backlog)
+            if batch and self._flush(batch):
+                self._ack(batch)
+                backlog = len(self._queue) >= self.batch_size
+            elif batch:
+                # Failed batches stay queued and are retried after a pause
+                if self._stop_event.is_set():
+                    return
+                self._stop_event.wait(self.backoff_max)
+                backlog = True
+            elif self._stop_event.is_set():
+                self._update_depth_metrics(force=True)
+                return
+
+    def stop(self, timeout=None):
+        """Flush whatever is queued and stop the background flusher."""
+        with self._condition:
+            self._stop_event.set()
+            self._condition.notify()
+        self.join(timeout)
+
+    def queue_depth(self):
+        """Number of readings waiting to be written."""
+        with self._condition:
+            return len(self._queue)
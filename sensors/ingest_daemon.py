@@ -0,0 +1,249 @@
+#!/usr/bin/env python3
+"""
+Asyncio ingestion daemon that reads many Arduino serial ports in one process.
+"""
+
+import asyncio
+import json
+import os
+import re
+import threading
+import time
+import serial
+from firebase_utils import initialize_firebase
+from serial_reader import ReadingBuffer
+from protocol import FrameParser
+from config import SERIAL_CONFIG, DEVICES, INGEST_CONFIG
+from metrics import metric_device_connected, metric_device_reconnects_total, metric_serial_read_seconds
+
+# Device ids end up in Firebase keys, so they must be valid RTDB key characters
+_DEVICE_ID_PATTERN = re.compile(r'^[A-Za-z0-9_-]+$')
+
+def load_devices():
+    """Load the device list from SENSOR_DEVICES (JSON or JSON file path), falling back to config."""
+    raw = os.getenv('SENSOR_DEVICES')
+    if raw:
+        if os.path.isfile(raw):
+            with open(raw) as f:
+                devices = json.load(f)
+        else:
+            devices = json.loads(raw)
+    else:
+        devices = [dict(device) for device in DEVICES]
+        # Keep honouring the single-port environment overrides for the default device
+        if len(devices) == 1:
+            devices[0]['port'] = os.getenv('SERIAL_PORT', devices[0]['port'])
+            devices[0]['baud_rate'] = int(os.getenv('BAUD_RATE', devices[0]['baud_rate']))
+            devices[0]['id'] = os.getenv('DEVICE_ID', devices[0]['id'])
+
+    seen = set()
+    for device in devices:
+        if not _DEVICE_ID_PATTERN.match(str(device.get('id', ''))):
+            raise ValueError(f"Invalid device id: {device.get('id')!r}. Use letters, digits, '-' or '_'")
+        if device['id'] in seen:
+            raise ValueError(f"Duplicate device id: {device['id']}")
+        if 'port' not in device:
+            raise ValueError(f"Device {device['id']} has no serial port")
+        device.setdefault('baud_rate', SERIAL_CONFIG['baud_rate'])
+        seen.add(device['id'])
+    return devices
+
+class DeviceIngestor:
+    """Reads one serial port with non-blocking I/O and reconnects with exponential backoff."""
+
+    def __init__(self, device_id, port, baud_rate, buffer, on_reading=None, on_line=None,
+                 reconnect_initial=INGEST_CONFIG['reconnect_initial'],
+                 reconnect_max=INGEST_CONFIG['reconnect_max'], mode='continuous'):
+        self.device_id = device_id
+        self.mode = mode
+        self.port = port
+        self.baud_rate = baud_rate
+        self.buffer = buffer
+        self.on_reading = on_reading
+        self.on_line = on_line
+        self.reconnect_initial = reconnect_initial
+        self.reconnect_max = reconnect_max
+        self.connection = None
+        self.connected = False
+        self.last_error = None
+        self._parser = FrameParser(device_id, mode)
+
+    async def _open(self):
+        """Open the port off the event loop and wait for the board to reset."""
+        loop = asyncio.get_running_loop()
+        start = time.perf_counter()
+        self.connection = await loop.run_in_executor(
+            None, lambda: serial.Serial(self.port, self.baud_rate, timeout=0)
+        )
+        await asyncio.sleep(2)  # Wait for connection to establish
+        self.connection.reset_input_buffer()
+        self._observe('open', start)
+        self._parser = FrameParser(self.device_id, self.mode)
+        self.connected = True
+        metric_device_connected.labels(device=self.device_id).set(1)
+        print(f"[{self.device_id}] Arduino connected on {self.port} at {self.baud_rate} baud")
+
+    def _close(self):
+        """Close the port, ignoring errors from an already broken handle."""
+        self.connected = False
+        metric_device_connected.labels(device=self.device_id).set(0)
+        if self.connection is not None:
+            try:
+                self.connection.close()
+            except Exception:
+                pass
+            self.connection = None
+
+    def _observe(self, phase, start):
+        metric_serial_read_seconds.labels(device=self.device_id, mode=self.mode, phase=phase).observe(
+            time.perf_counter() - start
+        )
+
+    def _emit(self, humidity, temperature, error):
+        """Invoke a callback without letting its failures reach the read loop."""
+        if self.on_line:
+            try:
+                self.on_line(self.device_id, humidity, temperature, error)
+            except Exception:
+                pass
+
+    def _handle_item(self, item):
+        """Push one parsed CSV line or binary frame into the device buffer."""
+        error = item.get('error')
+        if error:
+            self.last_error = error
+            self._emit(None, None, error)
+            return
+
+        self.last_error = None
+        reading = self.buffer.append(item['humidity'], item['temperature_celsius'])
+        if self.on_reading:
+            try:
+                self.on_reading(reading)
+            except Exception as e:
+                print(f"[{self.device_id}] Reading callback failed: {e}")
+        self._emit(item['humidity'], item['temperature_celsius'], None)
+
+    def _feed(self, data):
+        """Parse incoming bytes (CSV lines and/or binary frames) in bulk."""
+        for item in self._parser.feed(data):
+            self._handle_item(item)
+
+    async def _read_until_closed(self):
+        """Dispatch data from the port's file descriptor until it fails."""
+        loop = asyncio.get_running_loop()
+        closed = loop.create_future()
+        fd = self.connection.fileno()
+
+        def on_readable():
+            start = time.perf_counter()
+            try:
+                data = self.connection.read(self.connection.in_waiting or 1)
+                self._observe('read', start)
+            except Exception as e:
+                if not closed.done():
+                    closed.set_exception(e)
+                return
+            self._feed(data)
+
+        loop.add_reader(fd, on_readable)
+        try:
+            await closed
+        finally:
+            loop.remove_reader(fd)
+
+    async def run(self):
+        """Read the device forever, reconnecting with exponential backoff."""
+        delay = self.reconnect_initial
+        while True:
+            try:
+                await self._open()
+                delay = self.reconnect_initial
+                await self._read_until_closed()
+            except asyncio.CancelledError:
+                self._close()
+                raise
+            except Exception as e:
+                self.last_error = f"Error reading sensor: {str(e)}"
+                print(f"[{self.device_id}] Serial error on {self.port}: {e}. Reconnecting in {delay}s")
+            self._close()
+            metric_device_reconnects_total.labels(device=self.device_id).inc()
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, self.reconnect_max)
+
+class IngestDaemon:
+    """Runs one DeviceIngestor per configured device on a single event loop."""
+
+    def __init__(self, devices, on_reading=None, on_line=None, mode='continuous'):
+        self.buffers = {}
+        self.ingestors = {}
+        for device in devices:
+            buffer = ReadingBuffer(device_id=device['id'])
+            self.buffers[device['id']] = buffer
+            self.ingestors[device['id']] = DeviceIngestor(
+                device['id'], device['port'], int(device['baud_rate']), buffer,
+                on_reading=on_reading, on_line=on_line, mode=mode
+            )
+        self._loop = None
+        self._thread = None
+
+    @property
+    def device_ids(self):
+        return list(self.ingestors)
+
+    async def run(self):
+        """Ingest from all devices until cancelled."""
+        self._loop = asyncio.get_running_loop()
+        await asyncio.gather(*(ingestor.run() for ingestor in self.ingestors.values()))
+
+    def _run_in_thread(self):
+        try:
+            asyncio.run(self.run())
+        except asyncio.CancelledError:
+            pass  # stop() was called
+
+    def start_in_thread(self):
+        """Run the event loop in a daemon thread so threaded servers can share the buffers."""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run_in_thread, daemon=True)
+            self._thread.start()
+        return self._thread
+
+    def stop(self):
+        """Cancel all device tasks running on the daemon's loop."""
+        if self._loop is not None:
+            for task in asyncio.all_tasks(self._loop):
+                self._loop.call_soon_threadsafe(task.cancel)
+
+def main():
+    """Ingest all configured devices and fan readings out to the configured sinks."""
+    from sinks import SinkDispatcher, create_sinks
+
+    print("Starting multi-device sensor ingestion daemon...")
+
+    try:
+        initialize_firebase()
+        print("Firebase initialized successfully")
+    except Exception as e:
+        print(f"Firebase initialization failed: {e}")
+        return
+
+    devices = load_devices()
+    # Each sink samples, batches and retries on its own thread, off the read loop
+    dispatcher = SinkDispatcher(create_sinks(os.getenv('SENSOR_SINKS', 'firebase')))
+    dispatcher.start()
+
+    daemon = IngestDaemon(devices, on_reading=dispatcher.dispatch)
+    print(f"Ingesting {len(devices)} device(s): {', '.join(daemon.device_ids)}")
+    print(f"Sinks: {', '.join(sink.sink_name for sink in dispatcher.sinks)}")
+
+    try:
+        asyncio.run(daemon.run())
+    except KeyboardInterrupt:
+        print("Stopping ingestion daemon...")
+    finally:
+        # Flush what we can before exiting; spooled Firebase writes are replayed on the next start
+        dispatcher.stop(timeout=30)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,299 @@
+#!/usr/bin/env python3
+"""
+End-to-end ingest load generator.
+
+Drives virtual devices (see simulator.py) through one of the ingest paths
+into an in-memory Firebase stand-in, then reports readings/sec and the
+latency from parsing a reading to its arrival in Firebase:
+
+    legacy  read_sensor_data_from_arduino + send_to_firebase, one thread per device
+    reader  SerialReader threads -> ReadingBuffer -> FirebaseBatchWriter
+    daemon  asyncio IngestDaemon -> ReadingBuffer -> FirebaseBatchWriter
+
+Usage: python loadgen.py --path daemon --devices 8 --rate 200 --duration 30
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import random
+import sys
+import threading
+import time
+import serial
+import firebase_utils
+from firebase_utils import read_sensor_data_from_arduino, send_to_firebase
+from firebase_writer import FirebaseBatchWriter
+from ingest_daemon import IngestDaemon
+from serial_reader import ReadingBuffer, SerialReader
+from simulator import add_stream_arguments, start_devices, stream_options
+from config import FIREBASE_KEYS, FIREBASE_WRITER_CONFIG
+
+class FakeFirebase:
+    """In-memory stand-in for the Realtime Database that records arrival latency."""
+
+    def __init__(self, latency=0.0, failure_rate=0.0, seed=None):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.data = {}
+        self.calls = 0
+        self.writes = 0
+        self.failures = 0
+        self.latencies = []
+        self.first_arrival = None
+        self.last_arrival = None
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def store(self, updates):
+        """Apply a multi-path update, after the simulated round trip."""
+        if self.latency:
+            time.sleep(self.latency)
+        with self._lock:
+            if self.failure_rate and self._random.random() < self.failure_rate:
+                self.failures += 1
+                raise ConnectionError("Simulated Firebase outage")
+            now = time.time()
+            self.calls += 1
+            self.writes += len(updates)
+            self.first_arrival = self.first_arrival or now
+            self.last_arrival = now
+            for path, packet in updates.items():
+                self.data[path] = packet
+                self.latencies.append(now - packet['timestamp_ms'] / 1000)
+
+    def reference(self, path):
+        return _FakeReference(self, path)
+
+    def install(self):
+        """Point the cached firebase_utils references at this stand-in."""
+        firebase_utils._firebase_refs['/'] = self.reference('/')
+        for path in FIREBASE_KEYS.values():
+            firebase_utils._firebase_refs[path] = self.reference(path)
+
+class _FakeReference:
+    """The subset of firebase_admin.db.Reference used by the sensors package."""
+
+    def __init__(self, database, path):
+        self.database = database
+        self.path = path.strip('/')
+
+    def _join(self, key):
+        return f"{self.path}/{key}" if self.path else key
+
+    def child(self, key):
+        return _FakeReference(self.database, self._join(key))
+
+    def set(self, value):
+        self.database.store({self.path: value})
+
+    def update(self, updates):
+        self.database.store({self._join(key): value for key, value in updates.items()})
+
+class LoadStats:
+    """Counters shared by the ingest workers."""
+
+    def __init__(self):
+        self.parsed = 0
+        self.parse_errors = 0
+        self.overruns = 0
+        self._lock = threading.Lock()
+
+    def add(self, field, count=1):
+        with self._lock:
+            setattr(self, field, getattr(self, field) + count)
+
+def _percentile(values, fraction):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+def run_legacy(devices, stats, stop_event):
+    """One blocking read_sensor_data_from_arduino/send_to_firebase loop per device."""
+
+    def worker(device):
+        connection = None
+        while not stop_event.is_set():
+            try:
+                if connection is None:
+                    connection = serial.Serial(device.port, 9600, timeout=1)
+                humidity, temperature, error = read_sensor_data_from_arduino(connection, device.device_id)
+            except serial.SerialException:
+                connection, error = None, 'Error reading sensor: port unavailable'
+            if error:
+                stats.add('parse_errors')
+                if error.startswith('Error reading sensor'):
+                    # The port went away; reopen it after a pause like a restarted script would
+                    if connection is not None:
+                        connection.close()
+                    connection = None
+                    stop_event.wait(1)
+                continue
+            stats.add('parsed')
+            send_to_firebase('continuous', humidity, temperature, device.device_id)
+        if connection is not None:
+            connection.close()
+
+    threads = [threading.Thread(target=worker, args=(device,), daemon=True) for device in devices]
+    for thread in threads:
+        thread.start()
+
+    def stop():
+        stop_event.set()
+        for thread in threads:
+            thread.join(timeout=10)
+    return stop
+
+def _enqueue_reading(writer, stats, reading):
+    stats.add('parsed')
+    writer.enqueue('continuous', reading['humidity'], reading['temperature_celsius'],
+                   reading['device_id'], reading['timestamp'])
+
+def run_reader(devices, stats, stop_event, writer):
+    """A SerialReader thread per device, drained by one consumer thread per buffer."""
+    readers = []
+    consumers = []
+
+    def on_line(humidity, temperature, error):
+        if error:
+            stats.add('parse_errors')
+
+    def consume(buffer):
+        last_seq = 0
+        while not stop_event.is_set():
+            if buffer.wait_for_new(last_seq, timeout=0.5) is None:
+                continue
+            readings = buffer.since(last_seq)
+            # Readings evicted from the ring buffer before we got to them
+            stats.add('overruns', readings[0]['seq'] - last_seq - 1)
+            for reading in readings:
+                _enqueue_reading(writer, stats, reading)
+            last_seq = readings[-1]['seq']
+
+    for device in devices:
+        buffer = ReadingBuffer(device_id=device.device_id)
+        reader = SerialReader(device.port, 9600, timeout=0.1, buffer=buffer, on_line=on_line, reconnect_delay=1)
+        reader.start()
+        readers.append(reader)
+        consumer = threading.Thread(target=consume, args=(buffer,), daemon=True)
+        consumer.start()
+        consumers.append(consumer)
+
+    def stop():
+        stop_event.set()
+        for reader in readers:
+            reader.stop()
+        for thread in readers + consumers:
+            thread.join(timeout=5)
+    return stop
+
+def run_daemon(devices, stats, stop_event, writer):
+    """The asyncio IngestDaemon reading every device on one event loop."""
+
+    def on_line(device_id, humidity, temperature, error):
+        if error:
+            stats.add('parse_errors')
+
+    daemon = IngestDaemon(
+        [{'id': device.device_id, 'port': device.port, 'baud_rate': 9600} for device in devices],
+        on_reading=lambda reading: _enqueue_reading(writer, stats, reading),
+        on_line=on_line
+    )
+    thread = daemon.start_in_thread()
+
+    def stop():
+        stop_event.set()
+        daemon.stop()
+        thread.join(timeout=5)
+    return stop
+
+def run_load(args):
+    """Run one load test and return its results as a dict."""
+    # Second-resolution keys would collapse readings and hide lost data
+    os.environ.setdefault('HIGH_FREQUENCY', '1')
+    database = FakeFirebase(args.firebase_latency, args.firebase_failures, args.seed)
+    database.install()
+    stats = LoadStats()
+    stop_event = threading.Event()
+
+    # Ports exist but stay silent until the ingest path has opened them
+    devices = start_devices(args.devices, args.link_dir, paused=True, **stream_options(args))
+    writer = None
+    if args.path == 'legacy':
+        stop = run_legacy(devices, stats, stop_event)
+    else:
+        writer = FirebaseBatchWriter(batch_size=args.batch_size, flush_interval=args.flush_interval,
+                                     max_queue=args.max_queue, backoff_initial=0.1, backoff_max=1)
+        writer.start()
+        runner = run_reader if args.path == 'reader' else run_daemon
+        stop = runner(devices, stats, stop_event, writer)
+
+    time.sleep(args.warmup)
+    start = time.time()
+    for device in devices:
+        device.resume()
+    time.sleep(args.duration)
+    for device in devices:
+        device.stop()
+    stop()
+    if writer is not None:
+        writer.stop(timeout=30)
+    elapsed = time.time() - start
+
+    active = (database.last_arrival - database.first_arrival) if database.writes > 1 else None
+    latencies = database.latencies
+    return {
+        'path': args.path,
+        'devices': args.devices,
+        'offered_rate': args.rate * args.devices,
+        'duration': round(elapsed, 3),
+        'emitted': sum(device.emitted for device in devices),
+        'malformed_sent': sum(device.malformed_sent for device in devices),
+        'disconnects': sum(device.disconnects for device in devices),
+        'parsed': stats.parsed,
+        'parse_errors': stats.parse_errors,
+        'buffer_overruns': stats.overruns,
+        'delivered': database.writes,
+        'unique_keys': len(database.data),
+        'firebase_calls': database.calls,
+        'firebase_failures': database.failures,
+        'readings_per_second': round(database.writes / active, 1) if active else None,
+        'latency_p50_ms': _ms(_percentile(latencies, 0.5)),
+        'latency_p95_ms': _ms(_percentile(latencies, 0.95)),
+        'latency_p99_ms': _ms(_percentile(latencies, 0.99)),
+        'latency_max_ms': _ms(max(latencies) if latencies else None),
+    }
+
+def _ms(seconds):
+    return round(seconds * 1000, 2) if seconds is not None else None
+
+def main():
+    parser = argparse.ArgumentParser(description='Drive simulated devices through the ingest path and report throughput.')
+    add_stream_arguments(parser)
+    parser.add_argument('--path', choices=('legacy', 'reader', 'daemon'), default='daemon', help='Ingest path to exercise')
+    parser.add_argument('--duration', type=float, default=30, help='Seconds to generate load')
+    parser.add_argument('--warmup', type=float, default=3, help='Seconds allowed for the ingest path to open the ports')
+    parser.add_argument('--batch-size', type=int, default=FIREBASE_WRITER_CONFIG['batch_size'])
+    parser.add_argument('--flush-interval', type=float, default=FIREBASE_WRITER_CONFIG['flush_interval'])
+    parser.add_argument('--max-queue', type=int, default=FIREBASE_WRITER_CONFIG['max_queue'])
+    parser.add_argument('--firebase-latency', type=float, default=0.0, help='Simulated Firebase round trip (seconds)')
+    parser.add_argument('--firebase-failures', type=float, default=0.0, help='Fraction of Firebase calls that fail')
+    parser.add_argument('--json', action='store_true', help='Print the results as JSON')
+    parser.add_argument('--verbose', action='store_true', help='Show log output of the ingest path')
+    args = parser.parse_args()
+
+    print(f"Running {args.path} path: {args.devices} device(s) x {args.rate:g} readings/s for {args.duration:g}s...",
+          file=sys.stderr)
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(sys.stdout if args.verbose else devnull):
+        results = run_load(args)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    for key, value in results.items():
+        print(f"{key:>20}: {value}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,238 @@
+import time
+from contextlib import contextmanager
+from prometheus_client import Gauge, Counter, Histogram, CollectorRegistry
+
+# Prometheus metrics registry and metrics
+registry = CollectorRegistry()
+metric_temperature_celsius = Gauge(
+    'sensor_temperature_celsius',
+    'Current sensor temperature in Celsius',
+    ['device'],
+    registry=registry,
+)
+metric_humidity_percent = Gauge(
+    'sensor_humidity_percent',
+    'Current sensor humidity in percent',
+    ['device'],
+    registry=registry,
+)
+metric_last_read_success_unix = Gauge(
+    'sensor_last_read_success_unix',
+    'Unix timestamp of last successful sensor read',
+    ['device'],
+    registry=registry,
+)
+metric_reads_total = Counter(
+    'sensor_reads_total',
+    'Total sensor read attempts',
+    ['device'],
+    registry=registry,
+)
+metric_read_errors_total = Counter(
+    'sensor_read_errors_total',
+    'Total sensor read errors',
+    ['device'],
+    registry=registry,
+)
+metric_firebase_writes_total = Counter(
+    'firebase_writes_total',
+    'Total Firebase write attempts by mode',
+    ['mode', 'status'],
+    registry=registry,
+)
+metric_device_connected = Gauge(
+    'sensor_device_connected',
+    'Whether the serial port of a device is currently open (1) or not (0)',
+    ['device'],
+    registry=registry,
+)
+metric_device_reconnects_total = Counter(
+    'sensor_device_reconnects_total',
+    'Total serial reconnect attempts per device',
+    ['device'],
+    registry=registry,
+)
+metric_firebase_queue_depth = Gauge(
+    'firebase_write_queue_depth',
+    'Readings waiting in the Firebase write-behind queue',
+    registry=registry,
+)
+metric_firebase_flush_seconds = Histogram(
+    'firebase_flush_duration_seconds',
+    'Latency of batched Firebase multi-path updates',
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+    registry=registry,
+)
+metric_firebase_flush_batch_size = Histogram(
+    'firebase_flush_batch_size',
+    'Number of readings per batched Firebase update',
+    buckets=(1, 5, 10, 25, 50, 100, 250, 500),
+    registry=registry,
+)
+metric_firebase_dropped_total = Counter(
+    'firebase_write_dropped_total',
+    'Readings dropped because the Firebase write-behind queue was full',
+    registry=registry,
+)
+metric_stream_clients = Gauge(
+    'sensor_stream_clients',
+    'Currently connected live stream subscribers',
+    registry=registry,
+)
+metric_stream_evictions_total = Counter(
+    'sensor_stream_evictions_total',
+    'Stream subscribers disconnected for falling behind',
+    registry=registry,
+)
+metric_compression_readings_total = Counter(
+    'sensor_compression_readings_total',
+    'Readings seen by the upload compressor by decision',
+    ['device', 'decision'],
+    registry=registry,
+)
+metric_compression_ratio = Gauge(
+    'sensor_compression_ratio',
+    'Readings received per reading uploaded',
+    ['device'],
+    registry=registry,
+)
+metric_scheduler_runs_total = Counter(
+    'scheduler_runs_total',
+    'Scheduled job runs by outcome',
+    ['job', 'status'],
+    registry=registry,
+)
+metric_scheduler_misfires_total = Counter(
+    'scheduler_misfires_total',
+    'Scheduled runs skipped because they fired too late',
+    ['job'],
+    registry=registry,
+)
+metric_scheduler_jitter_seconds = Histogram(
+    'scheduler_jitter_seconds',
+    'Delay between the scheduled and actual start of a job',
+    ['job'],
+    buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 30),
+    registry=registry,
+)
+metric_scheduler_duration_seconds = Histogram(
+    'scheduler_job_duration_seconds',
+    'Run time of scheduled jobs',
+    ['job'],
+    buckets=(0.001, 0.01, 0.05, 0.1, 0.5, 1, 5, 10),
+    registry=registry,
+)
+metric_frames_total = Counter(
+    'sensor_frames_total',
+    'Binary frames decoded per device',
+    ['device'],
+    registry=registry,
+)
+metric_frames_dropped_total = Counter(
+    'sensor_frames_dropped_total',
+    'Binary frames missing according to sequence number gaps',
+    ['device'],
+    registry=registry,
+)
+metric_parse_failures_total = Counter(
+    'sensor_parse_failures_total',
+    'Serial input that did not yield a reading, by category (crc, length, junk, status, value, timeout, io, overflow)',
+    ['device', 'mode', 'kind'],
+    registry=registry,
+)
+metric_sink_queue_depth = Gauge(
+    'sensor_sink_queue_depth',
+    'Readings waiting in each sink queue',
+    ['sink'],
+    registry=registry,
+)
+metric_sink_writes_total = Counter(
+    'sensor_sink_writes_total',
+    'Readings handled by each sink, by outcome (success, failure)',
+    ['sink', 'status'],
+    registry=registry,
+)
+metric_sink_dropped_total = Counter(
+    'sensor_sink_dropped_total',
+    'Readings dropped because a sink queue was full',
+    ['sink'],
+    registry=registry,
+)
+metric_sink_write_seconds = Histogram(
+    'sensor_sink_write_duration_seconds',
+    'Time taken by a sink to write one batch',
+    ['sink'],
+    buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10),
+    registry=registry,
+)
+metric_sampling_interval_seconds = Gauge(
+    'sensor_sampling_interval_seconds',
+    'Current period between continuous uploads per device',
+    ['device'],
+    registry=registry,
+)
+metric_serial_read_seconds = Histogram(
+    'sensor_serial_read_seconds',
+    'Time spent on serial I/O by phase (open, flush, settle, readline, read, wait)',
+    ['device', 'mode', 'phase'],
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 2, 5, 10, 30),
+    registry=registry,
+)
+metric_firebase_write_seconds = Histogram(
+    'firebase_write_duration_seconds',
+    'Latency of successful Firebase writes containing readings of a device',
+    ['device', 'mode'],
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10),
+    registry=registry,
+)
+metric_lock_wait_seconds = Histogram(
+    'sensor_lock_wait_seconds',
+    'Time spent waiting to acquire a shared lock',
+    ['lock', 'device', 'mode'],
+    buckets=(0.00001, 0.0001, 0.001, 0.01, 0.1, 1, 5),
+    registry=registry,
+)
+metric_queue_depth = Gauge(
+    'sensor_queue_depth',
+    'Readings waiting in a write queue',
+    ['queue', 'device', 'mode'],
+    registry=registry,
+)
+metric_trace_hop_seconds = Histogram(
+    'sensor_trace_hop_seconds',
+    'Latency of one hop of a traced reading, from the previous hop to this one',
+    ['hop'],
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10, 30, 60, 300),
+    registry=registry,
+)
+metric_trace_time_to_alert_seconds = Histogram(
+    'sensor_trace_time_to_alert_seconds',
+    'Time from reading capture to the alert notification being sent',
+    buckets=(0.5, 1, 2, 5, 10, 30, 60, 120, 300, 600),
+    registry=registry,
+)
+metric_trace_clock_skew_total = Counter(
+    'sensor_trace_clock_skew_total',
+    'Traced hops recorded before their previous hop, a sign of clock skew between machines',
+    ['hop'],
+    registry=registry,
+)
+metric_mqtt_messages_total = Counter(
+    'sensor_mqtt_messages_total',
+    'MQTT messages received by the bridge, by outcome (accepted, invalid, dropped)',
+    ['status'],
+    registry=registry,
+)
+metric_mqtt_connected = Gauge(
+    'sensor_mqtt_connected',
+    'Whether the MQTT bridge is connected to its broker (1/0)',
+    registry=registry,
+)
+
+@contextmanager
+def timed_lock(lock, name, device='all', mode='all'):
+    """Acquire lock, recording how long the caller waited for it."""
+    start = time.perf_counter()
+    with lock:
+        metric_lock_wait_seconds.labels(lock=name, device=device, mode=mode).observe(time.perf_counter() - start)
+        yield
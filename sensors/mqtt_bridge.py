@@ -0,0 +1,427 @@
+#!/usr/bin/env python3
+"""
+MQTT ingestion bridge for remote sensor nodes.
+
+Subscribes to sensors/+/reading, validates and normalizes each message into
+the same reading the serial ingest paths produce, and fans it out through
+a SinkDispatcher (batched Firebase writes, Prometheus gauges, ...).
+
+Backpressure is applied per topic: every node has its own bounded queue,
+drained round-robin so one chatty node cannot starve the others. While a
+sink queue is above its high-water mark the bridge stops draining.
+
+QoS 1/2 messages are acknowledged manually, only once handed to the sinks.
+Until then they count against the broker's in-flight window, so the broker
+slows delivery instead of the bridge dropping them. A persistent session
+makes the broker keep them while the bridge is offline. QoS 0 messages
+beyond a topic's queue size are dropped, oldest first.
+
+Requires paho-mqtt 2.x for a real broker. LocalBroker is an in-process
+stand-in for trying the bridge without one:
+
+Usage:
+    python mqtt_bridge.py                                 # Broker from MQTT_HOST/MQTT_PORT
+    python mqtt_bridge.py --stand-in --nodes 200 --rate 1 # Simulated nodes, in-memory Firebase
+"""
+
+import argparse
+import itertools
+import json
+import math
+import os
+import random
+import re
+import threading
+import time
+from collections import OrderedDict, deque
+from firebase_utils import initialize_firebase, parse_sensor_line
+from config import MQTT_CONFIG
+from metrics import metric_mqtt_messages_total, metric_mqtt_connected, metric_queue_depth
+
+try:
+    import paho.mqtt.client as mqtt
+except ImportError:  # Only needed for a real broker
+    mqtt = None
+
+# Device ids end up in Firebase keys, so they must be valid RTDB key characters
+_DEVICE_ID_PATTERN = re.compile(r'^[A-Za-z0-9_-]+$')
+
+# Physical range of the DHT11/DHT22 sensors used by the nodes
+_RANGES = {'humidity': (0.0, 100.0), 'temperature_celsius': (-40.0, 80.0)}
+
+def parse_message(topic, payload, received_at=None, max_clock_skew=MQTT_CONFIG['max_clock_skew'],
+                  max_reading_age=MQTT_CONFIG['max_reading_age']):
+    """Normalize an MQTT message into a reading dict; returns (reading, error)."""
+    received_at = received_at if received_at is not None else time.time()
+    parts = topic.split('/')
+    if len(parts) != 3 or not _DEVICE_ID_PATTERN.match(parts[1]):
+        return None, f"Unexpected topic: {topic}"
+    device_id = parts[1]
+
+    try:
+        text = payload.decode('utf-8').strip()
+    except UnicodeDecodeError:
+        return None, "Payload is not UTF-8"
+
+    timestamp = None
+    if text.startswith('{'):
+        try:
+            data = json.loads(text)
+            humidity = float(data['humidity'])
+            temperature = float(data.get('temperature_celsius', data.get('temperature')))
+            timestamp = data.get('timestamp')
+        except (ValueError, TypeError, KeyError) as e:
+            return None, f"Invalid JSON reading: {e}"
+    else:
+        humidity, temperature, error = parse_sensor_line(text)
+        if error:
+            return None, error
+
+    reading = {'humidity': humidity, 'temperature_celsius': temperature}
+    for channel, (low, high) in _RANGES.items():
+        if not (math.isfinite(reading[channel]) and low <= reading[channel] <= high):
+            return None, f"{channel} out of range: {reading[channel]}"
+
+    if timestamp is not None:
+        try:
+            timestamp = float(timestamp)
+        except (ValueError, TypeError):
+            return None, f"Invalid timestamp: {timestamp!r}"
+        if not math.isfinite(timestamp):
+            return None, f"Invalid timestamp: {timestamp!r}"
+        if timestamp > 1e12:
+            timestamp /= 1000  # Milliseconds
+        if 0 < timestamp < received_at - max_reading_age:
+            return None, f"Timestamp too old: {timestamp}"
+    # Nodes without an RTC (or with a clock far ahead) are stamped on arrival
+    if timestamp is None or timestamp > received_at + max_clock_skew or timestamp <= 0:
+        timestamp = received_at
+
+    reading['timestamp'] = timestamp
+    reading['device_id'] = device_id
+    return reading, None
+
+class _PendingMessage:
+    """A validated reading waiting to be handed to the sinks, with what is needed to ack it."""
+
+    __slots__ = ('reading', 'mid', 'qos')
+
+    def __init__(self, reading, mid, qos):
+        self.reading = reading
+        self.mid = mid
+        self.qos = qos
+
+class MqttBridge:
+    """Subscribes to sensor topics and forwards readings to a SinkDispatcher."""
+
+    def __init__(self, dispatcher, client, topic=MQTT_CONFIG['topic'], qos=MQTT_CONFIG['qos'],
+                 topic_queue_size=MQTT_CONFIG['topic_queue_size'], high_water=MQTT_CONFIG['high_water']):
+        self.dispatcher = dispatcher
+        self.client = client
+        self.topic = topic
+        self.qos = qos
+        self.topic_queue_size = topic_queue_size
+        self.high_water = high_water
+        self.accepted = 0
+        self.invalid = 0
+        self.dropped = 0
+        self.last_error = None
+        self._queues = OrderedDict()
+        self._condition = threading.Condition()
+        self._stop_event = threading.Event()
+        self._worker = threading.Thread(target=self._drain, name='mqtt-bridge', daemon=True)
+
+        client.on_connect = self._on_connect
+        client.on_disconnect = self._on_disconnect
+        client.on_message = self._on_message
+
+    def _on_connect(self, client, userdata, flags, reason_code, properties=None):
+        if getattr(reason_code, 'is_failure', False):
+            print(f"MQTT connection refused: {reason_code}")
+            return
+        # Subscribe on every (re)connect; the persistent session keeps queued QoS 1/2 messages
+        client.subscribe(self.topic, self.qos)
+        metric_mqtt_connected.set(1)
+        print(f"MQTT connected, subscribed to {self.topic} (QoS {self.qos})")
+
+    def _on_disconnect(self, client, userdata, flags, reason_code, properties=None):
+        metric_mqtt_connected.set(0)
+        print(f"MQTT disconnected: {reason_code}")
+
+    def _on_message(self, client, userdata, message):
+        self.handle_message(message.topic, message.payload, message.qos, message.mid)
+
+    def _ack(self, mid, qos):
+        if qos > 0:
+            self.client.ack(mid, qos)
+
+    def handle_message(self, topic, payload, qos=0, mid=None):
+        """Validate a message and queue it on its topic; called on the MQTT network thread."""
+        reading, error = parse_message(topic, payload)
+        if error:
+            # Redelivering an invalid message would not help, so acknowledge it right away
+            self.invalid += 1
+            self.last_error = error
+            metric_mqtt_messages_total.labels(status='invalid').inc()
+            self._ack(mid, qos)
+            return
+
+        with self._condition:
+            queue = self._queues.get(topic)
+            if queue is None:
+                queue = self._queues[topic] = deque()
+            if qos == 0 and len(queue) >= self.topic_queue_size:
+                # Unacknowledged QoS 1/2 messages are bounded by the broker's in-flight window instead
+                queue.popleft()
+                self.dropped += 1
+                metric_mqtt_messages_total.labels(status='dropped').inc()
+            queue.append(_PendingMessage(reading, mid, qos))
+            self._condition.notify()
+
+    def _take_round(self):
+        """Up to one reading per topic, so every node gets the same share of throughput."""
+        with self._condition:
+            self._condition.wait_for(
+                lambda: self._stop_event.is_set() or any(self._queues.values()), timeout=1
+            )
+            round_ = []
+            for topic, queue in self._queues.items():
+                if queue:
+                    round_.append(queue.popleft())
+            return round_
+
+    def _drain(self):
+        while True:
+            # Hold readings (and their acks) while the sinks are saturated
+            while not self._stop_event.is_set() and self.dispatcher.load() >= self.high_water:
+                self._stop_event.wait(0.1)
+            round_ = self._take_round()
+            if not round_:
+                if self._stop_event.is_set():
+                    return
+                continue
+            for message in round_:
+                self.dispatcher.dispatch(message.reading)
+                self._ack(message.mid, message.qos)
+            self.accepted += len(round_)
+            metric_mqtt_messages_total.labels(status='accepted').inc(len(round_))
+
+    def queue_depths(self):
+        with self._condition:
+            return {topic: len(queue) for topic, queue in self._queues.items()}
+
+    def update_metrics(self):
+        """Publish the per-device queue depths."""
+        for topic, depth in self.queue_depths().items():
+            metric_queue_depth.labels(queue='mqtt', device=topic.split('/')[1], mode='continuous').set(depth)
+
+    def start(self):
+        self._worker.start()
+        self.client.loop_start()
+
+    def stop(self, timeout=None):
+        """Hand whatever is queued to the sinks and acknowledge it, then disconnect."""
+        self._stop_event.set()
+        with self._condition:
+            self._condition.notify()
+        self._worker.join(timeout)
+        # Acks go out on the network loop, so it runs until the session is closed.
+        # Messages delivered during the drain stay unacknowledged and are redelivered.
+        self.client.disconnect()
+        self.client.loop_stop()
+
+    def stats(self):
+        depths = self.queue_depths()
+        return {
+            'accepted': self.accepted,
+            'invalid': self.invalid,
+            'dropped': self.dropped,
+            'queued': sum(depths.values()),
+            'topics': len(depths),
+            'last_error': self.last_error
+        }
+
+def create_client(client_id=None, username=None, password=None):
+    """paho-mqtt client with a persistent session and manual acknowledgements."""
+    if mqtt is None:
+        raise RuntimeError("paho-mqtt is not installed. Install it with: pip install paho-mqtt")
+    client = mqtt.Client(
+        mqtt.CallbackAPIVersion.VERSION2,
+        client_id=client_id or os.getenv('MQTT_CLIENT_ID', MQTT_CONFIG['client_id']),
+        clean_session=False,
+        manual_ack=True
+    )
+    if username:
+        client.username_pw_set(username, password)
+    client.reconnect_delay_set(MQTT_CONFIG['reconnect_min'], MQTT_CONFIG['reconnect_max'])
+    return client
+
+def topic_matches(subscription, topic):
+    """Whether topic matches an MQTT subscription filter with + and # wildcards."""
+    sub_parts = subscription.split('/')
+    topic_parts = topic.split('/')
+    for index, part in enumerate(sub_parts):
+        if part == '#':
+            return True
+        if index >= len(topic_parts) or (part != '+' and part != topic_parts[index]):
+            return False
+    return len(sub_parts) == len(topic_parts)
+
+class _LocalMessage:
+    __slots__ = ('topic', 'payload', 'qos', 'mid')
+
+    def __init__(self, topic, payload, qos, mid):
+        self.topic = topic
+        self.payload = payload
+        self.qos = qos
+        self.mid = mid
+
+class LocalBroker:
+    """In-process stand-in for an MQTT broker, with a per-client in-flight window for QoS 1/2."""
+
+    def __init__(self, max_inflight=20):
+        self.max_inflight = max_inflight
+        self._clients = []
+        self._mids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def client(self):
+        client = LocalClient(self)
+        with self._lock:
+            self._clients.append(client)
+        return client
+
+    def publish(self, topic, payload, qos=0):
+        if isinstance(payload, str):
+            payload = payload.encode('utf-8')
+        with self._lock:
+            subscribers = [(c, min(qos, c.subscriptions[s])) for c in self._clients
+                           for s in list(c.subscriptions) if topic_matches(s, topic)]
+        for client, granted_qos in subscribers:
+            client._offer(_LocalMessage(topic, payload, granted_qos, next(self._mids)))
+
+class LocalClient:
+    """The subset of the paho-mqtt client used by MqttBridge, backed by a LocalBroker."""
+
+    def __init__(self, broker):
+        self.broker = broker
+        self.subscriptions = {}
+        self.on_connect = None
+        self.on_disconnect = None
+        self.on_message = None
+        self._inflight = set()
+        self._pending = deque()
+        self._lock = threading.Lock()
+
+    def subscribe(self, topic, qos=0):
+        self.subscriptions[topic] = qos
+
+    def _offer(self, message):
+        with self._lock:
+            if message.qos > 0 and len(self._inflight) >= self.broker.max_inflight:
+                self._pending.append(message)  # The broker holds it until an ack frees a slot
+                return
+            if message.qos > 0:
+                self._inflight.add(message.mid)
+        self.on_message(self, None, message)
+
+    def ack(self, mid, qos):
+        with self._lock:
+            self._inflight.discard(mid)
+            message = self._pending.popleft() if self._pending else None
+            if message is not None:
+                self._inflight.add(message.mid)
+        if message is not None:
+            self.on_message(self, None, message)
+
+    def loop_start(self):
+        self.on_connect(self, None, {}, 0, None)
+
+    def loop_stop(self):
+        pass
+
+    def disconnect(self):
+        self.on_disconnect(self, None, {}, 0, None)
+
+    def backlog(self):
+        with self._lock:
+            return len(self._inflight), len(self._pending)
+
+def _simulate_nodes(broker, count, rate, qos, stop_event):
+    """Publish readings from count nodes at rate readings/s each."""
+    rng = random.Random(1)
+    interval = 1 / (count * rate)
+    next_publish = time.monotonic()
+    for index in itertools.cycle(range(count)):
+        if stop_event.is_set():
+            return
+        payload = json.dumps({
+            'humidity': round(55 + rng.gauss(0, 2), 2),
+            'temperature_celsius': round(25 + rng.gauss(0, 1), 2),
+            'timestamp': time.time()
+        })
+        broker.publish(f"sensors/node-{index + 1}/reading", payload, qos)
+        next_publish += interval
+        delay = next_publish - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
+def main():
+    """Bridge MQTT readings to the configured sinks."""
+    from sinks import SinkDispatcher, MetricsSink, FirebaseSink, create_sinks
+
+    parser = argparse.ArgumentParser(description='Forward MQTT sensor readings to Firebase and the metrics registry.')
+    parser.add_argument('--host', default=os.getenv('MQTT_HOST', MQTT_CONFIG['host']))
+    parser.add_argument('--port', type=int, default=int(os.getenv('MQTT_PORT', MQTT_CONFIG['port'])))
+    parser.add_argument('--topic', default=os.getenv('MQTT_TOPIC', MQTT_CONFIG['topic']))
+    parser.add_argument('--qos', type=int, choices=(0, 1, 2), default=int(os.getenv('MQTT_QOS', MQTT_CONFIG['qos'])))
+    parser.add_argument('--sinks', default=os.getenv('SENSOR_SINKS', 'firebase'),
+                        help='Comma-separated sinks besides metrics (see sinks.py)')
+    parser.add_argument('--stand-in', action='store_true',
+                        help='Use an in-process broker with simulated nodes and an in-memory Firebase')
+    parser.add_argument('--nodes', type=int, default=10, help='Simulated nodes (with --stand-in)')
+    parser.add_argument('--rate', type=float, default=1.0, help='Readings per second per simulated node')
+    args = parser.parse_args()
+
+    print("Starting MQTT ingestion bridge...")
+    stop_event = threading.Event()
+    if args.stand_in:
+        from loadgen import FakeFirebase
+        FakeFirebase().install()
+        broker = LocalBroker()
+        client = broker.client()
+    else:
+        try:
+            initialize_firebase()
+            print("Firebase initialized successfully")
+        except Exception as e:
+            print(f"Firebase initialization failed: {e}")
+            return
+        client = create_client(username=os.getenv('MQTT_USERNAME'), password=os.getenv('MQTT_PASSWORD'))
+        client.connect_async(args.host, args.port, MQTT_CONFIG['keepalive'])
+
+    # The stand-in keeps Firebase writes in memory rather than in the on-disk spool
+    sinks = [FirebaseSink()] if args.stand_in else create_sinks(args.sinks)
+    dispatcher = SinkDispatcher([MetricsSink()] + sinks)
+    dispatcher.start()
+    bridge = MqttBridge(dispatcher, client, topic=args.topic, qos=args.qos)
+    bridge.start()
+    if args.stand_in:
+        threading.Thread(target=_simulate_nodes, args=(broker, args.nodes, args.rate, args.qos, stop_event),
+                         daemon=True).start()
+    print(f"Sinks: {', '.join(sink.sink_name for sink in dispatcher.sinks)}")
+
+    try:
+        while True:
+            time.sleep(10)
+            bridge.update_metrics()
+            print(f"MQTT bridge: {bridge.stats()}")
+    except KeyboardInterrupt:
+        print("Stopping MQTT bridge...")
+    finally:
+        stop_event.set()
+        bridge.stop(timeout=10)
+        dispatcher.stop(timeout=30)
+
+if __name__ == "__main__":
+    main()
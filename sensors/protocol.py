@@ -0,0 +1,199 @@
+"""
+Framed binary serial protocol with CSV fallback.
+
+Frame layout (little-endian):
+
+    sync      2 bytes   0xA5 0x5A
+    board_id  uint16    id burned into the Arduino sketch
+    seq       uint16    increments per frame, wraps at 65536
+    count     uint8     number of channels that follow
+    channels  int16[]   values in hundredths (channel 0 humidity, 1 temperature)
+    crc       uint16    CRC-16/CCITT-FALSE over board_id..channels
+
+A two-channel frame is 13 bytes, against roughly 12 for an ASCII line, but
+needs no decoding and carries a checksum and sequence number. Legacy
+'humidity,temperature' lines may be interleaved with frames; the sync bytes
+can never appear in ASCII text. Runs of same-sized frames are decoded in
+bulk with NumPy when it is installed.
+"""
+
+import struct
+from firebase_utils import parse_sensor_line
+from config import PROTOCOL_CONFIG
+from metrics import metric_frames_total, metric_frames_dropped_total, metric_parse_failures_total
+
+try:
+    import numpy as np
+except ImportError:  # NumPy is optional; the struct path handles everything
+    np = None
+
+SYNC = PROTOCOL_CONFIG['sync']
+HEADER = struct.Struct('<2sHHB')
+CRC = struct.Struct('<H')
+
+def _make_crc_table():
+    table = []
+    for byte in range(256):
+        crc = byte << 8
+        for _ in range(8):
+            crc = ((crc << 1) ^ 0x1021) if crc & 0x8000 else (crc << 1)
+        table.append(crc & 0xFFFF)
+    return table
+
+_CRC_TABLE = _make_crc_table()
+_CRC_TABLE_NP = np.array(_CRC_TABLE, dtype=np.uint32) if np is not None else None
+
+def crc16(data):
+    """CRC-16/CCITT-FALSE (poly 0x1021, init 0xFFFF)."""
+    crc = 0xFFFF
+    for byte in data:
+        crc = ((crc << 8) & 0xFFFF) ^ _CRC_TABLE[((crc >> 8) ^ byte) & 0xFF]
+    return crc
+
+def encode_frame(board_id, seq, channels, scale=PROTOCOL_CONFIG['channel_scale']):
+    """Build one frame; used by the simulator and for tests against real parsers."""
+    body = struct.pack(f'<HHB{len(channels)}h', board_id, seq & 0xFFFF, len(channels),
+                       *(int(round(value * scale)) for value in channels))
+    return SYNC + body + CRC.pack(crc16(body))
+
+def frame_size(channel_count):
+    return HEADER.size + 2 * channel_count + CRC.size
+
+class FrameParser:
+    """Incremental parser turning raw serial bytes into readings."""
+
+    def __init__(self, device_id='default', mode='continuous', scale=PROTOCOL_CONFIG['channel_scale'],
+                 max_channels=PROTOCOL_CONFIG['max_channels'], max_buffer=PROTOCOL_CONFIG['max_buffer'],
+                 bulk_threshold=8):
+        self.device_id = device_id
+        self.mode = mode
+        self.scale = scale
+        self.max_channels = max_channels
+        self.max_buffer = max_buffer
+        self.bulk_threshold = bulk_threshold
+        self.last_seq = {}
+        self.frames = 0
+        self.dropped = 0
+        self._buffer = bytearray()
+
+    def _error(self, kind, message):
+        metric_parse_failures_total.labels(device=self.device_id, mode=self.mode, kind=kind).inc()
+        return {'error': message, 'kind': kind}
+
+    def _track_sequence(self, board_id, seq):
+        """Count frames missing between the previous and this sequence number."""
+        last = self.last_seq.get(board_id)
+        self.last_seq[board_id] = seq
+        if last is not None:
+            gap = (seq - last - 1) & 0xFFFF
+            # A huge gap means the board restarted rather than 60k lost frames
+            if 0 < gap < 0x8000:
+                self.dropped += gap
+                metric_frames_dropped_total.labels(device=self.device_id).inc(gap)
+
+    def _frame_reading(self, board_id, seq, channels):
+        self.frames += 1
+        self._track_sequence(board_id, seq)
+        reading = {'board_id': board_id, 'seq': seq, 'channels': channels}
+        if len(channels) >= 2:
+            reading['humidity'] = channels[0]
+            reading['temperature_celsius'] = channels[1]
+        else:
+            reading['error'] = f"Frame from board {board_id} has only {len(channels)} channel(s)"
+            reading['kind'] = 'length'
+        return reading
+
+    def _parse_lines(self, text, out):
+        for raw_line in text.split(b'\n'):
+            line = raw_line.decode('utf-8', errors='replace').strip()
+            if not line:
+                continue
+            humidity, temperature, error = parse_sensor_line(line)
+            if error:
+                # Lines without a comma are status messages such as DHT read failures
+                out.append(self._error('value' if ',' in line else 'status', error))
+            else:
+                out.append({'humidity': humidity, 'temperature_celsius': temperature})
+
+    def _decode_bulk(self, count, out):
+        """Decode a run of consecutive same-sized frames at the buffer start with NumPy."""
+        size = frame_size(count)
+        rows = len(self._buffer) // size
+        if rows < self.bulk_threshold:
+            return 0
+        frames = np.frombuffer(bytes(self._buffer[:rows * size]), dtype=np.uint8).reshape(rows, size)
+
+        valid = (frames[:, 0] == SYNC[0]) & (frames[:, 1] == SYNC[1]) & (frames[:, 6] == count)
+        crc = np.full(rows, 0xFFFF, dtype=np.uint32)
+        for column in range(2, size - CRC.size):
+            crc = ((crc << 8) & 0xFFFF) ^ _CRC_TABLE_NP[((crc >> 8) ^ frames[:, column]) & 0xFF]
+        stored = frames[:, -2].astype(np.uint32) | (frames[:, -1].astype(np.uint32) << 8)
+        valid &= crc == stored
+        # Only the leading run is consumed; anything after a bad frame takes the slow path
+        run = rows if valid.all() else int(np.argmin(valid))
+        if run == 0:
+            return 0
+
+        block = frames[:run]
+        board_ids = block[:, 2].astype(np.uint16) | (block[:, 3].astype(np.uint16) << 8)
+        seqs = block[:, 4].astype(np.uint16) | (block[:, 5].astype(np.uint16) << 8)
+        values = np.ascontiguousarray(block[:, 7:7 + 2 * count]).view('<i2').reshape(run, count) / self.scale
+        for board_id, seq, channels in zip(board_ids.tolist(), seqs.tolist(), values.tolist()):
+            out.append(self._frame_reading(board_id, seq, channels))
+        del self._buffer[:run * size]
+        return run
+
+    def feed(self, data):
+        """Consume bytes and return parsed readings and errors, in arrival order.
+
+        Each item is a dict with 'humidity'/'temperature_celsius' (plus
+        'board_id', 'seq' and 'channels' for binary frames) or 'error'/'kind'.
+        """
+        self._buffer.extend(data)
+        out = []
+        buffer = self._buffer
+
+        while buffer:
+            start = buffer.find(SYNC)
+            if start != 0:
+                text = buffer if start < 0 else buffer[:start]
+                newline = text.rfind(b'\n')
+                if newline >= 0:
+                    self._parse_lines(bytes(text[:newline + 1]), out)
+                    del buffer[:newline + 1]
+                elif start > 0:
+                    out.append(self._error('junk', f"Discarded {start} bytes before frame"))
+                    del buffer[:start]
+                else:
+                    break
+                continue
+
+            if len(buffer) < HEADER.size:
+                break
+            _, board_id, seq, count = HEADER.unpack_from(buffer)
+            if count == 0 or count > self.max_channels:
+                out.append(self._error('length', f"Invalid channel count {count}"))
+                del buffer[:1]
+                continue
+            if np is not None and self._decode_bulk(count, out):
+                continue
+
+            size = frame_size(count)
+            if len(buffer) < size:
+                break
+            body = bytes(buffer[2:size - CRC.size])
+            if crc16(body) != CRC.unpack_from(buffer, size - CRC.size)[0]:
+                out.append(self._error('crc', f"CRC mismatch in frame from board {board_id}"))
+                del buffer[:1]  # Resynchronise on the next sync marker
+                continue
+            channels = [value / self.scale for value in struct.unpack_from(f'<{count}h', body, 5)]
+            out.append(self._frame_reading(board_id, seq, channels))
+            del buffer[:size]
+
+        if len(buffer) > self.max_buffer:
+            out.append(self._error('overflow', f"Discarded {len(buffer)} unparsed bytes"))
+            buffer.clear()
+        frames = sum(1 for item in out if 'seq' in item)
+        if frames:
+            metric_frames_total.labels(device=self.device_id).inc(frames)
+        return out
@@ -0,0 +1,138 @@
+"""
+Minimal in-process cron scheduler with misfire and jitter tracking.
+"""
+
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from config import SCHEDULER_CONFIG
+from metrics import (
+    metric_scheduler_runs_total,
+    metric_scheduler_misfires_total,
+    metric_scheduler_jitter_seconds,
+    metric_scheduler_duration_seconds,
+)
+
+IST = timezone(timedelta(hours=5, minutes=30))
+
+# (field name, minimum, maximum) of the five cron fields
+_CRON_FIELDS = (
+    ('minute', 0, 59),
+    ('hour', 0, 23),
+    ('day', 1, 31),
+    ('month', 1, 12),
+    ('weekday', 0, 6),
+)
+
+def _parse_field(text, low, high):
+    """Expand one cron field ('*', '*/5', '1-5', '0,30', '8') into a set of values."""
+    values = set()
+    for part in text.split(','):
+        step = 1
+        if '/' in part:
+            part, step_text = part.split('/', 1)
+            step = int(step_text)
+        if part == '*':
+            start, end = low, high
+        elif '-' in part:
+            start, end = (int(value) for value in part.split('-', 1))
+        else:
+            start = int(part)
+            end = high if step > 1 else start
+        if start < low or end > high or start > end or step < 1:
+            raise ValueError(f"Cron field '{text}' is out of range {low}-{high}")
+        values.update(range(start, end + 1, step))
+    return values
+
+class CronSchedule:
+    """Five-field cron expression evaluated in a fixed timezone (Sunday is weekday 0)."""
+
+    def __init__(self, expression, tz=IST):
+        fields = expression.split()
+        if len(fields) != 5:
+            raise ValueError(f"Cron expression must have 5 fields: '{expression}'")
+        self.expression = expression
+        self.tz = tz
+        parsed = [_parse_field(text, low, high) for text, (_, low, high) in zip(fields, _CRON_FIELDS)]
+        self.minutes, self.hours, self.days, self.months, self.weekdays = parsed
+        # Standard cron: if both day fields are restricted, either may match
+        self._day_any = fields[2] == '*'
+        self._weekday_any = fields[4] == '*'
+
+    def _day_matches(self, moment):
+        day_ok = moment.day in self.days
+        weekday_ok = (moment.isoweekday() % 7) in self.weekdays
+        if self._day_any or self._weekday_any:
+            return day_ok and weekday_ok
+        return day_ok or weekday_ok
+
+    def next_after(self, moment):
+        """First matching minute strictly after moment."""
+        candidate = moment.astimezone(self.tz).replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limit = candidate + timedelta(days=366 * 4)
+        while candidate < limit:
+            if candidate.month not in self.months or not self._day_matches(candidate):
+                candidate = (candidate + timedelta(days=1)).replace(hour=0, minute=0)
+            elif candidate.hour not in self.hours:
+                candidate = (candidate + timedelta(hours=1)).replace(minute=0)
+            elif candidate.minute not in self.minutes:
+                candidate += timedelta(minutes=1)
+            else:
+                return candidate
+        raise ValueError(f"Cron expression never fires: '{self.expression}'")
+
+class Scheduler:
+    """Runs jobs on cron schedules in one long-lived process."""
+
+    def __init__(self, misfire_grace=SCHEDULER_CONFIG['misfire_grace']):
+        self.misfire_grace = misfire_grace
+        self._jobs = []
+        self._stop_event = threading.Event()
+
+    def add_job(self, name, expression, func):
+        """Register func() to run whenever the cron expression matches."""
+        schedule = CronSchedule(expression)
+        self._jobs.append({
+            'name': name,
+            'schedule': schedule,
+            'func': func,
+            'next_run': schedule.next_after(datetime.now(IST))
+        })
+
+    def _run_job(self, job, scheduled):
+        lateness = time.time() - scheduled.timestamp()
+        if lateness > self.misfire_grace:
+            metric_scheduler_misfires_total.labels(job=job['name']).inc()
+            print(f"Skipping {job['name']} scheduled for {scheduled:%Y-%m-%d %H:%M} IST ({lateness:.1f}s late)")
+            return
+
+        metric_scheduler_jitter_seconds.labels(job=job['name']).observe(max(lateness, 0))
+        start = time.perf_counter()
+        try:
+            job['func']()
+            metric_scheduler_runs_total.labels(job=job['name'], status='success').inc()
+        except Exception as e:
+            metric_scheduler_runs_total.labels(job=job['name'], status='failure').inc()
+            print(f"Scheduled job {job['name']} failed: {e}")
+        finally:
+            metric_scheduler_duration_seconds.labels(job=job['name']).observe(time.perf_counter() - start)
+
+    def run(self):
+        """Fire jobs until stop() is called."""
+        while not self._stop_event.is_set() and self._jobs:
+            job = min(self._jobs, key=lambda j: j['next_run'])
+            delay = job['next_run'].timestamp() - time.time()
+            if delay > 0 and self._stop_event.wait(delay):
+                break
+
+            scheduled = job['next_run']
+            self._run_job(job, scheduled)
+            # Count slots missed while the job ran or the host was suspended
+            now = datetime.now(IST)
+            job['next_run'] = job['schedule'].next_after(scheduled)
+            while job['next_run'].timestamp() < now.timestamp() - self.misfire_grace:
+                metric_scheduler_misfires_total.labels(job=job['name']).inc()
+                job['next_run'] = job['schedule'].next_after(job['next_run'])
+
+    def stop(self):
+        self._stop_event.set()
@@ -1,10 +1,52 @@
 #include "DHT.h"
 
-#define DHTPIN 2  
+#define DHTPIN 2
 
 #define DHTTYPE DHT11   // DHT 11
 DHT dht(DHTPIN, DHTTYPE);
 
+// Set to 1 to send compact binary frames (see protocol.py) instead of CSV lines
+#define BINARY_FRAMES 0
+#define BOARD_ID 1
+
+// Milliseconds between measurements. The DHT11 cannot be read faster than
+// once per second, so 1000 is the floor for high-frequency sampling.
+#define SAMPLE_PERIOD_MS 3000
+
+uint16_t frameSeq = 0;
+
+uint16_t crc16(const uint8_t *data, size_t length) {
+  // CRC-16/CCITT-FALSE, must match protocol.crc16 on the Python side
+  uint16_t crc = 0xFFFF;
+  for (size_t i = 0; i < length; i++) {
+    crc ^= (uint16_t)data[i] << 8;
+    for (uint8_t bit = 0; bit < 8; bit++) {
+      crc = (crc & 0x8000) ? (crc << 1) ^ 0x1021 : crc << 1;
+    }
+  }
+  return crc;
+}
+
+void sendFrame(float h, float t) {
+  // board_id, seq, channel count, humidity and temperature in hundredths (little-endian)
+  int16_t channels[2] = { (int16_t)round(h * 100), (int16_t)round(t * 100) };
+  uint8_t body[9] = {
+    BOARD_ID & 0xFF, BOARD_ID >> 8,
+    (uint8_t)(frameSeq & 0xFF), (uint8_t)(frameSeq >> 8),
+    2,
+    (uint8_t)(channels[0] & 0xFF), (uint8_t)((uint16_t)channels[0] >> 8),
+    (uint8_t)(channels[1] & 0xFF), (uint8_t)((uint16_t)channels[1] >> 8)
+  };
+  uint16_t crc = crc16(body, sizeof(body));
+
+  Serial.write(0xA5);
+  Serial.write(0x5A);
+  Serial.write(body, sizeof(body));
+  Serial.write((uint8_t)(crc & 0xFF));
+  Serial.write((uint8_t)(crc >> 8));
+  frameSeq++;
+}
+
 void setup() {
   Serial.begin(9600);
   Serial.println(F("Sensors!"));
@@ -13,8 +55,8 @@ void setup() {
 }
 
 void loop() {
-  // Wait 3 seconds between measurements
-  delay(3000);
+  // Wait between measurements
+  delay(SAMPLE_PERIOD_MS);
 
   float h = dht.readHumidity();
   float t = dht.readTemperature(); // Celsius
@@ -25,11 +67,15 @@ void loop() {
     return;
   }
 
+#if BINARY_FRAMES
+  sendFrame(h, t);
+#else
   // We only need humidity and temperature in Celsius.
   // The Python script will handle timestamps and other data.
-  
+
   // Print data in a simple comma-separated format: "humidity,temperature"
   Serial.print(h);
   Serial.print(",");
   Serial.println(t);
-}
\ No newline at end of file
+#endif
+}
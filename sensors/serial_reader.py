@@ -0,0 +1,150 @@
+import threading
+import time
+from collections import deque
+import serial
+from protocol import FrameParser
+from config import READER_CONFIG
+from metrics import metric_serial_read_seconds
+
+class ReadingBuffer:
+    """Thread-safe bounded ring buffer of timestamped sensor readings."""
+
+    def __init__(self, maxlen=READER_CONFIG['buffer_size'], device_id=None):
+        self.device_id = device_id
+        self._readings = deque(maxlen=maxlen)
+        self._condition = threading.Condition()
+        self._seq = 0
+
+    def append(self, humidity, temperature, timestamp=None):
+        """Store a parsed reading and wake up any waiting consumers."""
+        with self._condition:
+            self._seq += 1
+            reading = {
+                'seq': self._seq,
+                'humidity': float(humidity),
+                'temperature_celsius': float(temperature),
+                'timestamp': timestamp if timestamp is not None else time.time()
+            }
+            if self.device_id is not None:
+                reading['device_id'] = self.device_id
+            self._readings.append(reading)
+            self._condition.notify_all()
+        return reading
+
+    @property
+    def seq(self):
+        """Sequence number of the most recent reading (0 before the first)."""
+        with self._condition:
+            return self._seq
+
+    def latest(self, max_age=None):
+        """Return the most recent reading, or None if empty or older than max_age seconds."""
+        with self._condition:
+            if not self._readings:
+                return None
+            reading = self._readings[-1]
+        if max_age is not None and time.time() - reading['timestamp'] > max_age:
+            return None
+        return reading
+
+    def snapshot(self):
+        """Return a copy of all buffered readings, oldest first."""
+        with self._condition:
+            return list(self._readings)
+
+    def since(self, after_seq):
+        """Return buffered readings newer than after_seq, oldest first."""
+        with self._condition:
+            return [reading for reading in self._readings if reading['seq'] > after_seq]
+
+    def wait_for_new(self, after_seq=0, timeout=None):
+        """Block until a reading newer than after_seq is available and return the latest one."""
+        with self._condition:
+            if not self._condition.wait_for(lambda: self._seq > after_seq, timeout=timeout):
+                return None
+            return self._readings[-1]
+
+class SerialReader(threading.Thread):
+    """Background thread that parses every serial line or binary frame into a ReadingBuffer."""
+
+    def __init__(self, port, baud_rate, timeout=1, buffer=None, on_line=None,
+                 connection=None, reconnect_delay=READER_CONFIG['reconnect_delay'], mode='continuous'):
+        super().__init__(daemon=True)
+        self.port = port
+        self.baud_rate = baud_rate
+        self.timeout = timeout
+        self.buffer = buffer if buffer is not None else ReadingBuffer()
+        self.on_line = on_line
+        self.connection = connection
+        self.reconnect_delay = reconnect_delay
+        self.mode = mode
+        self.device_id = self.buffer.device_id or 'default'
+        self.last_error = None
+        self._parser = FrameParser(self.device_id, mode)
+        self._stop_event = threading.Event()
+
+    def _open(self):
+        """Open the serial port if it is not already open."""
+        if self.connection is None:
+            start = time.perf_counter()
+            self.connection = serial.Serial(self.port, self.baud_rate, timeout=self.timeout)
+            time.sleep(2)  # Wait for connection to establish
+            self._observe('open', start)
+            self._parser = FrameParser(self.device_id, self.mode)
+            print(f"Arduino connected on {self.port} at {self.baud_rate} baud")
+
+    def _close(self):
+        """Close the serial port, ignoring errors from an already broken handle."""
+        if self.connection is not None:
+            try:
+                self.connection.close()
+            except Exception:
+                pass
+            self.connection = None
+
+    def _observe(self, phase, start):
+        metric_serial_read_seconds.labels(device=self.device_id, mode=self.mode, phase=phase).observe(
+            time.perf_counter() - start
+        )
+
+    def _handle_item(self, item):
+        """Push one parsed CSV line or binary frame into the buffer."""
+        error = item.get('error')
+        humidity = item.get('humidity')
+        temperature = item.get('temperature_celsius')
+        if error:
+            self.last_error = error
+        else:
+            self.buffer.append(humidity, temperature)
+            self.last_error = None
+
+        if self.on_line:
+            try:
+                self.on_line(humidity, temperature, error)
+            except Exception:
+                # Callbacks must never stop the reader
+                pass
+
+    def run(self):
+        """Read lines until stopped, reconnecting whenever the port fails."""
+        while not self._stop_event.is_set():
+            try:
+                self._open()
+                # Block for the first byte, then take everything already buffered
+                data = self.connection.read(1)
+                if data:
+                    start = time.perf_counter()
+                    data += self.connection.read(self.connection.in_waiting)
+                    self._observe('read', start)
+                    for item in self._parser.feed(data):
+                        self._handle_item(item)
+            except Exception as e:
+                self.last_error = f"Error reading sensor: {str(e)}"
+                print(f"Serial reader error on {self.port}: {e}")
+                self._close()
+                self._stop_event.wait(self.reconnect_delay)
+        self._close()
+
+    def stop(self):
+        """Ask the reader thread to exit after its current read."""
+        self._stop_event.set()
@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+"""
+Virtual Arduino sensors on pseudo-terminal pairs.
+
+Each device writes 'humidity,temperature' lines (or binary frames) to a pty
+whose path can be used anywhere a serial port is expected, e.g.
+SERIAL_PORT=/tmp/sensor-sim/sim-1. Streams can be given noise, drift,
+malformed lines and periodic disconnects.
+
+Usage: python simulator.py --devices 3 --rate 10 --noise 0.2 --malformed 0.01
+"""
+
+import argparse
+import os
+import random
+import threading
+import time
+import tty
+from protocol import encode_frame
+
+# Lines a real sketch prints besides readings, plus typical line corruption
+_MALFORMED_LINES = (
+    'Failed to read from DHT sensor!',
+    'Sensors!',
+    '55.1',
+    ',',
+    'nan,nan',
+    '\x00\x7f\x1b',
+)
+
+class VirtualDevice(threading.Thread):
+    """One simulated Arduino streaming readings into a pty."""
+
+    def __init__(self, device_id, link_dir, rate=1.0, humidity=55.0, temperature=25.0,
+                 noise=0.0, drift=0.0, malformed=0.0, disconnect_every=0, disconnect_for=2.0,
+                 binary=False, board_id=1, seed=None, paused=False):
+        super().__init__(daemon=True)
+        self.device_id = device_id
+        self.port = os.path.join(link_dir, device_id)
+        self.rate = rate
+        self.humidity = humidity
+        self.temperature = temperature
+        self.noise = noise
+        self.drift = drift
+        self.malformed = malformed
+        self.disconnect_every = disconnect_every
+        self.disconnect_for = disconnect_for
+        self.binary = binary
+        self.board_id = board_id
+        self.emitted = 0
+        self.malformed_sent = 0
+        self.disconnects = 0
+        self._random = random.Random(seed)
+        self._master = None
+        self._slave = None
+        self._seq = 0
+        self._stop_event = threading.Event()
+        self._emitting = threading.Event()
+        if not paused:
+            self._emitting.set()
+        os.makedirs(link_dir, exist_ok=True)
+
+    def _open(self):
+        """Create a fresh pty and point the stable port path at it."""
+        self._master, self._slave = os.openpty()
+        tty.setraw(self._slave)  # No echo or newline translation, like a real serial port
+        # Never block on a full pty; overflowing data is lost like on a real UART
+        os.set_blocking(self._master, False)
+        link = f"{self.port}.tmp"
+        if os.path.lexists(link):
+            os.remove(link)
+        os.symlink(os.ttyname(self._slave), link)
+        os.replace(link, self.port)
+
+    def _close(self):
+        """Tear the pty down; readers holding it open see an I/O error."""
+        for fd in (self._master, self._slave):
+            if fd is not None:
+                try:
+                    os.close(fd)
+                except OSError:
+                    pass
+        self._master = self._slave = None
+
+    def _values(self, elapsed):
+        """Humidity and temperature at elapsed seconds; drift is per minute."""
+        minutes = elapsed / 60
+        humidity = self.humidity + self.drift * minutes + self._random.gauss(0, self.noise)
+        temperature = self.temperature + self.drift * minutes + self._random.gauss(0, self.noise)
+        return min(max(humidity, 0.0), 100.0), temperature
+
+    def _encode(self, elapsed):
+        if self.malformed and self._random.random() < self.malformed:
+            self.malformed_sent += 1
+            return f"{self._random.choice(_MALFORMED_LINES)}\r\n".encode()
+        humidity, temperature = self._values(elapsed)
+        self.emitted += 1
+        if self.binary:
+            frame = encode_frame(self.board_id, self._seq, (humidity, temperature))
+            self._seq += 1
+            return frame
+        return f"{humidity:.2f},{temperature:.2f}\r\n".encode()
+
+    def run(self):
+        """Emit readings at the configured rate until stopped."""
+        self._open()
+        # A paused device has its port ready but stays silent until resume()
+        while not self._emitting.wait(0.05):
+            if self._stop_event.is_set():
+                self._close()
+                return
+        start = time.monotonic()
+        written = 0
+        next_disconnect = start + self.disconnect_every if self.disconnect_every else None
+        try:
+            while not self._stop_event.is_set():
+                now = time.monotonic()
+                if next_disconnect is not None and now >= next_disconnect:
+                    self._close()
+                    self.disconnects += 1
+                    if self._stop_event.wait(self.disconnect_for):
+                        break
+                    self._open()
+                    # Readings due during the outage are lost, as on a real unplugged board
+                    now = time.monotonic()
+                    written = int((now - start) * self.rate)
+                    next_disconnect = now + self.disconnect_every
+
+                # Write everything that is due in one go so high rates are not bound by sleep()
+                due = int((now - start) * self.rate)
+                if due > written:
+                    data = b''.join(self._encode(now - start) for _ in range(due - written))
+                    written = due
+                    try:
+                        os.write(self._master, data)
+                    except OSError:
+                        pass  # The pty buffer is full because nobody is reading the port
+                self._stop_event.wait(min(1 / self.rate, 0.05))
+        finally:
+            self._close()
+
+    def resume(self):
+        """Start emitting readings from a device created with paused=True."""
+        self._emitting.set()
+
+    def stop(self):
+        self._stop_event.set()
+
+def start_devices(count, link_dir, prefix='sim', **options):
+    """Start count virtual devices and return them."""
+    seed = options.pop('seed', None)
+    devices = []
+    for index in range(count):
+        device = VirtualDevice(f"{prefix}-{index + 1}", link_dir, board_id=index + 1,
+                               seed=None if seed is None else seed + index, **options)
+        device.start()
+        devices.append(device)
+    # Give every thread a moment to create its pty before callers open the ports
+    deadline = time.time() + 5
+    while not all(os.path.exists(device.port) for device in devices) and time.time() < deadline:
+        time.sleep(0.01)
+    return devices
+
+def add_stream_arguments(parser):
+    """Command-line options shared by the simulator and the load generator."""
+    parser.add_argument('--devices', type=int, default=1, help='Number of virtual devices')
+    parser.add_argument('--rate', type=float, default=1.0, help='Readings per second per device')
+    parser.add_argument('--humidity', type=float, default=55.0, help='Base humidity (%%)')
+    parser.add_argument('--temperature', type=float, default=25.0, help='Base temperature (°C)')
+    parser.add_argument('--noise', type=float, default=0.0, help='Gaussian noise standard deviation')
+    parser.add_argument('--drift', type=float, default=0.0, help='Drift of both channels per minute')
+    parser.add_argument('--malformed', type=float, default=0.0, help='Fraction of malformed lines (0-1)')
+    parser.add_argument('--disconnect-every', type=float, default=0, help='Seconds between simulated unplugs (0 = never)')
+    parser.add_argument('--disconnect-for', type=float, default=2.0, help='Seconds each unplug lasts')
+    parser.add_argument('--binary', action='store_true', help='Send binary frames instead of CSV lines')
+    parser.add_argument('--seed', type=int, default=None, help='Random seed for reproducible streams')
+    parser.add_argument('--link-dir', default=os.getenv('SIMULATOR_DIR', '/tmp/sensor-sim'),
+                        help='Directory holding one stable port path per device')
+
+def stream_options(args):
+    """VirtualDevice keyword arguments from parsed command-line options."""
+    return {
+        'rate': args.rate,
+        'humidity': args.humidity,
+        'temperature': args.temperature,
+        'noise': args.noise,
+        'drift': args.drift,
+        'malformed': args.malformed,
+        'disconnect_every': args.disconnect_every,
+        'disconnect_for': args.disconnect_for,
+        'binary': args.binary,
+        'seed': args.seed,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description='Run virtual Arduino sensors on pseudo-terminals.')
+    add_stream_arguments(parser)
+    parser.add_argument('--prefix', default='sim', help='Device id prefix')
+    args = parser.parse_args()
+
+    devices = start_devices(args.devices, args.link_dir, prefix=args.prefix, **stream_options(args))
+    print(f"Simulating {len(devices)} device(s) at {args.rate:g} readings/s each:")
+    for device in devices:
+        print(f"  {device.device_id}: {device.port}")
+    print("Press Ctrl+C to stop")
+
+    try:
+        while True:
+            time.sleep(10)
+            emitted = sum(device.emitted for device in devices)
+            print(f"Emitted {emitted} readings, {sum(d.malformed_sent for d in devices)} malformed, "
+                  f"{sum(d.disconnects for d in devices)} disconnects")
+    except KeyboardInterrupt:
+        print("Stopping simulator...")
+    finally:
+        for device in devices:
+            device.stop()
+        for device in devices:
+            device.join(timeout=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,355 @@
+"""
+Fan-out of sensor readings to independent sinks.
+
+SinkDispatcher hands every reading to each registered sink without
+blocking. Each sink owns a bounded queue and a flusher thread that writes
+batches with retries, so a slow or failing destination only fills its own
+queue (dropping its oldest readings) and never delays the serial reader or
+the other sinks.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import deque
+from firebase_utils import get_sampling_period
+from adaptive import FixedSampler, create_sampler
+from firebase_writer import FirebaseBatchWriter
+from spool import ReadingSpool
+from compression import ReadingCompressor
+from timeseries import TimeSeriesStore
+from config import SINK_CONFIG, SPOOL_CONFIG, TIMESERIES_CONFIG
+from metrics import (
+    metric_sink_queue_depth,
+    metric_sink_writes_total,
+    metric_sink_dropped_total,
+    metric_sink_write_seconds,
+    metric_humidity_percent,
+    metric_temperature_celsius,
+    metric_last_read_success_unix,
+)
+
+class QueuedSink(threading.Thread):
+    """Base class for sinks: a bounded queue drained in batches by a background thread.
+
+    Subclasses implement write(batch) and raise on failure. A write may
+    delete the readings it has already delivered from the front of the
+    batch, in which case only the rest is retried.
+    """
+
+    sink_name = 'sink'
+
+    def __init__(self, name=None, queue_size=SINK_CONFIG['queue_size'],
+                 batch_size=SINK_CONFIG['batch_size'], flush_interval=SINK_CONFIG['flush_interval'],
+                 max_retries=SINK_CONFIG['max_retries'], backoff_initial=SINK_CONFIG['backoff_initial'],
+                 backoff_max=SINK_CONFIG['backoff_max']):
+        self.sink_name = name or self.sink_name
+        super().__init__(name=f"{self.sink_name}-sink", daemon=True)
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+        self.backoff_initial = backoff_initial
+        self.backoff_max = backoff_max
+        self.written = 0
+        self.failed = 0
+        self.dropped = 0
+        self._queue = deque()
+        self._condition = threading.Condition()
+        self._stop_event = threading.Event()
+
+    def offer(self, reading):
+        """Queue a reading and return immediately; the oldest reading is dropped when full."""
+        with self._condition:
+            if len(self._queue) >= self.queue_size:
+                self._queue.popleft()
+                self.dropped += 1
+                metric_sink_dropped_total.labels(sink=self.sink_name).inc()
+            self._queue.append(reading)
+            if len(self._queue) >= self.batch_size:
+                self._condition.notify()
+
+    def write(self, batch):
+        raise NotImplementedError
+
+    def close(self):
+        """Release resources once the queue has been drained."""
+
+    def _take_batch(self):
+        with self._condition:
+            self._condition.wait_for(
+                lambda: self._stop_event.is_set() or len(self._queue) >= self.batch_size,
+                timeout=self.flush_interval
+            )
+            count = min(len(self._queue), self.batch_size)
+            batch = [self._queue.popleft() for _ in range(count)]
+            metric_sink_queue_depth.labels(sink=self.sink_name).set(len(self._queue))
+            return batch
+
+    def _write_with_retries(self, batch):
+        total = len(batch)
+        delay = self.backoff_initial
+        for attempt in range(1, self.max_retries + 1):
+            start = time.perf_counter()
+            try:
+                self.write(batch)
+                metric_sink_write_seconds.labels(sink=self.sink_name).observe(time.perf_counter() - start)
+                metric_sink_writes_total.labels(sink=self.sink_name, status='success').inc(total)
+                self.written += total
+                return True
+            except Exception as e:
+                print(f"{self.sink_name} sink failed to write {len(batch)} readings "
+                      f"(attempt {attempt}/{self.max_retries}): {e}")
+                if attempt < self.max_retries and not self._stop_event.is_set():
+                    self._stop_event.wait(delay)
+                    delay = min(delay * 2, self.backoff_max)
+
+        delivered = total - len(batch)
+        if delivered:
+            metric_sink_writes_total.labels(sink=self.sink_name, status='success').inc(delivered)
+        metric_sink_writes_total.labels(sink=self.sink_name, status='failure').inc(len(batch))
+        self.written += delivered
+        self.failed += len(batch)
+        return False
+
+    def run(self):
+        """Write batches until stopped and the queue is drained."""
+        try:
+            while True:
+                batch = self._take_batch()
+                if batch:
+                    self._write_with_retries(batch)
+                elif self._stop_event.is_set():
+                    return
+        finally:
+            self.close()
+
+    def stop(self, timeout=None):
+        """Write whatever is queued and stop the flusher thread."""
+        with self._condition:
+            self._stop_event.set()
+            self._condition.notify()
+        if self.is_alive():
+            self.join(timeout)
+
+    def queue_depth(self):
+        with self._condition:
+            return len(self._queue)
+
+    def stats(self):
+        return {
+            'queued': self.queue_depth(),
+            'written': self.written,
+            'failed': self.failed,
+            'dropped': self.dropped
+        }
+
+class FirebaseSink(QueuedSink):
+    """Samples, compresses and spools readings for the batched RTDB writer."""
+
+    sink_name = 'firebase'
+
+    def __init__(self, writer=None, spool=None, data_type='continuous', sampler=None,
+                 compressor=None, **kwargs):
+        super().__init__(**kwargs)
+        self.spool = spool
+        self.writer = writer if writer is not None else FirebaseBatchWriter(spool=spool)
+        self.data_type = data_type
+        self.sampler = sampler if sampler is not None else FixedSampler()
+        self.compressor = compressor
+
+    def _enqueue(self, reading):
+        self.writer.enqueue(self.data_type, reading['humidity'], reading['temperature_celsius'],
+                            reading.get('device_id'), reading['timestamp'])
+
+    def write(self, batch):
+        while batch:
+            reading = batch[0]
+            # The sampler sees every reading; threshold crossings are offered even between samples
+            sampled = self.sampler.should_sample(reading)
+            if sampled or (self.compressor is not None and self.compressor.crosses_threshold(reading)):
+                for item in (self.compressor.offer(reading) if self.compressor else [reading]):
+                    self._enqueue(item)
+            del batch[0]
+
+    def start(self):
+        if not self.writer.is_alive():
+            self.writer.start()
+        super().start()
+
+    def stop(self, timeout=None):
+        super().stop(timeout)
+        # Upload readings the compressor was still holding, then drain the writer
+        if self.compressor is not None and not self.is_alive():
+            for item in self.compressor.flush():
+                self._enqueue(item)
+        self.writer.stop(timeout)
+        if self.spool is not None and not self.writer.is_alive():
+            self.spool.close()
+
+    def stats(self):
+        stats = super().stats()
+        stats['firebase_pending'] = self.writer.queue_depth()
+        stats['sampling_periods'] = self.sampler.periods()
+        return stats
+
+class HistorySink(QueuedSink):
+    """Appends readings to the local time-series store."""
+
+    sink_name = 'history'
+
+    def __init__(self, store, **kwargs):
+        super().__init__(**kwargs)
+        self.store = store
+
+    def write(self, batch):
+        while batch:
+            self.store.append(batch[0])
+            del batch[0]
+
+class SQLiteSink(QueuedSink):
+    """Keeps every reading in a local SQLite table."""
+
+    sink_name = 'sqlite'
+
+    def __init__(self, path=SINK_CONFIG['sqlite_path'], **kwargs):
+        super().__init__(**kwargs)
+        self.path = path
+        self._connection = None
+
+    def _connect(self):
+        # Created on the flusher thread, which is the only one using it
+        if self._connection is None:
+            self._connection = sqlite3.connect(self.path)
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS readings ("
+                "device_id TEXT, timestamp REAL NOT NULL, humidity REAL, temperature_celsius REAL)"
+            )
+            self._connection.execute(
+                "CREATE INDEX IF NOT EXISTS readings_device_time ON readings (device_id, timestamp)"
+            )
+        return self._connection
+
+    def write(self, batch):
+        connection = self._connect()
+        with connection:
+            connection.executemany(
+                "INSERT INTO readings (device_id, timestamp, humidity, temperature_celsius) VALUES (?, ?, ?, ?)",
+                [(r.get('device_id'), r['timestamp'], r['humidity'], r['temperature_celsius']) for r in batch]
+            )
+
+    def close(self):
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+class WebhookSink(QueuedSink):
+    """POSTs each reading as JSON to an HTTP endpoint such as the ML /sensor-analysis."""
+
+    sink_name = 'webhook'
+
+    def __init__(self, url=SINK_CONFIG['webhook_url'], timeout=SINK_CONFIG['webhook_timeout'], **kwargs):
+        super().__init__(**kwargs)
+        self.url = url
+        self.timeout = timeout
+
+    def _post(self, reading):
+        body = json.dumps({
+            'humidity': reading['humidity'],
+            'temperature_celsius': reading['temperature_celsius'],
+            'device_id': reading.get('device_id'),
+            'timestamp': reading['timestamp']
+        }).encode('utf-8')
+        request = urllib.request.Request(self.url, data=body, headers={'Content-Type': 'application/json'})
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            response.read()
+
+    def write(self, batch):
+        while batch:
+            try:
+                self._post(batch[0])
+            except urllib.error.HTTPError as e:
+                if not 400 <= e.code < 500:
+                    raise
+                # The endpoint rejected this reading; retrying would not help
+                print(f"{self.sink_name} sink: {self.url} rejected reading with HTTP {e.code}")
+            del batch[0]
+
+class MetricsSink(QueuedSink):
+    """Updates the per-device Prometheus gauges from each reading."""
+
+    sink_name = 'metrics'
+
+    def __init__(self, **kwargs):
+        kwargs.setdefault('flush_interval', 0.5)
+        super().__init__(**kwargs)
+
+    def write(self, batch):
+        for reading in batch:
+            device_id = reading.get('device_id', 'default')
+            metric_humidity_percent.labels(device=device_id).set(reading['humidity'])
+            metric_temperature_celsius.labels(device=device_id).set(reading['temperature_celsius'])
+            metric_last_read_success_unix.labels(device=device_id).set(reading['timestamp'])
+
+class SinkDispatcher:
+    """Hands each reading to every registered sink without blocking the caller."""
+
+    def __init__(self, sinks=()):
+        self.sinks = list(sinks)
+        self._started = False
+
+    def add(self, sink):
+        self.sinks.append(sink)
+        if self._started:
+            sink.start()
+
+    def start(self):
+        for sink in self.sinks:
+            sink.start()
+        self._started = True
+
+    def dispatch(self, reading):
+        """Queue a reading on every sink; safe to call from the serial read loop."""
+        for sink in self.sinks:
+            sink.offer(reading)
+
+    def stop(self, timeout=None):
+        """Drain and stop all sinks."""
+        for sink in self.sinks:
+            sink.stop(timeout)
+
+    def load(self):
+        """Fill level (0-1) of the fullest sink queue."""
+        return max((sink.queue_depth() / sink.queue_size for sink in self.sinks), default=0.0)
+
+    def stats(self):
+        return {sink.sink_name: sink.stats() for sink in self.sinks}
+
+def create_sinks(names):
+    """Build sinks from a comma-separated list: firebase, history, sqlite, webhook, metrics."""
+    sinks = []
+    for name in (part.strip() for part in names.split(',')):
+        if not name:
+            continue
+        if name == 'firebase':
+            sinks.append(FirebaseSink(
+                spool=ReadingSpool(os.getenv('SPOOL_PATH', SPOOL_CONFIG['path'])),
+                sampler=create_sampler(get_sampling_period()),
+                compressor=ReadingCompressor()
+            ))
+        elif name == 'history':
+            sinks.append(HistorySink(TimeSeriesStore(os.getenv('HISTORY_PATH', TIMESERIES_CONFIG['path']))))
+        elif name == 'sqlite':
+            sinks.append(SQLiteSink(os.getenv('SINK_SQLITE_PATH', SINK_CONFIG['sqlite_path'])))
+        elif name == 'webhook':
+            sinks.append(WebhookSink(os.getenv('SINK_WEBHOOK_URL', SINK_CONFIG['webhook_url'])))
+        elif name == 'metrics':
+            sinks.append(MetricsSink())
+        else:
+            raise ValueError(f"Unknown sink: {name}. Must be one of firebase, history, sqlite, webhook, metrics")
+    return sinks
@@ -0,0 +1,173 @@
+import json
+import sqlite3
+import threading
+import time
+from collections import deque
+from config import SPOOL_CONFIG
+from metrics import metric_firebase_dropped_total
+
+class MemoryQueue:
+    """Bounded in-memory queue of pending Firebase writes."""
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self._entries = deque()
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+    def append(self, data_type, path, data_packet):
+        """Queue a write, dropping the oldest one when full."""
+        with self._lock:
+            if len(self._entries) >= self.max_size:
+                self._entries.popleft()
+                metric_firebase_dropped_total.inc()
+            self._next_id += 1
+            self._entries.append((self._next_id, data_type, path, data_packet))
+
+    def peek(self, limit):
+        """Return up to limit of the oldest pending writes without removing them."""
+        with self._lock:
+            return [self._entries[i] for i in range(min(limit, len(self._entries)))]
+
+    def ack(self, entries):
+        """Remove writes that were delivered."""
+        if not entries:
+            return
+        last_id = entries[-1][0]
+        with self._lock:
+            while self._entries and self._entries[0][0] <= last_id:
+                self._entries.popleft()
+
+    def counts(self):
+        """Pending writes per (device_id, data_type)."""
+        counts = {}
+        with self._lock:
+            for _, data_type, _, data_packet in self._entries:
+                key = (data_packet.get('device_id', 'default'), data_type)
+                counts[key] = counts.get(key, 0) + 1
+        return counts
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+class ReadingSpool:
+    """Durable SQLite (WAL) spool of pending Firebase writes, keyed by database path."""
+
+    def __init__(self, path=SPOOL_CONFIG['path'], max_rows=SPOOL_CONFIG['max_rows'],
+                 max_age_days=SPOOL_CONFIG['max_age_days'], prune_every=SPOOL_CONFIG['prune_every']):
+        self.path = path
+        self.max_rows = max_rows
+        self.max_age_days = max_age_days
+        self.prune_every = prune_every
+        self._appends_since_prune = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        # FULL keeps committed readings across power loss, not just process crashes
+        self._conn.execute('PRAGMA synchronous=FULL')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS pending ('
+            ' id INTEGER PRIMARY KEY AUTOINCREMENT,'
+            ' path TEXT NOT NULL UNIQUE,'
+            ' data_type TEXT NOT NULL,'
+            ' packet TEXT NOT NULL,'
+            ' created_at REAL NOT NULL)'
+        )
+        self._count = self._conn.execute('SELECT COUNT(*) FROM pending').fetchone()[0]
+        # Pending writes per (device_id, data_type), kept up to date so counts() never scans the table
+        self._counts = self._tally('SELECT packet, data_type FROM pending')
+        if self._count:
+            print(f"Spool {path} has {self._count} readings waiting to be replayed")
+
+    def append(self, data_type, path, data_packet):
+        """Persist a write. Re-appending the same path is a no-op, so replays stay idempotent."""
+        with self._lock:
+            cursor = self._conn.execute(
+                'INSERT OR IGNORE INTO pending (path, data_type, packet, created_at) VALUES (?, ?, ?, ?)',
+                (path, data_type, json.dumps(data_packet), time.time())
+            )
+            self._count += cursor.rowcount
+            if cursor.rowcount:
+                key = (data_packet.get('device_id') or 'default', data_type)
+                self._counts[key] = self._counts.get(key, 0) + 1
+            self._appends_since_prune += 1
+            if self._appends_since_prune >= self.prune_every:
+                self._prune()
+
+    def peek(self, limit):
+        """Return up to limit of the oldest pending writes without removing them."""
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT id, data_type, path, packet FROM pending ORDER BY id LIMIT ?', (limit,)
+            ).fetchall()
+        return [(row_id, data_type, path, json.loads(packet)) for row_id, data_type, path, packet in rows]
+
+    def ack(self, entries):
+        """Delete writes that were delivered."""
+        if not entries:
+            return
+        with self._lock:
+            for row_id, data_type, _, data_packet in entries:
+                # Rows pruned since they were peeked are already gone and already uncounted
+                if self._conn.execute('DELETE FROM pending WHERE id = ?', (row_id,)).rowcount:
+                    self._count -= 1
+                    self._discount({(data_packet.get('device_id') or 'default', data_type): 1})
+
+    def _prune(self):
+        """Apply the retention policy. Caller must hold the lock."""
+        self._appends_since_prune = 0
+        cutoff = time.time() - self.max_age_days * 86400
+        self._discount(self._tally('SELECT packet, data_type FROM pending WHERE created_at < ?', (cutoff,)))
+        dropped = self._conn.execute('DELETE FROM pending WHERE created_at < ?', (cutoff,)).rowcount
+        overflow = self._count - dropped - self.max_rows
+        if overflow > 0:
+            oldest = 'SELECT packet, data_type FROM pending ORDER BY id LIMIT ?'
+            self._discount(self._tally(oldest, (overflow,)))
+            dropped += self._conn.execute(
+                'DELETE FROM pending WHERE id IN (SELECT id FROM pending ORDER BY id LIMIT ?)', (overflow,)
+            ).rowcount
+        if dropped:
+            self._count -= dropped
+            metric_firebase_dropped_total.inc(dropped)
+            print(f"Spool retention dropped {dropped} unsent readings")
+
+    def _tally(self, rows_sql, params=()):
+        """Writes per (device_id, data_type) among the rows a query selects. Caller must hold the lock."""
+        try:
+            rows = self._conn.execute(
+                f"SELECT json_extract(packet, '$.device_id'), data_type, COUNT(*) FROM ({rows_sql}) GROUP BY 1, 2",
+                params
+            ).fetchall()
+        except sqlite3.OperationalError:
+            # SQLite built without JSON support
+            rows = [(json.loads(packet).get('device_id'), data_type, 1)
+                    for packet, data_type in self._conn.execute(rows_sql, params)]
+        counts = {}
+        for device_id, data_type, count in rows:
+            key = (device_id or 'default', data_type)
+            counts[key] = counts.get(key, 0) + count
+        return counts
+
+    def _discount(self, removed):
+        """Take removed writes out of the running counts. Caller must hold the lock."""
+        for key, count in removed.items():
+            remaining = self._counts.get(key, 0) - count
+            if remaining > 0:
+                self._counts[key] = remaining
+            else:
+                self._counts.pop(key, None)
+
+    def counts(self):
+        """Pending writes per (device_id, data_type)."""
+        with self._lock:
+            return dict(self._counts)
+
+    def __len__(self):
+        with self._lock:
+            return self._count
+
+    def close(self):
+        """Close the underlying database."""
+        with self._lock:
+            self._conn.close()
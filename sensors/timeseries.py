@@ -0,0 +1,318 @@
+"""
+Embedded time-series store for sensor readings.
+
+Readings are appended to columnar chunk files (one float64 file per column,
+one directory per chunk) and rolled up into 1-minute, 1-hour and 1-day
+min/max/mean/count buckets as they arrive. Chunk directories are named by
+their start time, which serves as the time index; within a chunk timestamps
+are sorted, so range queries bisect instead of scanning.
+"""
+
+import math
+import os
+import shutil
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from config import TIMESERIES_CONFIG
+
+RAW_COLUMNS = ('timestamp', 'humidity', 'temperature_celsius')
+CHANNELS = ('humidity', 'temperature_celsius')
+ROLLUP_COLUMNS = ('timestamp', 'count') + tuple(
+    f"{channel}_{stat}" for channel in CHANNELS for stat in ('min', 'max', 'sum')
+)
+
+# (name, bucket seconds, chunk seconds); raw readings have no bucket
+LEVELS = (
+    ('raw', 0, 86400),
+    ('1m', 60, 7 * 86400),
+    ('1h', 3600, 366 * 86400),
+    ('1d', 86400, 3660 * 86400),
+)
+
+def _align(timestamp, seconds, offset):
+    """Start of the period of the given length containing timestamp, in local (offset) time."""
+    return math.floor((timestamp + offset) / seconds) * seconds - offset
+
+class ChunkedColumns:
+    """Append-only columnar storage split into fixed-length time chunks."""
+
+    def __init__(self, path, columns, chunk_seconds, offset):
+        self.path = path
+        self.columns = columns
+        self.chunk_seconds = chunk_seconds
+        self.offset = offset
+        os.makedirs(path, exist_ok=True)
+        self._chunks = sorted(int(name) for name in os.listdir(path) if name.lstrip('-').isdigit())
+        self._open_chunk = None
+        self._files = []
+
+    def _chunk_dir(self, chunk_start):
+        return os.path.join(self.path, str(chunk_start))
+
+    def append(self, row):
+        """Append one row; row[0] must be the timestamp."""
+        chunk_start = _align(row[0], self.chunk_seconds, self.offset)
+        if chunk_start != self._open_chunk:
+            self.close()
+            os.makedirs(self._chunk_dir(chunk_start), exist_ok=True)
+            self._files = [
+                open(os.path.join(self._chunk_dir(chunk_start), f"{column}.f64"), 'ab', buffering=0)
+                for column in self.columns
+            ]
+            self._open_chunk = chunk_start
+            if not self._chunks or self._chunks[-1] != chunk_start:
+                self._chunks.append(chunk_start)
+                self._chunks.sort()
+        for f, value in zip(self._files, row):
+            f.write(array('d', (value,)).tobytes())
+
+    def _load_chunk(self, chunk_start):
+        """Load every column of a chunk, trimmed to the shortest column after a torn write."""
+        data = {}
+        for column in self.columns:
+            values = array('d')
+            path = os.path.join(self._chunk_dir(chunk_start), f"{column}.f64")
+            try:
+                with open(path, 'rb') as f:
+                    values.frombytes(f.read())
+            except FileNotFoundError:
+                pass  # Not written yet, or pruned while being read
+            data[column] = values
+        length = min(len(values) for values in data.values())
+        return {column: values[:length] for column, values in data.items()}
+
+    def read(self, start, end, chunks=None):
+        """Return rows with start <= timestamp < end as a dict of column arrays.
+
+        chunks is a snapshot of the chunk list to read when called without the store lock.
+        """
+        result = {column: array('d') for column in self.columns}
+        for chunk_start in (self._chunks if chunks is None else chunks):
+            if chunk_start >= end or chunk_start + self.chunk_seconds <= start:
+                continue
+            data = self._load_chunk(chunk_start)
+            timestamps = data['timestamp']
+            lo = bisect_left(timestamps, start)
+            hi = bisect_left(timestamps, end)
+            for column in self.columns:
+                result[column].extend(data[column][lo:hi])
+        return result
+
+    def last_timestamp(self):
+        """Timestamp of the newest stored row, or None if empty."""
+        for chunk_start in reversed(self._chunks):
+            timestamps = self._load_chunk(chunk_start)['timestamp']
+            if timestamps:
+                return timestamps[-1]
+        return None
+
+    def prune(self, before):
+        """Delete chunks that end at or before the given timestamp."""
+        for chunk_start in [c for c in self._chunks if c + self.chunk_seconds <= before]:
+            if chunk_start == self._open_chunk:
+                continue
+            shutil.rmtree(self._chunk_dir(chunk_start), ignore_errors=True)
+            self._chunks.remove(chunk_start)
+
+    def close(self):
+        for f in self._files:
+            f.close()
+        self._files = []
+        self._open_chunk = None
+
+class _Bucket:
+    """Running min/max/sum/count of both channels over one rollup period."""
+
+    __slots__ = ('start', 'count', 'stats')
+
+    def __init__(self, start):
+        self.start = start
+        self.count = 0
+        self.stats = {channel: [math.inf, -math.inf, 0.0] for channel in CHANNELS}
+
+    def add(self, count, values):
+        """Merge count readings summarised as {channel: (min, max, sum)}."""
+        self.count += count
+        for channel, (low, high, total) in values.items():
+            stats = self.stats[channel]
+            stats[0] = min(stats[0], low)
+            stats[1] = max(stats[1], high)
+            stats[2] += total
+
+    def row(self):
+        values = [self.start, self.count]
+        for channel in CHANNELS:
+            values.extend(self.stats[channel])
+        return tuple(values)
+
+    def point(self):
+        point = {'timestamp': self.start, 'count': self.count}
+        for channel in CHANNELS:
+            low, high, total = self.stats[channel]
+            point[channel] = {'min': low, 'max': high, 'mean': total / self.count}
+        return point
+
+class DeviceSeries:
+    """Raw readings and rollups for a single device."""
+
+    def __init__(self, path, offset, retention_days):
+        self.offset = offset
+        self.retention_days = retention_days
+        self.levels = {
+            name: ChunkedColumns(
+                os.path.join(path, name),
+                RAW_COLUMNS if name == 'raw' else ROLLUP_COLUMNS,
+                chunk_seconds,
+                offset
+            )
+            for name, _, chunk_seconds in LEVELS
+        }
+        self.open_buckets = {}
+        self.last_timestamp = self.levels['raw'].last_timestamp()
+        self._recover()
+
+    def _recover(self):
+        """Rebuild rollups that were still open when the process last stopped."""
+        if self.last_timestamp is None:
+            return
+        closed = {name: self.levels[name].last_timestamp() for name, _, _ in LEVELS[1:]}
+        replay_from = min(
+            closed[name] + seconds if closed[name] is not None else -math.inf
+            for name, seconds, _ in LEVELS[1:]
+        )
+        raw = self.levels['raw'].read(replay_from, math.inf)
+        for timestamp, humidity, temperature in zip(*(raw[column] for column in RAW_COLUMNS)):
+            self._roll_up(timestamp, humidity, temperature, closed)
+
+    def _roll_up(self, timestamp, humidity, temperature, closed=None):
+        """Add a reading to each level's open bucket, persisting buckets that have closed.
+
+        While recovering, closed maps each level to its last persisted bucket
+        start so readings already rolled up are not counted twice.
+        """
+        for name, seconds, _ in LEVELS[1:]:
+            start = _align(timestamp, seconds, self.offset)
+            bucket = self.open_buckets.get(name)
+            if bucket is not None and bucket.start != start:
+                self.levels[name].append(bucket.row())
+                bucket = None
+            if bucket is None:
+                if closed and closed[name] is not None and start <= closed[name]:
+                    continue
+                bucket = self.open_buckets[name] = _Bucket(start)
+            bucket.add(1, {'humidity': (humidity, humidity, humidity),
+                           'temperature_celsius': (temperature, temperature, temperature)})
+
+    def append(self, timestamp, humidity, temperature):
+        """Store a reading; out-of-order readings are ignored to keep chunks sorted."""
+        if self.last_timestamp is not None and timestamp <= self.last_timestamp:
+            return False
+        previous_day = _align(self.last_timestamp, 86400, self.offset) if self.last_timestamp else None
+        self.levels['raw'].append((timestamp, humidity, temperature))
+        self._roll_up(timestamp, humidity, temperature)
+        self.last_timestamp = timestamp
+        if previous_day is not None and _align(timestamp, 86400, self.offset) != previous_day:
+            self._apply_retention(timestamp)
+        return True
+
+    def _apply_retention(self, now):
+        for name, days in self.retention_days.items():
+            if days is not None:
+                self.levels[name].prune(now - days * 86400)
+
+    def snapshot(self, level):
+        """The chunk list and open bucket of a level, for a query made without the store lock."""
+        open_bucket = self.open_buckets.get(level)
+        return list(self.levels[level]._chunks), open_bucket.row() if open_bucket is not None else None
+
+    def query(self, level, start, end, step, snapshot=None):
+        """Aggregate a level's rows between start and end into step-second buckets."""
+        chunks, open_row = snapshot if snapshot is not None else self.snapshot(level)
+        # Widen the range so the first bucket fully covers start
+        start = _align(start, step, self.offset)
+        # Rows from the open bucket's start on were written after the snapshot; the snapshot's row covers them
+        data = self.levels[level].read(start, end if open_row is None else min(end, open_row[0]), chunks)
+        buckets = {}
+
+        def bucket_for(timestamp):
+            bucket_start = _align(timestamp, step, self.offset)
+            bucket = buckets.get(bucket_start)
+            if bucket is None:
+                bucket = buckets[bucket_start] = _Bucket(bucket_start)
+            return bucket
+
+        if level == 'raw':
+            for timestamp, humidity, temperature in zip(*(data[column] for column in RAW_COLUMNS)):
+                bucket_for(timestamp).add(1, {'humidity': (humidity, humidity, humidity),
+                                              'temperature_celsius': (temperature, temperature, temperature)})
+        else:
+            rows = zip(*(data[column] for column in ROLLUP_COLUMNS))
+            if open_row is not None and start <= open_row[0] < end:
+                rows = list(rows) + [open_row]
+            for row in rows:
+                bucket_for(row[0]).add(int(row[1]), {
+                    'humidity': row[2:5],
+                    'temperature_celsius': row[5:8]
+                })
+
+        return [buckets[key].point() for key in sorted(buckets)]
+
+class TimeSeriesStore:
+    """Per-device time-series store with automatic rollups."""
+
+    def __init__(self, path=TIMESERIES_CONFIG['path'], offset=TIMESERIES_CONFIG['tz_offset'],
+                 retention_days=TIMESERIES_CONFIG['retention_days'],
+                 max_points=TIMESERIES_CONFIG['max_points']):
+        self.path = path
+        self.offset = offset
+        self.retention_days = retention_days
+        self.max_points = max_points
+        self._series = {}
+        self._lock = threading.Lock()
+        os.makedirs(path, exist_ok=True)
+
+    def _get_series(self, device_id):
+        series = self._series.get(device_id)
+        if series is None:
+            series = DeviceSeries(os.path.join(self.path, device_id), self.offset, self.retention_days)
+            self._series[device_id] = series
+        return series
+
+    def append(self, reading):
+        """Store a buffered reading dict from the ingestion daemon."""
+        with self._lock:
+            return self._get_series(reading.get('device_id', 'default')).append(
+                reading['timestamp'], reading['humidity'], reading['temperature_celsius']
+            )
+
+    def choose_step(self, start, end, step=None):
+        """Pick the step and the coarsest stored resolution that evenly divides it.
+
+        A requested step is raised to the smallest one returning at most max_points points.
+        """
+        min_step = max(1, math.ceil((end - start) / self.max_points))
+        if step is None or step < min_step:
+            step = min_step
+            for _, seconds, _ in reversed(LEVELS[1:]):
+                if step >= seconds:
+                    step = math.ceil(step / seconds) * seconds
+                    break
+        step = max(1, int(step))
+        for name, seconds, _ in reversed(LEVELS):
+            if seconds and step % seconds == 0:
+                return name, step
+        return 'raw', step
+
+    def query(self, device_id, start, end=None, step=None):
+        """Return (level, step, points) for readings of a device between start and end."""
+        end = end if end is not None else time.time()
+        level, step = self.choose_step(start, end, step)
+        with self._lock:
+            if device_id not in self._series and not os.path.isdir(os.path.join(self.path, device_id)):
+                return level, step, []
+            series = self._get_series(device_id)
+            snapshot = series.snapshot(level)
+        # Chunk files are append-only, so they are read without blocking appends
+        return level, step, series.query(level, start, end, step, snapshot)
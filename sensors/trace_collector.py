@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+"""
+Per-hop latency of traced readings, from serial read to alert notification.
+
+Packets built by create_data_packet carry a trace id and wall-clock hop
+times (epoch ms). The Cloud Function and ML service add their hops and the
+alert record in Firestore keeps the whole trace:
+
+    read -> packet -> upload -> rtdb_commit -> function_start
+         -> ml_received -> ml_responded -> decided -> notified / alert_logged
+
+The collector turns each trace into the latency of every hop (time since
+the previous hop present in the trace) and publishes them as Prometheus
+histograms, so the slowest hop of the time-to-alert is easy to find.
+
+Usage:
+    python trace_collector.py                      # Report on the last hour of alerts
+    python trace_collector.py --file traces.jsonl  # Report on exported traces or alert records
+    python trace_collector.py --serve              # Poll Firestore and serve /metrics on :9105
+"""
+
+import argparse
+import json
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from datetime import datetime, timezone
+from prometheus_client import start_http_server
+from config import TRACE_CONFIG
+from metrics import (
+    registry,
+    metric_trace_hop_seconds,
+    metric_trace_time_to_alert_seconds,
+    metric_trace_clock_skew_total,
+)
+
+HOPS = (
+    'read',            # Reading captured from the serial port
+    'packet',          # Sampled and turned into an upload packet
+    'upload',          # Firebase write issued
+    'rtdb_commit',     # Write committed by the Realtime Database (trigger event time)
+    'function_start',  # Cloud Function invoked
+    'ml_received',     # ML /alert request received
+    'ml_responded',    # ML /alert response ready
+    'decided',         # Alert decision known to the Cloud Function
+    'notified',        # FCM notification sent
+    'alert_logged',    # Alert record written to Firestore
+)
+
+# Hops that run in parallel with the hop before them, measured from the hop they follow
+_PARALLEL = {'alert_logged': 'decided'}
+
+def hop_latencies(hops):
+    """Seconds spent in each hop of a trace, keyed by the hop it ends at."""
+    latencies = {}
+    previous = None
+    for hop in HOPS:
+        if hop not in hops:
+            continue
+        start = _PARALLEL.get(hop, previous)
+        if start is not None and start in hops:
+            latencies[hop] = (hops[hop] - hops[start]) / 1000
+        previous = previous if hop in _PARALLEL else hop
+    return latencies
+
+def _percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+class TraceCollector:
+    """Aggregates hop latencies of traces, counting each trace id once."""
+
+    def __init__(self, samples=TRACE_CONFIG['samples']):
+        self.samples = samples
+        self.traces = 0
+        self._latencies = {hop: deque(maxlen=samples) for hop in HOPS + ('time_to_alert',)}
+        self._seen = OrderedDict()
+        self._lock = threading.Lock()
+
+    def add(self, trace):
+        """Record one trace (or an alert record holding one); returns False if skipped."""
+        if 'trace' in trace:
+            trace = trace['trace']
+        if not isinstance(trace, dict) or not trace.get('id') or not trace.get('hops'):
+            return False
+        hops = trace['hops']
+
+        with self._lock:
+            if trace['id'] in self._seen:
+                return False
+            self._seen[trace['id']] = True
+            if len(self._seen) > self.samples:
+                self._seen.popitem(last=False)
+            self.traces += 1
+
+            for hop, seconds in hop_latencies(hops).items():
+                if seconds < 0:
+                    # Hops on different machines; their clocks disagree by more than the hop took
+                    metric_trace_clock_skew_total.labels(hop=hop).inc()
+                    seconds = 0.0
+                metric_trace_hop_seconds.labels(hop=hop).observe(seconds)
+                self._latencies[hop].append(seconds)
+
+            if 'read' in hops and 'notified' in hops:
+                seconds = max((hops['notified'] - hops['read']) / 1000, 0.0)
+                metric_trace_time_to_alert_seconds.observe(seconds)
+                self._latencies['time_to_alert'].append(seconds)
+        return True
+
+    def report(self):
+        """Latency percentiles in milliseconds per hop, over the retained samples."""
+        with self._lock:
+            report = {}
+            for hop, values in self._latencies.items():
+                if values:
+                    report[hop] = {
+                        'count': len(values),
+                        'p50_ms': round(_percentile(values, 0.5) * 1000, 1),
+                        'p95_ms': round(_percentile(values, 0.95) * 1000, 1),
+                        'p99_ms': round(_percentile(values, 0.99) * 1000, 1),
+                        'max_ms': round(max(values) * 1000, 1),
+                    }
+            return report
+
+def load_file(collector, path):
+    """Add traces from a JSON Lines file of traces or alert records."""
+    added = 0
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if line and collector.add(json.loads(line)):
+                added += 1
+    return added
+
+def poll_firestore(collector, collection, since):
+    """Add traces of alert records created after since (a datetime); returns the newest createdAt."""
+    from firebase_admin import firestore
+
+    query = (firestore.client().collection(collection)
+             .where('createdAt', '>', since)
+             .order_by('createdAt'))
+    newest = since
+    for document in query.stream():
+        record = document.to_dict()
+        collector.add(record)
+        newest = max(newest, record.get('createdAt') or newest)
+    return newest
+
+def print_report(report):
+    if not report:
+        print("No traced readings found")
+        return
+    print(f"{'hop':>16} {'count':>7} {'p50 ms':>10} {'p95 ms':>10} {'p99 ms':>10} {'max ms':>10}")
+    for hop in HOPS + ('time_to_alert',):
+        if hop in report:
+            row = report[hop]
+            print(f"{hop:>16} {row['count']:>7} {row['p50_ms']:>10} {row['p95_ms']:>10} "
+                  f"{row['p99_ms']:>10} {row['max_ms']:>10}")
+
+def main():
+    parser = argparse.ArgumentParser(description='Per-hop latency of traced sensor readings.')
+    parser.add_argument('--file', help='JSON Lines file of traces or alert records instead of Firestore')
+    parser.add_argument('--collection', default=os.getenv('FS_ALERTS_COLLECTION', TRACE_CONFIG['alerts_collection']),
+                        help='Firestore collection of alert records')
+    parser.add_argument('--lookback', type=float, default=TRACE_CONFIG['lookback'],
+                        help='Seconds of alert records read on the first poll')
+    parser.add_argument('--serve', type=int, nargs='?', const=TRACE_CONFIG['metrics_port'],
+                        help=f"Keep polling and serve Prometheus metrics on this port (default {TRACE_CONFIG['metrics_port']})")
+    parser.add_argument('--interval', type=float, default=TRACE_CONFIG['poll_interval'],
+                        help='Seconds between polls when serving')
+    parser.add_argument('--json', action='store_true', help='Print the report as JSON')
+    args = parser.parse_args()
+
+    collector = TraceCollector()
+    if args.file:
+        load_file(collector, args.file)
+    else:
+        from firebase_utils import initialize_firebase
+        initialize_firebase()
+        since = datetime.fromtimestamp(time.time() - args.lookback, timezone.utc)
+        since = poll_firestore(collector, args.collection, since)
+
+        if args.serve:
+            start_http_server(args.serve, registry=registry)
+            print(f"Serving trace metrics on :{args.serve}/metrics, polling every {args.interval:g}s")
+            try:
+                while True:
+                    time.sleep(args.interval)
+                    try:
+                        since = poll_firestore(collector, args.collection, since)
+                    except Exception as e:
+                        print(f"Error polling alert records: {e}")
+            except KeyboardInterrupt:
+                print("Stopping trace collector...")
+
+    report = collector.report()
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
+
+if __name__ == "__main__":
+    main()
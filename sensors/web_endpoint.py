@@ -1,118 +1,140 @@
-from flask import Flask, jsonify, Response
-import serial
+from flask import Flask, jsonify, Response, request, stream_with_context
+import math
 import time
 import os
+import json
 import threading
-from firebase_utils import initialize_firebase, send_to_firebase, read_sensor_data_from_arduino
-from config import SERIAL_CONFIG, FLASK_CONFIG
-from prometheus_client import Gauge, Counter, CollectorRegistry, generate_latest, CONTENT_TYPE_LATEST
+from firebase_utils import initialize_firebase
+from firebase_writer import FirebaseBatchWriter
+from ingest_daemon import IngestDaemon, load_devices
+from broadcast import ReadingBroadcaster
+from timeseries import TimeSeriesStore
+from spool import ReadingSpool
+from sinks import SinkDispatcher, FirebaseSink, HistorySink, MetricsSink, create_sinks
+from config import FLASK_CONFIG, READER_CONFIG, SPOOL_CONFIG, STREAM_CONFIG, TIMESERIES_CONFIG
+from metrics import (
+    registry,
+    timed_lock,
+    metric_reads_total,
+    metric_read_errors_total,
+)
+from prometheus_client import generate_latest, CONTENT_TYPE_LATEST
 
 app = Flask(__name__)
 
-# Global Arduino connection
-arduino_connection = None
+# Multi-device ingestion daemon; each device has its own reading buffer
+ingest_daemon = None
 arduino_lock = threading.Lock()
 
-# Prometheus metrics registry and metrics
-registry = CollectorRegistry()
-metric_temperature_celsius = Gauge(
-    'sensor_temperature_celsius',
-    'Current sensor temperature in Celsius',
-    registry=registry,
-)
-metric_humidity_percent = Gauge(
-    'sensor_humidity_percent',
-    'Current sensor humidity in percent',
-    registry=registry,
-)
-metric_last_read_success_unix = Gauge(
-    'sensor_last_read_success_unix',
-    'Unix timestamp of last successful sensor read',
-    registry=registry,
-)
-metric_reads_total = Counter(
-    'sensor_reads_total',
-    'Total sensor read attempts',
-    registry=registry,
-)
-metric_read_errors_total = Counter(
-    'sensor_read_errors_total',
-    'Total sensor read errors',
-    registry=registry,
-)
-metric_firebase_writes_total = Counter(
-    'firebase_writes_total',
-    'Total Firebase write attempts by mode',
-    ['mode', 'status'],
-    registry=registry,
-)
+# Pushes every new reading to live stream subscribers
+broadcaster = ReadingBroadcaster()
+
+# Local history with rollups; opened when the daemon starts
+history_store = None
 
-# Sampling interval for background metric updates (seconds)
-METRICS_SAMPLE_INTERVAL = int(os.getenv('METRICS_SAMPLE_INTERVAL', '15'))
-_sampler_thread_started = False
+# History, metrics and any SENSOR_SINKS destinations, each fed on its own thread
+sink_dispatcher = None
+
+# Spooled Firebase writer for on-demand uploads (shared with the firebase sink when configured)
+firebase_writer = None
+
+def _record_serial_line(device_id, humidity, temperature, error):
+    """Count every line parsed by the ingestion daemon."""
+    metric_reads_total.labels(device=device_id).inc()
+    if error or humidity is None or temperature is None:
+        metric_read_errors_total.labels(device=device_id).inc()
+
+def _on_reading(reading):
+    """Fan a new reading out to stream subscribers and the sinks."""
+    broadcaster.publish(reading)
+    sink_dispatcher.dispatch(reading)
 
 def init_arduino():
-    """Initialize Arduino connection."""
-    global arduino_connection
+    """Start the ingestion daemon for all configured devices."""
+    global ingest_daemon, history_store, sink_dispatcher, firebase_writer
     
-    if arduino_connection is None:
-        try:
-            serial_port = os.getenv('SERIAL_PORT', SERIAL_CONFIG['port'])
-            baud_rate = int(os.getenv('BAUD_RATE', SERIAL_CONFIG['baud_rate']))
+    with timed_lock(arduino_lock, 'arduino_lock', mode='on_demand'):
+        if ingest_daemon is None:
+            try:
+                devices = load_devices()
+                extra_sinks = create_sinks(os.getenv('SENSOR_SINKS', ''))
+            except Exception as e:
+                print(f"Invalid device or sink configuration: {e}")
+                return False
+            
+            # One writer per spool file, so a reading is never replayed by two flushers
+            firebase_writer = next((sink.writer for sink in extra_sinks if isinstance(sink, FirebaseSink)), None)
+            if firebase_writer is None:
+                firebase_writer = FirebaseBatchWriter(spool=ReadingSpool(os.getenv('SPOOL_PATH', SPOOL_CONFIG['path'])))
+                firebase_writer.start()
             
-            arduino_connection = serial.Serial(
-                serial_port, 
-                baud_rate, 
-                timeout=SERIAL_CONFIG['timeout']
+            history_store = TimeSeriesStore(os.getenv('HISTORY_PATH', TIMESERIES_CONFIG['path']))
+            sink_dispatcher = SinkDispatcher([HistorySink(history_store), MetricsSink()] + extra_sinks)
+            sink_dispatcher.start()
+            ingest_daemon = IngestDaemon(
+                devices,
+                on_reading=_on_reading,
+                on_line=_record_serial_line,
+                mode='on_demand'
             )
-            time.sleep(2)  # Wait for connection to establish
-            print(f"Arduino connected on {serial_port} at {baud_rate} baud")
-            return True
-        except Exception as e:
-            print(f"Failed to connect to Arduino: {e}")
-            return False
+            ingest_daemon.start_in_thread()
+            print(f"Ingesting {len(devices)} device(s): {', '.join(ingest_daemon.device_ids)}")
     return True
 
-def read_sensor_data():
-    """Read current sensor data from Arduino."""
-    global arduino_connection
+def _resolve_device(device_id=None):
+    """Return the requested device id, defaulting to the first configured device."""
+    if ingest_daemon is None:
+        return None
+    if device_id is None:
+        return ingest_daemon.device_ids[0]
+    return device_id if device_id in ingest_daemon.buffers else None
+
+def read_sensor_data(device_id=None):
+    """Return the latest buffered reading of a device as (reading, error)."""
+    device_id = _resolve_device(device_id)
+    if device_id is None:
+        return None, "Unknown device" if ingest_daemon is not None else "Ingestion daemon not started"
     
-    with arduino_lock:
-        if not init_arduino():
-            return None, None, "Arduino connection failed"
-        
-        return read_sensor_data_from_arduino(arduino_connection)
+    reading = ingest_daemon.buffers[device_id].latest(max_age=READER_CONFIG['stale_after'])
+    if reading is not None:
+        return reading, None
+    
+    error = ingest_daemon.ingestors[device_id].last_error
+    return None, error or "No recent sensor data available"
 
-def _update_metrics_from_read(humidity, temperature, error):
-    """Update Prometheus metrics based on a sensor read result."""
-    metric_reads_total.inc()
-    if error or humidity is None or temperature is None:
-        metric_read_errors_total.inc()
-        return
-    try:
-        metric_humidity_percent.set(float(humidity))
-        metric_temperature_celsius.set(float(temperature))
-        metric_last_read_success_unix.set(time.time())
-    except Exception:
-        # Avoid raising inside metrics update path
-        pass
-
-def _metrics_sampler_loop():
-    """Background loop that periodically reads from the sensor and updates metrics."""
-    while True:
-        try:
-            humidity, temperature, error = read_sensor_data()
-            _update_metrics_from_read(humidity, temperature, error)
-        except Exception:
-            metric_read_errors_total.inc()
-        time.sleep(METRICS_SAMPLE_INTERVAL)
+def _reading_json(reading):
+    """Serialize a buffered reading for API responses."""
+    return {
+        'device_id': reading['device_id'],
+        'humidity': reading['humidity'],
+        'temperature_celsius': reading['temperature_celsius'],
+        'timestamp': reading['timestamp']
+    }
+
+@app.route('/sensor/devices', methods=['GET'])
+def list_devices():
+    """List configured devices with their connection state and latest reading."""
+    devices = []
+    for device_id, ingestor in (ingest_daemon.ingestors.items() if ingest_daemon else []):
+        latest = ingest_daemon.buffers[device_id].latest()
+        devices.append({
+            'device_id': device_id,
+            'port': ingestor.port,
+            'connected': ingestor.connected,
+            'last_error': ingestor.last_error,
+            'latest': _reading_json(latest) if latest else None
+        })
+    return jsonify({
+        'success': True,
+        'devices': devices,
+        'timestamp': time.time()
+    })
 
 @app.route('/sensor/current', methods=['GET'])
 def get_current_sensor_data():
-    """Get current sensor readings."""
+    """Get current sensor readings, optionally for ?device=<id>."""
     try:
-        humidity, temperature, error = read_sensor_data()
-        _update_metrics_from_read(humidity, temperature, error)
+        reading, error = read_sensor_data(request.args.get('device'))
         
         if error:
             return jsonify({
@@ -123,11 +145,7 @@ def get_current_sensor_data():
         
         return jsonify({
             'success': True,
-            'data': {
-                'humidity': humidity,
-                'temperature_celsius': temperature,
-                'timestamp': time.time()
-            }
+            'data': _reading_json(reading)
         })
         
     except Exception as e:
@@ -137,12 +155,94 @@ def get_current_sensor_data():
             'timestamp': time.time()
         }), 500
 
+@app.route('/sensor/stream', methods=['GET'])
+def stream_sensor_data():
+    """Push each new reading as Server-Sent Events, optionally for ?device=<id>."""
+    device_id = request.args.get('device')
+    if device_id is not None and _resolve_device(device_id) is None:
+        return jsonify({
+            'success': False,
+            'error': 'Unknown device',
+            'timestamp': time.time()
+        }), 404
+    
+    subscriber = broadcaster.subscribe(device_id)
+    if subscriber is None:
+        return jsonify({
+            'success': False,
+            'error': 'Too many stream clients',
+            'timestamp': time.time()
+        }), 503
+    
+    def events():
+        try:
+            yield f"retry: {STREAM_CONFIG['heartbeat'] * 1000}\n\n"
+            while True:
+                reading = subscriber.get(timeout=STREAM_CONFIG['heartbeat'])
+                if subscriber.evicted:
+                    yield "event: evicted\ndata: {\"error\": \"Client fell behind and was disconnected\"}\n\n"
+                    return
+                if reading is None:
+                    yield ": keep-alive\n\n"
+                    continue
+                yield f"id: {reading['seq']}\nevent: reading\ndata: {json.dumps(_reading_json(reading))}\n\n"
+        finally:
+            broadcaster.unsubscribe(subscriber)
+    
+    return Response(
+        stream_with_context(events()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+@app.route('/sensor/history', methods=['GET'])
+def get_sensor_history():
+    """Query stored readings: ?from=<unix>&to=<unix>&step=<seconds>&device=<id>."""
+    device_id = _resolve_device(request.args.get('device'))
+    if device_id is None or history_store is None:
+        return jsonify({
+            'success': False,
+            'error': 'Unknown device',
+            'timestamp': time.time()
+        }), 404
+    
+    try:
+        end = float(request.args.get('to', time.time()))
+        start = float(request.args.get('from', end - 3600))
+        step = request.args.get('step')
+        step = int(step) if step is not None else None
+        if not (math.isfinite(start) and math.isfinite(end)):
+            raise ValueError("float() accepts 'nan' and 'inf', which the store cannot bucket")
+    except ValueError:
+        return jsonify({
+            'success': False,
+            'error': "'from' and 'to' must be unix timestamps and 'step' whole seconds",
+            'timestamp': time.time()
+        }), 400
+    
+    if start >= end or (step is not None and step <= 0):
+        return jsonify({
+            'success': False,
+            'error': "'from' must be before 'to' and 'step' must be positive",
+            'timestamp': time.time()
+        }), 400
+    
+    resolution, step, points = history_store.query(device_id, start, end, step)
+    return jsonify({
+        'success': True,
+        'device_id': device_id,
+        'from': start,
+        'to': end,
+        'step': step,
+        'resolution': resolution,
+        'points': points
+    })
+
 @app.route('/sensor/send-to-firebase', methods=['POST'])
 def send_current_data_to_firebase():
-    """Get current sensor readings and send to Firebase."""
+    """Get current sensor readings, optionally for ?device=<id>, and spool them for Firebase."""
     try:
-        humidity, temperature, error = read_sensor_data()
-        _update_metrics_from_read(humidity, temperature, error)
+        reading, error = read_sensor_data(request.args.get('device'))
         
         if error:
             return jsonify({
@@ -151,30 +251,16 @@ def send_current_data_to_firebase():
                 'timestamp': time.time()
             }), 500
         
-        # Send to Firebase
-        success = send_to_firebase('on_demand', humidity, temperature)
-        metric_firebase_writes_total.labels(mode='on_demand', status='success' if success else 'failure').inc()
+        # Spooled first, so the reading survives an offline gateway; the writer uploads and counts it
+        firebase_writer.enqueue('on_demand', reading['humidity'], reading['temperature_celsius'],
+                                reading['device_id'], reading['timestamp'])
         
-        if success:
-            return jsonify({
-                'success': True,
-                'message': 'Data sent to Firebase successfully',
-                'data': {
-                    'humidity': humidity,
-                    'temperature_celsius': temperature,
-                    'timestamp': time.time()
-                }
-            })
-        else:
-            return jsonify({
-                'success': False,
-                'error': 'Failed to send data to Firebase',
-                'data': {
-                    'humidity': humidity,
-                    'temperature_celsius': temperature,
-                    'timestamp': time.time()
-                }
-            }), 500
+        return jsonify({
+            'success': True,
+            'message': 'Data queued for Firebase',
+            'data': _reading_json(reading),
+            'pending': firebase_writer.queue_depth()
+        })
             
     except Exception as e:
         return jsonify({
@@ -194,6 +280,7 @@ def health_check():
     return jsonify({
         'status': 'healthy',
         'service': 'sensor-web-endpoint',
+        'sinks': sink_dispatcher.stats() if sink_dispatcher else {},
         'timestamp': time.time()
     })
 
@@ -203,13 +290,19 @@ def home():
     return jsonify({
         'service': 'IoT Sensor Web Endpoint',
         'endpoints': {
-            'GET /sensor/current': 'Get current sensor readings',
-            'POST /sensor/send-to-firebase': 'Get current readings and send to Firebase',
+            'GET /sensor/current': 'Get current sensor readings (?device=<id>)',
+            'GET /sensor/devices': 'List devices with connection state and latest reading',
+            'GET /sensor/stream': 'Server-Sent Events stream of new readings (?device=<id>)',
+            'GET /sensor/history': 'Aggregated history (?from=<unix>&to=<unix>&step=<seconds>&device=<id>)',
+            'POST /sensor/send-to-firebase': 'Get current readings and send to Firebase (?device=<id>)',
             'GET /health': 'Health check',
             'GET /': 'This documentation'
         },
         'usage': {
             'get_current_data': 'curl http://localhost:5001/sensor/current',
+            'get_device_data': 'curl http://localhost:5001/sensor/current?device=well-1',
+            'stream_readings': 'curl -N http://localhost:5001/sensor/stream',
+            'get_history': 'curl "http://localhost:5001/sensor/history?from=1735689600&step=3600"',
             'send_to_firebase': 'curl -X POST http://localhost:5001/sensor/send-to-firebase'
         }
     })
@@ -226,20 +319,17 @@ def main():
         print(f"Firebase initialization failed: {e}")
         return
     
-    # Initialize Arduino connection
+    # Start ingesting all configured devices
     if not init_arduino():
-        print("Failed to initialize Arduino connection")
+        print("Failed to start the ingestion daemon")
         return
     
-    global _sampler_thread_started
-    if not _sampler_thread_started:
-        sampler_thread = threading.Thread(target=_metrics_sampler_loop, daemon=True)
-        sampler_thread.start()
-        _sampler_thread_started = True
-    
     print(f"Starting web server on {FLASK_CONFIG['host']}:{FLASK_CONFIG['port']}")
     print("Available endpoints:")
     print("  GET  /sensor/current - Get current sensor readings")
+    print("  GET  /sensor/devices - List devices and their latest readings")
+    print("  GET  /sensor/stream - Live Server-Sent Events stream of readings")
+    print("  GET  /sensor/history - Aggregated reading history")
     print("  POST /sensor/send-to-firebase - Send current readings to Firebase")
     print("  GET  /metrics - Prometheus metrics endpoint")
     print("  GET  /health - Health check")
@@ -248,7 +338,8 @@ def main():
     app.run(
         host=FLASK_CONFIG['host'],
         port=FLASK_CONFIG['port'],
-        debug=FLASK_CONFIG['debug']
+        debug=FLASK_CONFIG['debug'],
+        threaded=True  # Each live stream holds a worker thread
     )
 
 if __name__ == "__main__":